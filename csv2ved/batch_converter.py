@@ -0,0 +1,154 @@
+import itertools
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# the column types parsed by NumPy, whose string casts accept the same values as int() and float()
+NUMPY_DTYPES = {
+    'integer': 'int64',
+    'float': 'float64'
+}
+
+# integers up to 2 ** 53 are always equal to their float value, larger ones are checked one by one
+MAX_EXACT_INTEGER = 2 ** 53
+
+# the block size that converts fastest, larger blocks are converted in slices of this many rows since the columns
+# of more rows take more memory without converting any faster
+BATCH_SIZE = 1024
+
+# marks the values that the column's converter rejects
+INVALID = object()
+
+
+def numpy_available():
+    return numpy is not None
+
+
+def read_blocks(csv_lines, batch_size, current_line=0):
+    """
+    Groups csv lines into blocks of up to batch_size lines.
+    Yields the line numbers and rows of the non empty lines in each block, and the number of the last line read.
+    """
+    while True:
+        line_numbers = []
+        rows = []
+        number_of_lines = 0
+        for line in itertools.islice(csv_lines, batch_size):
+            number_of_lines += 1
+            current_line += 1
+            if line != []:
+                line_numbers.append(current_line)
+                rows.append(line)
+        if number_of_lines == 0:
+            return
+        yield line_numbers, rows, current_line
+
+
+def _parse_numbers(values, csv_type):
+    """Parses a column of integers or floats with NumPy, or returns None if any value needs the column's converter"""
+    try:
+        numbers = numpy.array(values, dtype=NUMPY_DTYPES[csv_type])
+    except (ValueError, OverflowError):
+        return None
+    if csv_type == 'integer':
+        exact = (numbers >= -MAX_EXACT_INTEGER) & (numbers <= MAX_EXACT_INTEGER)
+    else:
+        # NaN and Infinity are encoded differently, see record_encoder._encode_float
+        exact = numpy.isfinite(numbers)
+    return numbers.tolist() if exact.all() else None
+
+
+class BatchConverter(object):
+    """
+    Converts blocks of rows one column at a time with a conversion plan. Integer and float columns are
+    parsed by NumPy in a single call, the values of the other columns and of numeric columns that NumPy
+    can't parse use the plan's converters, once per distinct value when a column repeats its values.
+    When the plan's encoder encodes fragments, the encoded key and value of each cell are built a column
+    at a time too, and each row only joins them.
+
+    Rows with any invalid value are converted again one at a time by the plan, so they report the same
+    error as the per-row path.
+    """
+
+    def __init__(self, conversion_plan):
+        self.plan = conversion_plan
+        self.encoder = conversion_plan.encoder
+        self.encodes_fragments = self.encoder.encodes_fragments()
+
+    def _value_converter(self, index):
+        # converts a value of the column at index, or its fragment, with INVALID for the values it rejects
+        converter = self.plan.columns[index][1]
+        encode = self.encoder.fragment if self.encodes_fragments else None
+
+        def convert(value):
+            try:
+                converted = converter(value)
+            except ValueError:
+                return INVALID
+            return encode(index, converted) if encode else converted
+        return convert
+
+    def _convert_values(self, index, values):
+        # converts the non empty values of the column at index, or their fragments
+        csv_type = self.plan.types[index]
+        numbers = _parse_numbers(values, csv_type) if csv_type in NUMPY_DTYPES else None
+        if numbers is not None:
+            return self.encoder.fragments(index, numbers) if self.encodes_fragments else numbers
+
+        convert = self._value_converter(index)
+        distinct = dict.fromkeys(values)
+        if len(distinct) * 2 > len(values):
+            return list(map(convert, values))
+        for value in distinct:
+            distinct[value] = convert(value)
+        return list(map(distinct.__getitem__, values))
+
+    def _convert_column(self, index, column, bad_rows):
+        # returns the converted values or fragments of a column, None for the empty values
+        empty_error = self.plan.columns[index][2]
+        if '' not in column:
+            converted = self._convert_values(index, column)
+        else:
+            positions = [position for position, value in enumerate(column) if value != '']
+            if empty_error:
+                bad_rows.update(set(range(len(column))).difference(positions))
+            converted = [None] * len(column)
+            for position, value in zip(positions, self._convert_values(index, [column[position]
+                                                                               for position in positions])):
+                converted[position] = value
+        if INVALID in converted:
+            bad_rows.update(position for position, value in enumerate(converted) if value is INVALID)
+        return converted
+
+    def _convert_slice(self, rows):
+        width = self.plan.width
+        positions = [position for position, row in enumerate(rows) if len(row) == width]
+        block = [rows[position] for position in positions]
+        bad_rows = set()
+        columns = [self._convert_column(index, column, bad_rows) for index, column in enumerate(zip(*block))]
+        has_empty_values = any(None in column for column in columns)
+
+        results = [None] * len(rows)
+        member_id_index = self.plan.member_id_index
+        id_prefix = self.plan.id_prefix
+        for block_position, (position, converted) in enumerate(zip(positions, zip(*columns))):
+            if block_position in bad_rows:
+                continue
+            member_id = rows[position][member_id_index]
+            if not self.encodes_fragments:
+                results[position] = self.plan.encode(member_id, converted), ""
+                continue
+            if has_empty_values:
+                converted = [fragment for fragment in converted if fragment is not None]
+            results[position] = self.encoder.encode_fragments(id_prefix + member_id, converted), ""
+
+        return [result or self.plan.make_json(row) for result, row in zip(results, rows)]
+
+    def convert_block(self, rows):
+        """Returns a (json_line, error) tuple for each row, like ConversionPlan.make_json"""
+        if len(rows) <= BATCH_SIZE:
+            return self._convert_slice(rows)
+        return list(itertools.chain.from_iterable(self._convert_slice(rows[start:start + BATCH_SIZE])
+                                                  for start in range(0, len(rows), BATCH_SIZE)))
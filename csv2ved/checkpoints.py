@@ -0,0 +1,77 @@
+import json
+import os
+
+CHECKPOINT_EXTENSION = '.checkpoint'
+CHECKPOINT_VERSION = 1
+DEFAULT_CHECKPOINT_INTERVAL = 64 * 1024 * 1024
+
+
+def checkpoint_file_for(data_file_name):
+    """Returns the checkpoint file of a data file, data.csv is checkpointed to data.checkpoint"""
+    return os.path.splitext(data_file_name)[0] + CHECKPOINT_EXTENSION
+
+
+def checkpoint_settings(data_file_name, csv_types, company_id, compact, raw_json=False):
+    """Returns what a checkpoint is only valid for: the data file as it was, the types and the output options"""
+    data_file_stat = os.stat(data_file_name)
+    return {
+        'version': CHECKPOINT_VERSION,
+        'data_file': os.path.abspath(data_file_name),
+        'data_size': data_file_stat.st_size,
+        'data_mtime_ns': data_file_stat.st_mtime_ns,
+        'csv_types': [[name, csv_type] for name, csv_type in csv_types.items()],
+        'company_id': company_id,
+        'compact': compact,
+        'raw_json': raw_json
+    }
+
+
+def new_checkpoint(settings, output_file_name):
+    """Returns the checkpoint of a conversion that hasn't converted any record yet"""
+    checkpoint = dict(settings)
+    checkpoint.update({
+        'output_file': output_file_name,
+        'input_offset': None,
+        'line': 1,
+        'output_size': 0,
+        'written_lines': 0,
+        'errors': []
+    })
+    return checkpoint
+
+
+def load_checkpoint(checkpoint_file_name, settings):
+    """
+    Returns (checkpoint, error). The checkpoint is None without error if there's no checkpoint file, a
+    checkpoint written for other settings or whose output file is gone can't be resumed and is an error.
+    """
+    try:
+        with open(checkpoint_file_name) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+    except FileNotFoundError:
+        return None, ""
+    except (OSError, ValueError) as err:
+        return None, "Checkpoint {} can't be read: {}".format(checkpoint_file_name, err)
+
+    if not isinstance(checkpoint, dict) or any(checkpoint.get(key) != value for key, value in settings.items()):
+        return None, "Checkpoint {} was written for a different data file, type file or options".format(
+            checkpoint_file_name)
+    output_file_name = checkpoint['output_file']
+    if not os.path.isfile(output_file_name) or os.path.getsize(output_file_name) < checkpoint['output_size']:
+        return None, "Output file {} of checkpoint {} is missing or truncated".format(output_file_name,
+                                                                                      checkpoint_file_name)
+    return checkpoint, ""
+
+
+def save_checkpoint(checkpoint_file_name, checkpoint):
+    # replaced in one step, an interrupted save leaves the previous checkpoint
+    with open(checkpoint_file_name + '.tmp', 'w') as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(checkpoint_file_name + '.tmp', checkpoint_file_name)
+
+
+def remove_checkpoint(checkpoint_file_name):
+    if os.path.exists(checkpoint_file_name):
+        os.remove(checkpoint_file_name)
@@ -0,0 +1,104 @@
+import bz2
+import gzip
+import io
+import lzma
+import os
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_CODEC = 'gzip'
+BZIP2_CODEC = 'bzip2'
+XZ_CODEC = 'xz'
+ZSTD_CODEC = 'zstd'
+
+# the codec of a compressed data file is told by its first bytes, whatever its extension
+MAGIC_BYTES = [
+    (GZIP_CODEC, b'\x1f\x8b'),
+    (BZIP2_CODEC, b'BZh'),
+    (XZ_CODEC, b'\xfd7zXZ\x00'),
+    (ZSTD_CODEC, b'\x28\xb5\x2f\xfd'),
+]
+MAGIC_LENGTH = max(len(magic) for _, magic in MAGIC_BYTES)
+COMPRESSED_EXTENSIONS = ['.gz', '.bz2', '.xz', '.zst']
+
+READ_BUFFER_SIZE = 1024 * 1024
+
+DECOMPRESSION_ERRORS = (OSError, EOFError, lzma.LZMAError, zlib.error)
+if zstandard is not None:
+    DECOMPRESSION_ERRORS += (zstandard.ZstdError,)
+
+
+def detect_codec(file_name):
+    """Returns the codec a regular file is compressed with, or None if it isn't compressed"""
+    if not isinstance(file_name, str) or not os.path.isfile(file_name):
+        return None
+    with open(file_name, 'rb') as data_file:
+        head = data_file.read(MAGIC_LENGTH)
+    for codec, magic in MAGIC_BYTES:
+        if head.startswith(magic):
+            return codec
+    return None
+
+
+def strip_extension(file_name):
+    """Returns the file name without its compression extension, data.csv.gz is data.csv"""
+    name, extension = os.path.splitext(file_name)
+    return name if extension.lower() in COMPRESSED_EXTENSIONS else file_name
+
+
+def _open_compressed(file_name, codec):
+    if codec == GZIP_CODEC:
+        return gzip.open(file_name, 'rb')
+    if codec == BZIP2_CODEC:
+        return bz2.open(file_name, 'rb')
+    if codec == XZ_CODEC:
+        return lzma.open(file_name, 'rb')
+    if zstandard is None:
+        raise OSError('{} is zstd compressed, reading it needs the zstandard package'.format(file_name))
+    return zstandard.ZstdDecompressor().stream_reader(open(file_name, 'rb'), read_size=READ_BUFFER_SIZE)
+
+
+class DecompressedFile(io.RawIOBase):
+    """
+    The decompressed bytes of a compressed file, named after the compressed file. Errors in the compressed
+    data are raised as OSError with the name of the file.
+    """
+
+    def __init__(self, file_name, codec):
+        super().__init__()
+        self.name = file_name
+        self.codec = codec
+        self._compressed_file = _open_compressed(file_name, codec)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        try:
+            return self._compressed_file.readinto(buffer)
+        except DECOMPRESSION_ERRORS as err:
+            raise OSError('{} is not a valid {} file: {}'.format(self.name, self.codec, err))
+
+    def fileno(self):
+        return self._compressed_file.fileno()
+
+    def close(self):
+        if not self.closed:
+            self._compressed_file.close()
+        super().close()
+
+
+def open_data_file(file_name, encoding=None):
+    """
+    Opens a data file for reading as text. A compressed file is decompressed as it is read, through a
+    READ_BUFFER_SIZE buffer, and keeps its name.
+    """
+    codec = detect_codec(file_name)
+    if codec is None:
+        return open(file_name, encoding=encoding)
+    return io.TextIOWrapper(io.BufferedReader(DecompressedFile(file_name, codec), READ_BUFFER_SIZE),
+                            encoding=encoding)
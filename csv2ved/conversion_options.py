@@ -0,0 +1,127 @@
+import collections
+
+from csv2ved import batch_converter
+from csv2ved import duplicates
+from csv2ved import jpl2vad_converter
+
+# the settings of a conversion and their defaults, checkpoint_interval is in bytes and shard_size in MB
+DEFAULTS = collections.OrderedDict([
+    ('workers', 1),
+    ('batch_size', 0),
+    ('compact', False),
+    ('raw_json', False),
+    ('pipelined', False),
+    ('validate_only', False),
+    ('checkpoint_interval', 0),
+    ('resume', False),
+    ('compression', jpl2vad_converter.DEFAULT_CODEC),
+    ('stream', False),
+    ('duplicates', duplicates.ALLOW),
+    ('delta_manifest', None),
+    ('tombstones', False),
+    ('rejects_file', None),
+    ('error_summary', False),
+    ('shard_rows', 0),
+    ('shard_size', 0),
+    ('multiple_files', False),
+    ('profiled', False),
+])
+
+# an option, or any of a tuple of options, that can't be used with any of the others, and the error
+CONFLICTS = [
+    ('stream', 'auto_compression', "--compression auto samples the .jpl file and can't be used with --stream"),
+    ('multiple_files', 'profiled', '--profile, --metrics-file and --profile-file need a single --data-file'),
+    ('checkpoints', ('multiple_files', 'stream'),
+     "--checkpoint-interval and --resume need a single --data-file and can't be used with --stream"),
+    ('delta_manifest', ('multiple_files', 'stream', 'checkpoints'),
+     "--delta-manifest needs a single --data-file and can't be used with --stream, --checkpoint-interval or "
+     "--resume"),
+    ('checks_duplicates', 'checkpoints', "--duplicates can't be used with --checkpoint-interval or --resume"),
+    ('keeps_one_duplicate', ('stream', 'delta_manifest'),
+     "--duplicates {duplicates} can't be used with --stream or --delta-manifest"),
+    ('rejects', ('multiple_files', 'checkpoints'),
+     "--rejects-file and --error-summary need a single --data-file and can't be used with --checkpoint-interval "
+     "or --resume"),
+    ('rejects', ('parallel', 'batch_size'),
+     "--rejects-file and --error-summary convert the rows one at a time and can't be used with --workers or "
+     "--batch-size"),
+    ('validate_only', ('delta_manifest', 'checkpoints'),
+     "--validate-only can't be used with --delta-manifest, --checkpoint-interval or --resume"),
+    ('pipelined', ('parallel', 'rejects', 'checkpoints'),
+     "--pipeline can't be used with --workers, --rejects-file, --error-summary, --checkpoint-interval or --resume"),
+    ('shard_rows', 'shard_size', "--shard-rows and --shard-size can't be used together"),
+    ('shards', ('multiple_files', 'stream'),
+     "--shard-rows and --shard-size need a single --data-file and can't be used with --stream"),
+]
+
+# an option and what it needs, another option or a function that tells whether a package is installed
+REQUIREMENTS = [
+    ('batch_size', lambda: batch_converter.numpy_available(),
+     '--batch-size requires NumPy, install it or convert line by line'),
+    ('zstd_compression', lambda: jpl2vad_converter.zstd_available(),
+     '--compression zstd requires the zstandard package'),
+    ('tombstones', 'delta_manifest', '--tombstones needs --delta-manifest'),
+    ('delta_manifest', lambda: batch_converter.numpy_available(), '--delta-manifest requires NumPy'),
+    ('checks_duplicates', lambda: duplicates.numpy_available(), '--duplicates requires NumPy'),
+]
+
+
+def _names(names):
+    return names if isinstance(names, tuple) else (names,)
+
+
+class ConversionOptions(collections.namedtuple('ConversionOptions', list(DEFAULTS), defaults=DEFAULTS.values())):
+    """
+    The settings of a conversion, passed as a whole to the functions that convert a data file. validate
+    checks once which options can't be used together, so the conversion paths don't have to.
+    """
+
+    __slots__ = ()
+
+    @property
+    def checkpoints(self):
+        return bool(self.checkpoint_interval or self.resume)
+
+    @property
+    def rejects(self):
+        return bool(self.rejects_file or self.error_summary)
+
+    @property
+    def shards(self):
+        return bool(self.shard_rows or self.shard_size)
+
+    @property
+    def parallel(self):
+        return self.workers > 1
+
+    @property
+    def checks_duplicates(self):
+        return self.duplicates != duplicates.ALLOW
+
+    @property
+    def keeps_one_duplicate(self):
+        return self.duplicates in (duplicates.KEEP_FIRST, duplicates.KEEP_LAST)
+
+    @property
+    def auto_compression(self):
+        return self.compression == jpl2vad_converter.AUTO_CODEC
+
+    @property
+    def zstd_compression(self):
+        return self.compression == jpl2vad_converter.ZSTD_CODEC
+
+    def _is_set(self, names):
+        return any(getattr(self, name) for name in _names(names))
+
+    def validate(self):
+        """Returns the error of the first option that can't be used as set, or an empty string"""
+        for name, required, error in REQUIREMENTS:
+            if self._is_set(name) and not (required() if callable(required) else self._is_set(required)):
+                return error
+        for names, conflicting_names, error in CONFLICTS:
+            if self._is_set(names) and self._is_set(conflicting_names):
+                return error.format(**self._asdict())
+        return ""
+
+
+DEFAULT_OPTIONS = ConversionOptions()
@@ -0,0 +1,199 @@
+import json
+import re
+
+from csv2ved import date_parser
+from csv2ved import fragment_cache
+from csv2ved.fragment_cache import FragmentCache
+from csv2ved.csv2json_type_converter import ConvertCsvDataToJson
+from csv2ved.record_encoder import IdOnlyEncoder, RecordEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# JSON strings can't have raw tabs or line breaks, so they are only whitespace between the tokens of a value
+JSON_LINE_BREAKS_TABLE = str.maketrans('', '', '\t\n\r')
+NON_ASCII = re.compile(r'[^\x00-\x7f]')
+
+
+def _parse_integer(data):
+    int_value = int(data)
+    if int_value != float(data):
+        raise ValueError
+    return int_value
+
+
+def _unknown_type(data):
+    raise ValueError
+
+
+def _escape_non_ascii(match):
+    # the same escapes as json.dumps, characters outside the BMP are written as surrogate pairs
+    code = ord(match.group())
+    if code > 0xffff:
+        code -= 0x10000
+        return '\\u{:04x}\\u{:04x}'.format(0xd800 | (code >> 10), 0xdc00 | (code & 0x3ff))
+    return '\\u{:04x}'.format(code)
+
+
+def _raw_json(data):
+    """
+    Checks a json value with a single parse and returns its text, without tabs and line breaks and with
+    non ASCII characters escaped, instead of the parsed value. orjson parses it when it is installed, the
+    values it rejects, like NaN and integers over 64 bits, are parsed again by the json module.
+    """
+    if orjson is None:
+        json.loads(data)
+    else:
+        try:
+            orjson.loads(data)
+        except orjson.JSONDecodeError:
+            json.loads(data)
+    if '\n' in data or '\r' in data or '\t' in data:
+        data = data.translate(JSON_LINE_BREAKS_TABLE)
+    if not data.isascii():
+        data = NON_ASCII.sub(_escape_non_ascii, data)
+    return data
+
+
+# validation and conversion fused into a single call per cell, every converter raises ValueError for invalid data
+FUSED_CONVERTERS = dict(ConvertCsvDataToJson.known_types, integer=_parse_integer)
+
+# partner files repeat a small set of dates, each date column memoizes its already normalized values
+CACHED_TYPES = {'date', 'datetime'}
+
+
+class ConversionPlan(object):
+    """
+    Positional conversion plan for a data file, built once from the validated headers and types.
+
+    Each column gets a single callable that validates and converts the cell value, so a row is converted
+    with one pass over its values and without any lookups by header name.
+    With validate_only the valid rows are encoded with their _id only.
+    With raw_json the values of json columns are checked and written as their original text, see _raw_json.
+    make_json caches the encoded fragment of each value of the columns other than MEMBER_ID, a column that
+    has too many distinct values goes back to converting and encoding every value.
+    """
+
+    def __init__(self, csv_headers, csv_types, company_id, member_id_name, compact=False, validate_only=False,
+                 raw_json=False):
+        self.width = len(csv_headers)
+        self.member_id_index = csv_headers.index(member_id_name)
+        self.id_prefix = "{}_".format(company_id)
+        self.types = [csv_types[name] for name in csv_headers]
+        self.columns = [self._compile_column(name, csv_types[name], name == member_id_name, raw_json)
+                        for name in csv_headers]
+        encoder = IdOnlyEncoder if validate_only else RecordEncoder
+        self.encoder = encoder(csv_headers, [csv_types[name] for name in csv_headers], compact, raw_json)
+        self.caches = None
+        self.cached_rows = 0
+        if self.encoder.encodes_fragments():
+            self.caches = [FragmentCache() if csv_type in FUSED_CONVERTERS and name != member_id_name else None
+                           for name, csv_type in zip(csv_headers, self.types)]
+
+    @staticmethod
+    def _compile_column(name, csv_type, is_member_id, raw_json=False):
+        if csv_type not in FUSED_CONVERTERS:
+            error = "{} is not known type".format(csv_type)
+            return name, _unknown_type, error, lambda value: error
+
+        empty_error = "MEMBER_ID cannot be empty" if is_member_id else None
+        invalid_error = lambda value: "{value} is not a valid {csv_type}".format(value=value, csv_type=csv_type)
+        converter = FUSED_CONVERTERS[csv_type]
+        if raw_json and csv_type == 'json':
+            converter = _raw_json
+        if csv_type in CACHED_TYPES:
+            converter = date_parser.cached(converter)
+        return name, converter, empty_error, invalid_error
+
+    def convert_row(self, data):
+        """Returns the converted values in column order, with None for the empty values, or an error"""
+        if len(data) != self.width:
+            return None, "Data length does not match headers"
+
+        values = []
+        for (name, converter, empty_error, invalid_error), value in zip(self.columns, data):
+            if value == "":
+                if empty_error:
+                    return None, empty_error
+                values.append(None)
+                continue
+            try:
+                values.append(converter(value))
+            except ValueError:
+                return None, invalid_error(value)
+        return values, ""
+
+    def check_row(self, data):
+        """
+        Returns the converted values like convert_row, or None and the (column index, value) of the first value
+        that isn't valid, without formatting an error. The column index is -1 if the row has the wrong length.
+        """
+        if len(data) != self.width:
+            return None, (-1, None)
+
+        values = []
+        for (name, converter, empty_error, invalid_error), value in zip(self.columns, data):
+            if value == "":
+                if empty_error:
+                    return None, (len(values), value)
+                values.append(None)
+                continue
+            try:
+                values.append(converter(value))
+            except ValueError:
+                return None, (len(values), value)
+        return values, None
+
+    def error_message(self, rejected):
+        """Returns the error of convert_row for the (column index, value) from check_row"""
+        index, value = rejected
+        if index == -1:
+            return "Data length does not match headers"
+        _, _, empty_error, invalid_error = self.columns[index]
+        return empty_error if value == "" else invalid_error(value)
+
+    def encode(self, member_id, values):
+        return self.encoder.encode(self.id_prefix + member_id, values)
+
+    def _prune_caches(self):
+        # the columns that stopped being cached skip their cache, without any cache the rows take the plain path
+        self.caches = [cache if cache is not None and cache.active else None for cache in self.caches]
+        if not any(self.caches):
+            self.caches = None
+
+    def _make_cached_json(self, data):
+        if len(data) != self.width:
+            return False, "Data length does not match headers"
+        self.cached_rows += 1
+        if self.cached_rows % fragment_cache.WINDOW == 0:
+            self._prune_caches()
+            if self.caches is None:
+                return self.make_json(data)
+
+        fragments = []
+        for index, ((name, converter, empty_error, invalid_error), cache, value) in enumerate(
+                zip(self.columns, self.caches, data)):
+            if value == "":
+                if empty_error:
+                    return False, empty_error
+                continue
+            fragment = cache.get(value) if cache is not None else None
+            if fragment is None:
+                try:
+                    fragment = self.encoder.fragment(index, converter(value))
+                except ValueError:
+                    return False, invalid_error(value)
+                if cache is not None:
+                    cache.add(value, fragment)
+            fragments.append(fragment)
+        return self.encoder.encode_fragments(self.id_prefix + data[self.member_id_index], fragments), ""
+
+    def make_json(self, data):
+        if self.caches is not None:
+            return self._make_cached_json(data)
+        values, error = self.convert_row(data)
+        if error:
+            return False, error
+        return self.encode(data[self.member_id_index], values), ""
@@ -0,0 +1,205 @@
+import collections
+import os
+
+from csv2ved import compressed_input
+from csv2ved import csv2jpl_converter
+from csv2ved import jpl2vad_converter
+from csv2ved import vad2ved_converter
+from csv2ved.conversion_options import ConversionOptions
+from csv2ved.conversion_plan import ConversionPlan
+
+ConversionResult = collections.namedtuple('ConversionResult', ['output_file', 'rows', 'errors', 'message'])
+Record = collections.namedtuple('Record', ['line', 'json_line', 'error'])
+
+# the name of a data file object without one, e.g. an io.StringIO, in the errors
+UNNAMED_DATA_FILE = '<data>'
+
+
+def _data_file_name(data_file):
+    return getattr(data_file, 'name', UNNAMED_DATA_FILE)
+
+
+def load_types(type_file_name):
+    """Returns the csv types of a type file, or None and the error"""
+    try:
+        with open(type_file_name) as type_file:
+            csv_types = csv2jpl_converter.get_csv_types(type_file)
+    except OSError as err:
+        return None, str(err)
+    if not csv_types:
+        return None, "Type file is invalid or empty"
+    return csv_types, ""
+
+
+class Converter(object):
+    """
+    Converts data files with the same types for one company, to be built once and reused for any number of files,
+    e.g. by a long running service. It never prompts or exits, errors are returned like those of the command.
+
+    With a gpg instance from vad2ved_converter.init_gpg the .jpl files are archived and encrypted for the
+    recipients, otherwise the .jpl files are the output. Each file is converted with a conversion plan of its
+    own, so nothing about a file is kept once it's converted.
+    """
+
+    def __init__(self, csv_types, company_id, gpg=None, recipients=None, max_number_of_errors=100, batch_size=0,
+                 compact=False, raw_json=False, compression=jpl2vad_converter.DEFAULT_CODEC):
+        self.csv_types = collections.OrderedDict(csv_types)
+        self.csv_headers = list(self.csv_types)
+        self.member_id_name = csv2jpl_converter.get_member_id_name(self.csv_types)
+        if self.member_id_name is None:
+            raise ValueError("Missing required column {}".format(csv2jpl_converter.MEMBER_ID_COLUMN))
+        if not csv2jpl_converter.validate_member_id_type(self.csv_types, self.member_id_name):
+            raise ValueError("'{}' type must be string".format(self.member_id_name))
+        if gpg is not None and not recipients:
+            raise ValueError("Encrypting needs the gpg recipients")
+        self.company_id = company_id
+        self.gpg = gpg
+        self.recipients = recipients
+        self.max_number_of_errors = max_number_of_errors
+        self.options = ConversionOptions(batch_size=batch_size, compact=compact, raw_json=raw_json,
+                                         compression=compression)
+
+    def _plan(self):
+        return ConversionPlan(self.csv_headers, self.csv_types, self.company_id, self.member_id_name,
+                              self.options.compact, raw_json=self.options.raw_json)
+
+    def _data_lines(self, data_file):
+        # the csv lines after the header line, or the error of the header line
+        csv_lines = csv2jpl_converter.csv_file_iterator(data_file)
+        csv_headers = next(csv_lines, None)
+        if csv_headers is None:
+            return None, {0: "{} is empty".format(_data_file_name(data_file))}
+        header_error = csv2jpl_converter.validate_headers(csv_headers, self.csv_types, self.member_id_name)
+        if header_error:
+            csv_lines.close()
+            return None, {1: header_error}
+        return csv_lines, None
+
+    def _deliver(self, jpl_file_name, rows):
+        if self.gpg is None:
+            return ConversionResult(jpl_file_name, rows, [], "")
+        vad_file_name, error, _, _ = jpl2vad_converter.convert(jpl_file_name, self.options.compression)
+        if error:
+            return ConversionResult(None, rows, [], error)
+        ved_file_name, status = vad2ved_converter.encrypt(self.gpg, vad_file_name, self.recipients)
+        if ved_file_name is None:
+            return ConversionResult(None, rows, [], status)
+        return ConversionResult(ved_file_name, rows, [], status.status)
+
+    def _convert_lines(self, csv_lines, data_file, jpl_file_name):
+        try:
+            with open(jpl_file_name, 'w') as jpl_file:
+                current_line, rows, errors = csv2jpl_converter.write_json_lines(
+                    jpl_file, csv_lines, data_file, self.csv_headers, self.csv_types, self.company_id,
+                    self.member_id_name, self.max_number_of_errors, self.options)
+        except OSError as err:
+            if os.path.exists(jpl_file_name):
+                os.remove(jpl_file_name)
+            return 0, 0, [], str(err)
+        return current_line, rows, errors, ""
+
+    def convert_file(self, data_file, output_file_name=None):
+        """
+        Converts an open data file, by default to data_<timestamp>.jpl next to it, and archives and encrypts
+        it with gpg. A file object without a name, like an io.StringIO, needs an output_file_name.
+        Returns the ConversionResult with the name of the output file, or None if it failed.
+        """
+        csv_lines, header_error = self._data_lines(data_file)
+        if header_error:
+            return ConversionResult(None, 0, [header_error], 'Conversion failed')
+        if output_file_name is None and not hasattr(data_file, 'name'):
+            csv_lines.close()
+            return ConversionResult(None, 0, [], 'A data file without a name needs an output file name')
+
+        jpl_file_name = output_file_name or csv2jpl_converter.generate_output_file_name(data_file.name)
+        current_line, rows, errors, error = self._convert_lines(csv_lines, data_file, jpl_file_name)
+        csv_lines.close()
+        if error:
+            return ConversionResult(None, rows, errors, error)
+        csv2jpl_converter.add_data_lines_errors(_data_file_name(data_file), current_line, rows, errors)
+        if errors:
+            os.remove(jpl_file_name)
+            return ConversionResult(None, rows, errors, 'Conversion failed')
+        return self._deliver(jpl_file_name, rows)
+
+    def convert_path(self, data_file_name, output_file_name=None):
+        """Converts the data file at a path like convert_file, it can be compressed"""
+        try:
+            with compressed_input.open_data_file(data_file_name) as data_file:
+                return self.convert_file(data_file, output_file_name)
+        except OSError as err:
+            return ConversionResult(None, 0, [], str(err))
+
+    def convert_rows(self, rows, output_file_name):
+        """
+        Converts rows of values in the order of the types to output_file_name, and archives and encrypts it like
+        convert_file. The rows have no header and are numbered from 1 in the errors.
+        """
+        current_line, number_of_rows, errors, error = self._convert_lines(iter(rows), None, output_file_name)
+        if error:
+            return ConversionResult(None, number_of_rows, errors, error)
+        # write_json_lines counts a header line
+        errors = [{line - 1: message} for error_line in errors for line, message in error_line.items()]
+        if not (errors or number_of_rows):
+            errors.append({0: "There are no rows to convert"})
+        if errors:
+            os.remove(output_file_name)
+            return ConversionResult(None, number_of_rows, errors, 'Conversion failed')
+        return self._deliver(output_file_name, number_of_rows)
+
+    def iter_records(self, source):
+        """
+        Yields a Record with the line number and the JSON line, or the error, of each row of a data file path,
+        an open data file or an iterable of rows, numbered like convert_file and convert_rows. Nothing is written
+        and the rows aren't limited to max_number_of_errors. Raises ValueError if the header line doesn't match.
+        """
+        if isinstance(source, str):
+            with compressed_input.open_data_file(source) as data_file:
+                for record in self.iter_records(data_file):
+                    yield record
+            return
+
+        current_line = 0
+        if hasattr(source, 'read'):
+            csv_lines, header_error = self._data_lines(source)
+            if header_error:
+                raise ValueError(list(header_error.values())[0])
+            current_line = 1
+        else:
+            csv_lines = iter(source)
+
+        conversion_plan = self._plan()
+        try:
+            for line in csv_lines:
+                current_line += 1
+                if line == []:
+                    continue
+                json_line, error = conversion_plan.make_json(line)
+                yield Record(current_line, json_line or None, error or None)
+        finally:
+            if hasattr(csv_lines, 'close'):
+                csv_lines.close()
+
+
+def create_converter(type_file_name, company_id, prod=True, **options):
+    """
+    Returns a Converter for the types of a type file that encrypts for the production or non production
+    recipients, with the keys imported once into the gpg home directory, or None and the error.
+    """
+    csv_types, error = load_types(type_file_name)
+    if error:
+        return None, error
+
+    recipients = vad2ved_converter.GPG_PRODUCTION_RECIPIENTS
+    key_files = vad2ved_converter.GPG_PRODUCTION_KEY_DATA_DIRECTORY
+    if not prod:
+        recipients = vad2ved_converter.GPG_NON_PRODUCTION_RECIPIENTS
+        key_files = vad2ved_converter.GPG_NON_PRODUCTION_KEY_DATA_DIRECTORY
+    gpg, error = vad2ved_converter.init_gpg(vad2ved_converter.GPG_HOME_DIRECTORY, recipients, key_files)
+    if error:
+        return None, error
+
+    try:
+        return Converter(csv_types, company_id, gpg, recipients, **options), ""
+    except ValueError as err:
+        return None, str(err)
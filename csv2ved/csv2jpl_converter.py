@@ -1,18 +1,32 @@
 import csv
-import json
 import datetime
 
 import os
 
 from collections import OrderedDict
 
-from csv2ved.csv_type_validator import ValidateCsvTypes
-from csv2ved.csv2json_type_converter import ConvertCsvDataToJson
+from csv2ved import batch_converter
+from csv2ved import checkpoints
+from csv2ved import compressed_input
+from csv2ved import duplicates
+from csv2ved import metrics as stage_metrics
+from csv2ved import mmap_reader
+from csv2ved import parallel_converter
+from csv2ved import pipeline
+from csv2ved.conversion_options import DEFAULT_OPTIONS
+from csv2ved.conversion_plan import ConversionPlan
 
 MEMBER_ID_COLUMN = "MEMBER_ID"
 
 
 def csv_file_iterator(csv_file):
+    # regular files are read from a memory map, which only parses the lines with quotes as csv
+    if parallel_converter.can_split(csv_file):
+        return mmap_reader.csv_file_iterator(csv_file)
+    return _csv_reader_iterator(csv_file)
+
+
+def _csv_reader_iterator(csv_file):
     with csv_file:
         csv_reader = csv.reader(csv_file, delimiter=',', quotechar='"')
         for line in csv_reader:
@@ -20,34 +34,16 @@ def csv_file_iterator(csv_file):
 
 
 def make_json(csv_headers, csv_types, data, company_id, member_id_name):
-    if len(csv_headers) != len(data):
-        return False, "Data length does not match headers"
-
-    augmented_data = {}
-    for name, value in zip(csv_headers, data):
-        error = ValidateCsvTypes.validate(csv_types[name], value)
-        if error:
-            return False, error
-        try:
-            json_value = ConvertCsvDataToJson.convert(csv_types[name], value)
-            if name == member_id_name and json_value is None:
-                return False, "MEMBER_ID cannot be empty"
-            if json_value is not None:
-                augmented_data[name] = json_value
-        except ValueError:
-            return False, "Cannot convert '{}' value '{}' to '{}'".format(name, value, csv_types[name])
-
-    _id = "{}_{}".format(company_id, augmented_data[member_id_name])
-    augmented_dict = {
-        "_id": _id,
-        "augmentedData": augmented_data
-    }
-    return json.dumps(augmented_dict), ""
+    """
+    Converts a single row to its JSON line, or returns False and the error. The conversion paths build a
+    ConversionPlan once per file instead of once per row.
+    """
+    return ConversionPlan(csv_headers, csv_types, company_id, member_id_name).make_json(data)
 
 
 def generate_output_file_name(data_file_path, now=None):
     now = now or datetime.datetime.today().strftime('%Y%m%d%H%M%S')
-    file_name, extension = os.path.splitext(data_file_path)
+    file_name, extension = os.path.splitext(compressed_input.strip_extension(data_file_path))
     return "{}_{}.jpl".format(file_name, now)
 
 
@@ -86,56 +82,355 @@ def get_member_id_name(csv_types):
     return None
 
 
-def convert(data_file, type_file, company_id, max_number_of_errors=100):
+def validate_headers(csv_headers, csv_types, member_id_name):
+    if not validate_csv_headers(csv_headers):
+        return "Missing required column {}".format(MEMBER_ID_COLUMN)
 
-    current_line = 0
-    number_of_written_lines = 0
-    error_lines = []
-    csv_headers = []
-    csv_types = get_csv_types(type_file)
-    if not csv_types:
-        error_lines.append({current_line: "Type file is invalid or empty"})
-        return "", number_of_written_lines, error_lines
+    if not validate_csv_types(csv_types, csv_headers):
+        return "Headers in data file don't match the types file"
 
-    member_id_name = get_member_id_name(csv_types)
-    output_file_name = generate_output_file_name(data_file.name)
-
-    with open(output_file_name, 'w') as output_file:
+    if not validate_member_id_type(csv_types, member_id_name):
+        return "'{}' type must be string".format(member_id_name)
 
-        for line in csv_file_iterator(data_file):
-            current_line += 1
-            if current_line == 1:
-                csv_headers = line
+    return ""
 
-                if not validate_csv_headers(csv_headers):
-                    error_lines.append({current_line: "Missing required column {}".format(MEMBER_ID_COLUMN)})
-                    return "", number_of_written_lines, error_lines
 
-                if not validate_csv_types(csv_types, csv_headers):
-                    error_lines.append({current_line: "Headers in data file don't match the types file"})
-                    return "", number_of_written_lines, error_lines
+def _write_pipelined_json_lines(output_file, csv_lines, conversion_plan, max_number_of_errors, batch_size,
+                                duplicate_detector):
+    # a thread reads blocks of lines ahead of their conversion and another one writes the converted blocks
+    current_line = 1
+    number_of_written_lines = 0
+    error_lines = []
+    batch = None
+    if batch_size and batch_converter.numpy_available():
+        batch = batch_converter.BatchConverter(conversion_plan)
+    reader = pipeline.BlockReader(csv_lines, batch_size or pipeline.BLOCK_ROWS, current_line)
+    writer = pipeline.BlockWriter(output_file)
+    try:
+        for line_numbers, rows, current_line in reader:
+            results = batch.convert_block(rows) if batch is not None else map(conversion_plan.make_json, rows)
+            json_lines = []
+            for line, (json_line, error) in zip(line_numbers, results):
+                if json_line:
+                    json_lines.append(json_line)
+                    if duplicate_detector is not None:
+                        duplicate_detector.add(json_line, line)
+                else:
+                    error_lines.append({line: error})
+                    if len(error_lines) >= max_number_of_errors:
+                        break
+            if json_lines:
+                writer.write('\n'.join(json_lines) + '\n')
+                number_of_written_lines += len(json_lines)
+            if len(error_lines) >= max_number_of_errors:
+                break
+    finally:
+        reader.close()
+        writer.close()
+    return current_line, number_of_written_lines, error_lines
+
+
+def _conversion_plan(csv_headers, csv_types, company_id, member_id_name, options):
+    return ConversionPlan(csv_headers, csv_types, company_id, member_id_name, options.compact, options.validate_only,
+                          options.raw_json)
+
+
+def write_json_lines(output_file, csv_lines, data_file, csv_headers, csv_types, company_id, member_id_name,
+                     max_number_of_errors=100, options=DEFAULT_OPTIONS, duplicate_detector=None, rejects=None):
+    """
+    Converts the data lines following the validated header line and writes them to output_file.
+    With options.workers the records are converted by that many processes when the data file can be split.
+    With options.batch_size, blocks of lines are converted by the NumPy batch engine when NumPy is installed.
+    With options.compact, the JSON lines are written without spaces after the separators.
+    With options.raw_json the values of json columns are written as their original text, see ConversionPlan.
+    Each written line is added to the duplicate_detector if there is one.
+    With options.validate_only the lines are checked the same way but only their _id is encoded.
+    With rejects.Rejects the lines that aren't valid are added to it instead of being errors, and the lines
+    are converted one at a time in this process.
+    With options.pipelined, when the lines aren't converted by workers or with rejects, a thread reads the
+    lines and another one writes the JSON lines while this one converts them.
+    Returns the number of the last line read, the number of written lines and the errors.
+    """
+    current_line = 1
+    number_of_written_lines = 0
+    error_lines = []
 
-                if not validate_member_id_type(csv_types, member_id_name):
-                    error_lines.append({current_line: "'{}' type must be string".format(member_id_name)})
-                    return "", number_of_written_lines, error_lines
+    boundaries = None
+    if options.parallel and rejects is None and parallel_converter.can_split(data_file):
+        boundaries = parallel_converter.find_record_boundaries(data_file.name)
 
-                continue
+    if rejects is not None:
+        conversion_plan = _conversion_plan(csv_headers, csv_types, company_id, member_id_name, options)
+        rejects.start(conversion_plan, csv_headers)
+        try:
+            for line in csv_lines:
+                current_line += 1
+                if line == []:
+                    continue
+                values, rejected = conversion_plan.check_row(line)
+                if rejected is not None:
+                    rejects.add(current_line, line, rejected)
+                    continue
+                json_line = conversion_plan.encode(line[conversion_plan.member_id_index], values)
+                output_file.write("{}\n".format(json_line))
+                number_of_written_lines += 1
+                if duplicate_detector is not None:
+                    duplicate_detector.add(json_line, current_line)
+        finally:
+            rejects.close()
+    elif boundaries:
+        csv_lines.close()
+        chunks = parallel_converter.convert_chunks(
+            data_file, boundaries, csv_headers, csv_types, company_id, member_id_name, max_number_of_errors, options)
+        for output, written_lines, errors, number_of_records, written_line_numbers in chunks:
+            for line, error, written_before_error in errors[:max_number_of_errors - len(error_lines)]:
+                error_lines.append({current_line + line: error})
+            if len(error_lines) >= max_number_of_errors:
+                number_of_written_lines += written_before_error
+                chunks.close()
+                break
+            output_file.write(output)
+            if duplicate_detector is not None:
+                duplicate_detector.add_lines(output, [current_line + line for line in written_line_numbers])
+            number_of_written_lines += written_lines
+            current_line += number_of_records
+    elif options.pipelined:
+        conversion_plan = _conversion_plan(csv_headers, csv_types, company_id, member_id_name, options)
+        current_line, number_of_written_lines, error_lines = _write_pipelined_json_lines(
+            output_file, csv_lines, conversion_plan, max_number_of_errors, options.batch_size, duplicate_detector)
+    elif options.batch_size and batch_converter.numpy_available():
+        conversion_plan = _conversion_plan(csv_headers, csv_types, company_id, member_id_name, options)
+        batch = batch_converter.BatchConverter(conversion_plan)
+        for line_numbers, rows, current_line in batch_converter.read_blocks(csv_lines, options.batch_size,
+                                                                            current_line):
+            for line, (json_line, error) in zip(line_numbers, batch.convert_block(rows)):
+                if json_line:
+                    output_file.write("{}\n".format(json_line))
+                    number_of_written_lines += 1
+                    if duplicate_detector is not None:
+                        duplicate_detector.add(json_line, line)
+                else:
+                    error_lines.append({line: error})
+                    if len(error_lines) >= max_number_of_errors:
+                        break
+            if len(error_lines) >= max_number_of_errors:
+                break
+    else:
+        conversion_plan = _conversion_plan(csv_headers, csv_types, company_id, member_id_name, options)
+        for line in csv_lines:
+            current_line += 1
             if line == []:
                 continue
-            json_line, error = make_json(csv_headers, csv_types, line, company_id, member_id_name)
+            json_line, error = conversion_plan.make_json(line)
             if json_line:
                 output_file.write("{}\n".format(json_line))
                 number_of_written_lines += 1
+                if duplicate_detector is not None:
+                    duplicate_detector.add(json_line, current_line)
             else:
                 error_lines.append({current_line: error})
                 if len(error_lines) >= max_number_of_errors:
                     break
 
-    if error_lines or number_of_written_lines == 0:
-        os.remove(output_file_name)
+    return current_line, number_of_written_lines, error_lines
+
+
+def validate(data_file, type_file, company_id, max_number_of_errors=100, options=DEFAULT_OPTIONS,
+             duplicate_detector=None, rejects=None):
+    """
+    Checks the data file the same way as convert without encoding the records or writing any output, and
+    stops at max_number_of_errors. Returns the number of valid lines and the same errors as convert.
+    """
+    current_line = 0
+    number_of_valid_lines = 0
+    error_lines = []
+    csv_types = get_csv_types(type_file)
+    if not csv_types:
+        error_lines.append({current_line: "Type file is invalid or empty"})
+        return number_of_valid_lines, error_lines
+
+    member_id_name = get_member_id_name(csv_types)
+    csv_lines = csv_file_iterator(data_file)
+    csv_headers = next(csv_lines, None)
+    if csv_headers is not None:
+        header_error = validate_headers(csv_headers, csv_types, member_id_name)
+        if header_error:
+            csv_lines.close()
+            error_lines.append({1: header_error})
+            return number_of_valid_lines, error_lines
+
+        with open(os.devnull, 'w') as output_file:
+            current_line, number_of_valid_lines, error_lines = write_json_lines(
+                output_file, csv_lines, data_file, csv_headers, csv_types, company_id, member_id_name,
+                max_number_of_errors, options._replace(validate_only=True), duplicate_detector, rejects)
+
+    if duplicate_detector is not None and not error_lines:
+        duplicate_detector.find()
+        if duplicate_detector.policy == duplicates.ERROR:
+            error_lines = duplicates.add_duplicate_errors(error_lines, duplicate_detector.duplicates,
+                                                          max_number_of_errors)
+    add_data_lines_errors(data_file.name, current_line, number_of_valid_lines, error_lines)
+    return number_of_valid_lines, error_lines
+
+
+def write_checkpointed_json_lines(output_file, data_file, csv_headers, csv_types, company_id, member_id_name,
+                                  checkpoint, checkpoint_file_name, checkpoint_interval, max_number_of_errors=100,
+                                  options=DEFAULT_OPTIONS):
+    """
+    Converts the data records from the position in checkpoint in chunks of about checkpoint_interval bytes.
+    Once a chunk is written and synced to disk the position after it is saved to checkpoint_file_name, so
+    an interrupted conversion can be resumed from its last saved checkpoint.
+    Returns the number of the last line read, the number of written lines and the errors.
+    """
+    current_line = checkpoint['line']
+    number_of_written_lines = checkpoint['written_lines']
+    error_lines = [{line: error} for line, error in checkpoint['errors']]
+    if checkpoint['input_offset'] is None:
+        # saved before any record is written, so a run interrupted before its first chunk resumes into its output
+        checkpoints.save_checkpoint(checkpoint_file_name, checkpoint)
+
+    boundaries = parallel_converter.find_record_boundaries(data_file.name, checkpoint_interval,
+                                                           checkpoint['input_offset'])
+    if boundaries is None:
+        error_lines.append({1: "Checkpoints need a data file with newline line endings"})
+        return current_line, number_of_written_lines, error_lines
+
+    chunks = parallel_converter.convert_chunks(
+        data_file, boundaries, csv_headers, csv_types, company_id, member_id_name, max_number_of_errors, options)
+    for end, (output, written_lines, errors, number_of_records, _) in zip(boundaries[1:], chunks):
+        for line, error, written_before_error in errors[:max_number_of_errors - len(error_lines)]:
+            error_lines.append({current_line + line: error})
+        if len(error_lines) >= max_number_of_errors:
+            number_of_written_lines += written_before_error
+            chunks.close()
+            break
+        output_file.write(output)
+        number_of_written_lines += written_lines
+        current_line += number_of_records
+
+        output_file.flush()
+        os.fsync(output_file.fileno())
+        checkpoint.update({
+            'input_offset': end,
+            'line': current_line,
+            'output_size': os.fstat(output_file.fileno()).st_size,
+            'written_lines': number_of_written_lines,
+            'errors': [[line, error] for error_line in error_lines for line, error in error_line.items()]
+        })
+        checkpoints.save_checkpoint(checkpoint_file_name, checkpoint)
+
+    return current_line, number_of_written_lines, error_lines
+
+
+def add_data_lines_errors(data_file_name, current_line, number_of_written_lines, error_lines):
     if current_line == 0:
-        error_lines.append({current_line: "{} is empty".format(data_file.name)})
+        error_lines.append({current_line: "{} is empty".format(data_file_name)})
     elif not (error_lines or number_of_written_lines):
-        error_lines.append({1: "{} doesn't have data lines".format(data_file.name)})
+        error_lines.append({1: "{} doesn't have data lines".format(data_file_name)})
+
+
+def _load_checkpoint(data_file, csv_types, company_id, options, output_file_name):
+    # returns the checkpoint to start from and the name of its checkpoint file, or an error
+    if not parallel_converter.can_split(data_file):
+        return None, None, "Checkpoints need a regular data file in an ASCII compatible encoding"
+
+    checkpoint_file_name = checkpoints.checkpoint_file_for(data_file.name)
+    settings = checkpoints.checkpoint_settings(data_file.name, csv_types, company_id, options.compact,
+                                               options.raw_json)
+    checkpoint, error = checkpoints.load_checkpoint(checkpoint_file_name, settings) if options.resume else (None, "")
+    if error:
+        return None, None, error
+    return checkpoint or checkpoints.new_checkpoint(settings, output_file_name), checkpoint_file_name, ""
+
+
+def convert(data_file, type_file, company_id, max_number_of_errors=100, options=DEFAULT_OPTIONS, metrics=None,
+            delta_filter=None, duplicate_detector=None, rejects=None):
+    """
+    Converts the data file to a .jpl file, returns its name, the number of converted lines and the errors.
+    The records are converted as set in a ConversionOptions, see write_json_lines.
+
+    With options.checkpoint_interval the position of the conversion is saved about every checkpoint_interval
+    bytes of the data file. With options.resume a conversion that was interrupted continues from its last
+    checkpoint and appends to its .jpl file, the result is the same as if it hadn't been interrupted.
+    With a loaded delta.DeltaFilter only the lines it lets through are written, checkpoints aren't supported.
+    With a duplicates.DuplicateDetector records with the same _id are errors or are left out, depending on
+    its policy. Checkpoints aren't supported and a delta filter can only be combined with the error policy.
+    With a rejects.Rejects the rows that aren't valid are collected by it and the other rows are converted,
+    checkpoints aren't supported either.
+    """
+    metrics = metrics or stage_metrics.NULL_METRICS
+
+    current_line = 0
+    number_of_written_lines = 0
+    error_lines = []
+    with metrics.stage('type_load', stage_metrics.file_size(type_file)):
+        csv_types = get_csv_types(type_file)
+    if not csv_types:
+        error_lines.append({current_line: "Type file is invalid or empty"})
+        return "", number_of_written_lines, error_lines
+
+    member_id_name = get_member_id_name(csv_types)
+    output_file_name = generate_output_file_name(data_file.name)
+
+    checkpoint = None
+    if options.checkpoints:
+        checkpoint, checkpoint_file_name, error = _load_checkpoint(data_file, csv_types, company_id, options,
+                                                                   output_file_name)
+        if error:
+            error_lines.append({current_line: error})
+            return "", number_of_written_lines, error_lines
+        output_file_name = checkpoint['output_file']
+    resuming = checkpoint is not None and checkpoint['input_offset'] is not None
+
+    with open(output_file_name, 'r+' if resuming else 'w') as output_file:
+        if resuming:
+            # drops whatever was written after the checkpoint
+            output_file.truncate(checkpoint['output_size'])
+            output_file.seek(0, os.SEEK_END)
+
+        csv_lines = csv_file_iterator(data_file)
+        csv_headers = next(csv_lines, None)
+        if csv_headers is not None:
+            header_error = validate_headers(csv_headers, csv_types, member_id_name)
+            if header_error:
+                error_lines.append({1: header_error})
+                return "", number_of_written_lines, error_lines
+
+            with metrics.stage('conversion', stage_metrics.file_size(data_file)) as record, metrics.profiled():
+                if checkpoint is not None:
+                    csv_lines.close()
+                    current_line, number_of_written_lines, error_lines = write_checkpointed_json_lines(
+                        output_file, data_file, csv_headers, csv_types, company_id, member_id_name, checkpoint,
+                        checkpoint_file_name, options.checkpoint_interval or checkpoints.DEFAULT_CHECKPOINT_INTERVAL,
+                        max_number_of_errors, options)
+                else:
+                    if delta_filter is not None:
+                        delta_filter.start(output_file)
+                    current_line, number_of_written_lines, error_lines = write_json_lines(
+                        delta_filter or output_file, csv_lines, data_file, csv_headers, csv_types, company_id,
+                        member_id_name, max_number_of_errors, options, duplicate_detector, rejects)
+                    if delta_filter is not None:
+                        delta_filter.finish()
+                record['bytes_out'] = output_file.tell()
+                record['rows'] = number_of_written_lines if delta_filter is None else delta_filter.written
+
+    if checkpoint is not None:
+        checkpoints.remove_checkpoint(checkpoint_file_name)
+    if duplicate_detector is not None and not error_lines:
+        removed = duplicate_detector.find()
+        if duplicate_detector.policy == duplicates.ERROR:
+            error_lines = duplicates.add_duplicate_errors(error_lines, duplicate_detector.duplicates,
+                                                          max_number_of_errors)
+        elif removed:
+            duplicates.remove_records(output_file_name, removed)
+            number_of_written_lines -= len(removed)
+    if error_lines or number_of_written_lines == 0:
+        os.remove(output_file_name)
+    add_data_lines_errors(data_file.name, current_line, number_of_written_lines, error_lines)
+    if delta_filter is not None:
+        if error_lines:
+            delta_filter.discard()
+        # the data lines are checked before filtering, the lines that changed are the ones written
+        number_of_written_lines = delta_filter.written
 
     return output_file_name, number_of_written_lines, error_lines
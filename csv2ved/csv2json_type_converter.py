@@ -1,23 +1,13 @@
 import json
-from dateutil.parser import parse
+from csv2ved.date_parser import parse_datetime_value
 
 
 def _parse_datetime(data):
-    try:
-        int(data)
-    except ValueError:
-        return parse(data).isoformat()
-    else:
-        raise ValueError
+    return parse_datetime_value(data).isoformat()
 
 
 def _parse_date(data):
-    try:
-        int(data)
-    except ValueError:
-        return parse(data).strftime("%Y-%m-%d")
-    else:
-        raise ValueError
+    return parse_datetime_value(data).strftime("%Y-%m-%d")
 
 
 def _parse_json(data):
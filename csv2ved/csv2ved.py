@@ -1,9 +1,24 @@
 import click
+import os
 import sys
 from uuid import UUID
+from csv2ved import compressed_input
 from csv2ved import csv2jpl_converter
+from csv2ved import delta
+from csv2ved import duplicates
+from csv2ved import files_converter
 from csv2ved import jpl2vad_converter
+from csv2ved import metrics as stage_metrics
+from csv2ved import rejects as rejected_rows
+from csv2ved import shards
+from csv2ved import stream_converter
+from csv2ved import type_inference
 from csv2ved import vad2ved_converter
+from csv2ved import verifier
+from csv2ved.conversion_options import ConversionOptions
+
+MB = 1024 * 1024
+MAX_REPORTED_DUPLICATES = 100
 
 
 def print_data(data, indent=0):
@@ -29,6 +44,258 @@ def _handle_input_prompt(options):
             sys.exit('Aborting.')
 
 
+def _exit_on_errors(errors):
+    if errors:
+        click.secho('Errors: ')
+        for error in errors:
+            for line in error:
+                click.secho("line {line}: {error}".format(line=line, error=error[line]))
+        sys.exit(2)
+
+
+def _create_metrics(opts):
+    if opts['profile'] or opts['metrics_file'] or opts['profile_file']:
+        return stage_metrics.StageMetrics(opts['profile_file'])
+    return stage_metrics.NULL_METRICS
+
+
+def _report_metrics(opts, metrics):
+    if opts['profile']:
+        click.secho('\nstage metrics:', bold=True)
+        for line in metrics.report_lines():
+            click.secho('  {}'.format(line))
+    if opts['metrics_file']:
+        metrics.write(opts['metrics_file'])
+        click.secho('Metrics written to {}'.format(opts['metrics_file']))
+    if opts['profile_file']:
+        click.secho('Conversion profile written to {}'.format(opts['profile_file']))
+
+
+def _conversion_options(opts, multiple_files):
+    return ConversionOptions(
+        workers=opts['workers'], batch_size=opts['batch_size'], compact=opts['compact_json'],
+        raw_json=opts['raw_json'], pipelined=opts['pipeline'], validate_only=opts['validate_only'],
+        checkpoint_interval=opts['checkpoint_interval'] * MB, resume=opts['resume'],
+        compression=opts['compression'], stream=opts['stream'], duplicates=opts['duplicates'],
+        delta_manifest=opts['delta_manifest'], tombstones=opts['tombstones'], rejects_file=opts['rejects_file'],
+        error_summary=opts['error_summary'], shard_rows=opts['shard_rows'], shard_size=opts['shard_size'],
+        multiple_files=multiple_files, profiled=bool(opts['profile'] or opts['metrics_file'] or opts['profile_file']))
+
+
+def _duplicate_detector(options):
+    if not options.checks_duplicates:
+        return None
+    return duplicates.DuplicateDetector(options.duplicates)
+
+
+def _report_duplicates(duplicate_detector):
+    if duplicate_detector is None or not duplicate_detector.duplicates:
+        return
+    click.secho('{} duplicate MEMBER_ID records left out:'.format(len(duplicate_detector.duplicates)))
+    for line, kept_line in duplicate_detector.duplicates[:MAX_REPORTED_DUPLICATES]:
+        click.secho('line {line}: same MEMBER_ID as line {kept_line}, which was kept'.format(
+            line=line, kept_line=kept_line))
+    if len(duplicate_detector.duplicates) > MAX_REPORTED_DUPLICATES:
+        click.secho('... and {} more'.format(len(duplicate_detector.duplicates) - MAX_REPORTED_DUPLICATES))
+
+
+def _create_rejects(options):
+    if not options.rejects:
+        return None
+    return rejected_rows.Rejects(options.rejects_file)
+
+
+def _report_rejects(options, rejects):
+    if rejects is None:
+        return
+    click.secho('{} rows rejected'.format(rejects.total))
+    if rejects.total:
+        for line in rejects.summary_lines():
+            click.secho(line)
+        if options.rejects_file:
+            click.secho('Rejected rows written to {}'.format(options.rejects_file))
+
+
+def _stream_csv2ved(opts, options, gpg, gpg_recipients, metrics):
+    click.secho('Converting, archiving and encrypting ...')
+    rejects = _create_rejects(options)
+    ved_filename, lines, errors, status = stream_converter.convert(
+        gpg, opts['data_file'], opts['type_file'], opts['company_id'], gpg_recipients, options=options,
+        metrics=metrics, duplicate_detector=_duplicate_detector(options), rejects=rejects)
+    _exit_on_errors(errors)
+    click.secho("{} lines written".format(lines))
+    _report_rejects(options, rejects)
+
+    if ved_filename is None:
+        click.secho(status, color='red')
+        sys.exit(2)
+    else:
+        click.secho('{data_file} encrypted to {ved_file}, status: {status}'.format(
+            data_file=opts['data_file'].name, ved_file=ved_filename, status=status.status))
+
+
+def _load_delta_filter(options):
+    if not options.delta_manifest:
+        return None
+    delta_filter = delta.DeltaFilter(options.delta_manifest, options.tombstones, options.compact, options.raw_json)
+    error = delta_filter.load()
+    if error:
+        click.secho(error, color='red')
+        sys.exit(2)
+    return delta_filter
+
+
+def _files_csv2ved(opts, options, gpg, gpg_recipients, metrics):
+    delta_filter = _load_delta_filter(options)
+    duplicate_detector = _duplicate_detector(options)
+    rejects = _create_rejects(options)
+    jpl_file_name, lines, errors = csv2jpl_converter.convert(opts['data_file'], opts['type_file'], opts['company_id'],
+                                                             options=options,
+                                                             metrics=metrics,
+                                                             delta_filter=delta_filter,
+                                                             duplicate_detector=duplicate_detector,
+                                                             rejects=rejects)
+    _exit_on_errors(errors)
+    click.secho("{} lines written".format(lines))
+    _report_rejects(options, rejects)
+    _report_duplicates(duplicate_detector)
+    if delta_filter is not None:
+        click.secho("Delta: {new} new, {changed} changed, {unchanged} unchanged, {removed} removed".format(
+            **delta_filter.stats))
+
+    try:
+        if options.shards:
+            _shard_csv2ved(opts, options, gpg, gpg_recipients, metrics, jpl_file_name, lines)
+        else:
+            _archive_and_encrypt(options, gpg, gpg_recipients, metrics, jpl_file_name, lines)
+        if delta_filter is not None:
+            delta_filter.commit()
+            click.secho('Delta manifest {} updated'.format(options.delta_manifest))
+    finally:
+        # the manifest of a run whose output wasn't delivered is left out
+        if delta_filter is not None:
+            delta_filter.discard()
+
+
+def _archive_and_encrypt(options, gpg, gpg_recipients, metrics, jpl_file_name, lines):
+    click.secho('Archiving ...')
+    with metrics.stage('archive', os.path.getsize(jpl_file_name)) as record:
+        vad_filename, errors, compression_info = jpl2vad_converter.convert_with_compression_info(
+            jpl_file_name, options.compression)
+        record['bytes_out'] = compression_info.compress_size
+        record['rows'] = lines
+    if errors:
+        click.secho('Errors occurred during compression: {}'.format(errors), color='red')
+        sys.exit(2)
+
+    click.secho('{jpl_file} archived to {vad_file}.'.format(jpl_file=jpl_file_name, vad_file=vad_filename))
+    click.secho('Original file size: {jpl_bytes} bytes.'.format(jpl_bytes=compression_info.file_size))
+    click.secho('Compressed file size: {vad_bytes} bytes'. format(vad_bytes=compression_info.compress_size))
+    click.secho('Compressed with {codec} in {seconds:.2f}s'.format(codec=compression_info.codec,
+                                                                   seconds=compression_info.seconds))
+
+    click.secho('Encrypting ...')
+
+    with metrics.stage('encrypt', os.path.getsize(vad_filename)) as record:
+        ved_filename, status = vad2ved_converter.encrypt(gpg, vad_filename, gpg_recipients)
+        if ved_filename is not None:
+            record['bytes_out'] = os.path.getsize(ved_filename)
+            record['rows'] = lines
+
+    if ved_filename is None:
+        click.secho(status, color='red')
+        sys.exit(2)
+    else:
+        click.secho('{vad_file} encrypted to {ved_file}, status: {status}'.format(
+            vad_file=vad_filename, ved_file=ved_filename, status=status.status))
+
+
+def _shard_csv2ved(opts, options, gpg, gpg_recipients, metrics, jpl_file_name, lines):
+    click.secho('Splitting into shards ...')
+    jpl_shards = shards.split_jpl(jpl_file_name, options.shard_rows, options.shard_size * MB)
+
+    click.secho('Archiving and encrypting {} shards ...'.format(len(jpl_shards)))
+    with metrics.stage('shards', sum(shard.jpl_bytes for shard in jpl_shards)) as record:
+        results = shards.convert_shards(gpg, jpl_shards, gpg_recipients, options.compression)
+        record['bytes_out'] = sum(os.path.getsize(result.ved_file) for result in results if result.ved_file)
+        record['rows'] = lines
+
+    failed = [result for result in results if result.error]
+    if failed:
+        for result in failed:
+            click.secho(result.error, color='red')
+        for file_name in shards.remove_shard_outputs(results):
+            click.secho('Removed {}'.format(file_name), color='red')
+        sys.exit(2)
+
+    for result in results:
+        click.secho('{jpl_file} encrypted to {ved_file}, {rows} rows'.format(
+            jpl_file=result.shard.jpl_file, ved_file=result.ved_file, rows=result.shard.rows))
+    manifest_file_name = shards.write_manifest(shards.shard_manifest_file_for(jpl_file_name), opts['data_file'].name,
+                                               results)
+    click.secho('Shard manifest written to {}'.format(manifest_file_name))
+
+
+def _batch_csv2ved(opts, options, gpg, gpg_recipients, file_names):
+    click.secho('Converting {} files ...'.format(len(file_names)))
+    results = files_converter.convert_files(gpg, file_names, opts['company_id'], gpg_recipients, jobs=opts['jobs'],
+                                            options=options)
+
+    click.secho('')
+    for line in files_converter.format_summary(results):
+        click.secho(line)
+
+    failed = [result for result in results if result.ved_file is None]
+    if failed:
+        click.secho('\nErrors: ')
+        for result in failed:
+            for error in result.errors:
+                for line in error:
+                    click.secho("{file} line {line}: {error}".format(file=result.data_file, line=line,
+                                                                     error=error[line]))
+        sys.exit(2)
+
+
+def _validate_csv2ved(opts, options, file_names):
+    failed = False
+    for data_file_name, type_file_name in file_names:
+        rejects = _create_rejects(options)
+        try:
+            with compressed_input.open_data_file(data_file_name) as data_file, open(type_file_name) as type_file:
+                lines, errors = csv2jpl_converter.validate(
+                    data_file, type_file, opts['company_id'], options=options,
+                    duplicate_detector=_duplicate_detector(options), rejects=rejects)
+        except OSError as err:
+            lines, errors = 0, [{0: str(err)}]
+
+        if errors:
+            failed = True
+            click.secho('{} is invalid, errors: '.format(data_file_name))
+            for error in errors:
+                for line in error:
+                    click.secho("line {line}: {error}".format(line=line, error=error[line]))
+        else:
+            click.secho('{} is valid, {} lines'.format(data_file_name, lines))
+            _report_rejects(options, rejects)
+    if failed:
+        sys.exit(2)
+
+
+def _file_names(opts, data_file_names):
+    # the data files are opened again by name, each with the --type-file or its own type file
+    for data_file in opts['data_file']:
+        data_file.close()
+    return [(name, opts['type_file'].name if opts['type_file'] else files_converter.type_file_for(name))
+            for name in data_file_names]
+
+
+def _data_file_names(opts):
+    data_file_names = [data_file.name for data_file in opts['data_file']]
+    if opts['data_dir']:
+        data_file_names += files_converter.find_data_files(opts['data_dir'], opts['pattern'])
+    return data_file_names
+
+
 def validate_company_cmd_line_parameter(company_id):
     try:
         UUID(company_id, version=4)
@@ -37,15 +304,94 @@ def validate_company_cmd_line_parameter(company_id):
     return True
 
 
-@click.command()
+class Csv2VedCommand(click.Command):
+    """
+    The conversion command, which runs one of the commands added with add_command instead when the first
+    argument is its name, e.g. csv2ved infer-types ...
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(Csv2VedCommand, self).__init__(*args, **kwargs)
+        self.commands = {}
+
+    def add_command(self, command):
+        self.commands[command.name] = command
+
+    def main(self, args=None, prog_name=None, **extra):
+        args = list(sys.argv[1:] if args is None else args)
+        if args and args[0] in self.commands:
+            prog_name = '{} {}'.format(prog_name or self.name, args[0])
+            return self.commands[args[0]].main(args[1:], prog_name, **extra)
+        return super(Csv2VedCommand, self).main(args, prog_name, **extra)
+
+
+@click.command(cls=Csv2VedCommand, epilog='Run csv2ved infer-types --help to propose a type file for a data file, '
+                                          'and csv2ved verify --help to check .ved files before they are uploaded.')
 @click.option('--company-id', 'company_id', required=True, type=str, help='Company ID')
-@click.option('--data-file', 'data_file', required=True, type=click.File('r'), help='path to partner data file in '
-                                                                                    'csv format')
-@click.option('--type-file', 'type_file', required=True, type=click.File('r'), help='path to data type file in '
-                                                                                    'json format')
+@click.option('--data-file', 'data_file', multiple=True, type=click.File('r'),
+              help='path to partner data file in csv format, can be repeated')
+@click.option('--data-dir', 'data_dir', default=None, type=click.Path(exists=True, file_okay=False),
+              help='directory of partner data files to convert')
+@click.option('--pattern', default='*.csv', help='name pattern of the data files in --data-dir. Default is *.csv')
+@click.option('--type-file', 'type_file', default=None, type=click.File('r'),
+              help='path to data type file in json format. Without it each data file uses the .csvt file with the '
+                   'same name')
 @click.option('--prod', default=True, type=bool, help='target environment for the generated environment. '
                                                       'Default is production')
 @click.option('--no-input', default=False, is_flag=True, help='disables prompt before script runs')
+@click.option('--jobs', default=1, type=click.IntRange(min=1), help='number of data files converted at the same '
+                                                                    'time. Default is 1')
+@click.option('--workers', default=1, type=click.IntRange(min=1), help='number of processes converting the data '
+                                                                       'file in parallel. Default is 1')
+@click.option('--batch-size', 'batch_size', default=0, type=click.IntRange(min=0),
+              help='convert blocks of this many lines with the NumPy batch engine, 1024 converts fastest and larger '
+                   'blocks use more memory. Default is 0, line by line')
+@click.option('--stream', default=False, is_flag=True, help='convert, archive and encrypt in a single pass without '
+                                                            'writing intermediate .jpl and .vad files')
+@click.option('--compression', default=jpl2vad_converter.DEFAULT_CODEC,
+              type=click.Choice(jpl2vad_converter.COMPRESSION_CHOICES),
+              help='codec of the .vad archive. zstd writes a zstd frame instead of a zip archive and needs the '
+                   'zstandard package, auto picks a zip codec from a sample of the data. Default is deflate')
+@click.option('--compact-json', 'compact_json', default=False, is_flag=True,
+              help='write the JSON lines without spaces after separators, with orjson when it is installed')
+@click.option('--raw-json', 'raw_json', default=False, is_flag=True,
+              help='check the values of json columns with a single parse and write their original text, without '
+                   'tabs and line breaks, instead of encoding them again')
+@click.option('--checkpoint-interval', 'checkpoint_interval', default=0, type=click.IntRange(min=0),
+              help='save the position of the conversion after about this many MB of the data file, so it can be '
+                   'resumed with --resume. Default is 0, no checkpoints')
+@click.option('--resume', default=False, is_flag=True, help='continue an interrupted conversion from its last '
+                                                            'checkpoint, or start with checkpoints if there is none')
+@click.option('--validate-only', 'validate_only', default=False, is_flag=True,
+              help='only check the data files and report their errors, without writing any output or using gpg')
+@click.option('--rejects-file', 'rejects_file', default=None, type=click.Path(dir_okay=False),
+              help='write the rows that aren\'t valid to this csv file with their line and error and convert the '
+                   'other rows, instead of stopping at 100 errors. The rows are converted one at a time')
+@click.option('--error-summary', 'error_summary', default=False, is_flag=True,
+              help='skip the rows that aren\'t valid and print how many were rejected for each column and error')
+@click.option('--duplicates', default=duplicates.ALLOW, type=click.Choice(duplicates.POLICIES),
+              help='what to do with records that have the same MEMBER_ID: allow writes them all, error fails the '
+                   'conversion, keep-first and keep-last keep one of them. Default is allow')
+@click.option('--delta-manifest', 'delta_manifest', default=None, type=click.Path(dir_okay=False),
+              help='write only the records that are new or changed since the run that wrote this manifest, which '
+                   'is updated once the .ved file is written. Needs NumPy')
+@click.option('--tombstones', default=False, is_flag=True, help='with --delta-manifest, also write a '
+                                                                '{"_id": ..., "deleted": true} line for each removed '
+                                                                'record')
+@click.option('--pipeline', default=False, is_flag=True,
+              help='read the data file and write the output in threads of their own while the lines are converted, '
+                   'so that slow reads and writes overlap the conversion')
+@click.option('--shard-rows', 'shard_rows', default=0, type=click.IntRange(min=0),
+              help='split the output into .ved shards of this many records, archived and encrypted in parallel and '
+                   'listed in a .shards.json manifest. Default is 0, a single .ved file')
+@click.option('--shard-size', 'shard_size', default=0, type=click.IntRange(min=0),
+              help='split the output into .ved shards of up to this many MB of JSON lines, like --shard-rows')
+@click.option('--profile', default=False, is_flag=True,
+              help='print wall time, CPU time, bytes, rows/s and peak memory of each stage')
+@click.option('--metrics-file', 'metrics_file', default=None, type=click.Path(dir_okay=False),
+              help='write the stage metrics to this file in json format')
+@click.option('--profile-file', 'profile_file', default=None, type=click.Path(dir_okay=False),
+              help='write cProfile stats of the conversion to this file, worker processes are not profiled')
 def csv2ved(**opts):
     _handle_input_prompt(opts)
 
@@ -53,6 +399,42 @@ def csv2ved(**opts):
         click.secho('Invalid format for company ID parameter, aborting', color='red')
         sys.exit(2)
 
+    data_file_names = _data_file_names(opts)
+    if not data_file_names:
+        click.secho('Missing option "--data-file" or "--data-dir", or no file matches "--pattern"', color='red')
+        sys.exit(2)
+
+    zstd_file_names = [name for name in data_file_names
+                       if compressed_input.detect_codec(name) == compressed_input.ZSTD_CODEC]
+    if zstd_file_names and not jpl2vad_converter.zstd_available():
+        click.secho('{} is zstd compressed, reading it needs the zstandard package'.format(zstd_file_names[0]),
+                    color='red')
+        sys.exit(2)
+
+    batch = len(data_file_names) > 1 or opts['data_dir'] is not None
+    options = _conversion_options(opts, batch)
+    error = options.validate()
+    if error:
+        click.secho(error, color='red')
+        sys.exit(2)
+
+    if options.validate_only:
+        _validate_csv2ved(opts, options, _file_names(opts, data_file_names))
+        return
+
+    if not batch:
+        opts['data_file'] = opts['data_file'][0]
+        if compressed_input.detect_codec(opts['data_file'].name):
+            opts['data_file'].close()
+            opts['data_file'] = compressed_input.open_data_file(opts['data_file'].name)
+        if opts['type_file'] is None:
+            try:
+                opts['type_file'] = open(files_converter.type_file_for(opts['data_file'].name))
+            except OSError as err:
+                click.secho('Missing option "--type-file" and no type file for the data file: {}'.format(err),
+                            color='red')
+                sys.exit(2)
+
     gpg_recipients = vad2ved_converter.GPG_PRODUCTION_RECIPIENTS
     gpg_key_data_directory = vad2ved_converter.GPG_PRODUCTION_KEY_DATA_DIRECTORY
     if not opts['prod']:
@@ -68,36 +450,116 @@ def csv2ved(**opts):
         click.secho(init_error, color='red')
         sys.exit(2)
 
-    jpl_file_name, lines, errors = csv2jpl_converter.convert(opts['data_file'], opts['type_file'], opts['company_id'])
-    if errors:
-        click.secho('Errors: ')
-        for error in errors:
-            for line in error:
-                click.secho("line {line}: {error}".format(line=line, error=error[line]))
+    if batch:
+        _batch_csv2ved(opts, options, gpg, gpg_recipients, _file_names(opts, data_file_names))
+        return
+
+    metrics = _create_metrics(opts)
+    try:
+        if options.stream:
+            _stream_csv2ved(opts, options, gpg, gpg_recipients, metrics)
+        else:
+            _files_csv2ved(opts, options, gpg, gpg_recipients, metrics)
+    except OSError as err:
+        # a compressed data file can turn out to be corrupt or truncated while it is converted
+        click.secho(str(err), color='red')
         sys.exit(2)
-    else:
-        click.secho("{} lines written".format(lines))
+    finally:
+        _report_metrics(opts, metrics)
 
-    click.secho('Archiving ...')
-    vad_filename, errors, jpl_bytes, vad_bytes = jpl2vad_converter.convert(jpl_file_name)
-    if errors:
-        click.secho('Errors occurred during compression: {}'.format(errors), color='red')
+
+@click.command('infer-types')
+@click.option('--data-file', 'data_file', required=True, type=click.Path(exists=True, dir_okay=False),
+              help='path to partner data file in csv format, it can be compressed')
+@click.option('--type-file', 'type_file', default=None, type=click.Path(dir_okay=False),
+              help='path of the type file to write. Default is the data file name with a .csvt extension')
+@click.option('--sample-rows', 'sample_rows', default=type_inference.SAMPLE_ROWS, type=click.IntRange(min=1),
+              help='number of rows to sample. Default is {}'.format(type_inference.SAMPLE_ROWS))
+@click.option('--seed', default=None, type=int, help='seed of the random sample, to get the same sample again')
+@click.option('--force', default=False, is_flag=True, help='overwrite the type file if it exists')
+def infer_types(**opts):
+    """Proposes a type file for a data file from a sample of its rows."""
+    type_file_name = opts['type_file'] or files_converter.type_file_for(opts['data_file'])
+    if os.path.exists(type_file_name) and not opts['force']:
+        click.secho('{} exists, use --force to overwrite it'.format(type_file_name), color='red')
         sys.exit(2)
 
-    click.secho('{jpl_file} archived to {vad_file}.'.format(jpl_file=jpl_file_name, vad_file=vad_filename))
-    click.secho('Original file size: {jpl_bytes} bytes.'.format(jpl_bytes=jpl_bytes))
-    click.secho('Compressed file size: {vad_bytes} bytes'. format(vad_bytes=vad_bytes))
+    inference, error = type_inference.infer_types(opts['data_file'], opts['sample_rows'], opts['seed'])
+    if error:
+        click.secho(error, color='red')
+        sys.exit(2)
 
-    click.secho('Encrypting ...')
+    click.secho('Sampled {} rows of {} ({})'.format(inference.rows, opts['data_file'], inference.method))
+    for line in type_inference.summary_lines(inference.columns):
+        click.secho(line)
+    type_inference.write_type_file(type_file_name, inference.columns)
+    click.secho('Type file written to {}'.format(type_file_name))
 
-    ved_filename, status = vad2ved_converter.encrypt(gpg, vad_filename, gpg_recipients)
 
-    if ved_filename is None:
-        click.secho(status, color='red')
+@click.command('verify')
+@click.option('--ved-file', 'ved_files', multiple=True, type=click.Path(exists=True, dir_okay=False),
+              help='path to a .ved file to verify, can be repeated')
+@click.option('--manifest', default=None, type=click.Path(exists=True, dir_okay=False),
+              help='path to a .shards.json manifest, its shards are verified against their checksums in it')
+@click.option('--data-file', 'data_file', default=None, type=click.Path(exists=True, dir_okay=False),
+              help='path to the partner data file the .ved files were converted from, to compare their _ids')
+@click.option('--company-id', 'company_id', default=None, type=str, help='Company ID, needed with --data-file')
+@click.option('--gpg-home', 'gpg_home', default=vad2ved_converter.GPG_HOME_DIRECTORY,
+              type=click.Path(exists=True, file_okay=False),
+              help='gpg home directory with the secret key to decrypt the .ved files, e.g. a local test key')
+def verify(**opts):
+    """Decrypts and decompresses .ved files in memory and checks their records, without writing them to disk."""
+    if not opts['ved_files'] and not opts['manifest']:
+        click.secho('--ved-file or --manifest is required', color='red')
         sys.exit(2)
-    else:
-        click.secho('{vad_file} encrypted to {ved_file}, status: {status}'.format(
-            vad_file=vad_filename, ved_file=ved_filename, status=status.status))
+    if opts['data_file'] and not (opts['company_id'] and validate_company_cmd_line_parameter(opts['company_id'])):
+        click.secho('--data-file needs a valid --company-id', color='red')
+        sys.exit(2)
+    gpg_binary = vad2ved_converter.get_gpg_binary()
+    if gpg_binary is False:
+        click.secho('gpg binary not found, it might not be running on the machine', color='red')
+        sys.exit(2)
+
+    verifications = [verifier.verify_ved(gpg_binary, opts['gpg_home'], ved_file) for ved_file in opts['ved_files']]
+    if opts['manifest']:
+        try:
+            verifications += verifier.verify_shards(gpg_binary, opts['gpg_home'], opts['manifest'])
+        except (OSError, ValueError, KeyError) as err:
+            click.secho('{} is not a valid shard manifest: {}'.format(opts['manifest'], err), color='red')
+            sys.exit(2)
+
+    failed = False
+    for verification in verifications:
+        if verification.error:
+            failed = True
+            click.secho('{}: {}'.format(verification.ved_file, verification.error), color='red')
+        else:
+            click.secho('{}: {} records, {} deleted, {} bytes of JSON lines, sha256 {}'.format(
+                verification.ved_file, verification.rows, verification.deleted, verification.jpl_bytes,
+                verification.jpl_sha256))
+
+    if opts['data_file'] and not failed:
+        try:
+            data_file_ids, error = verifier.data_file_ids(opts['data_file'], opts['company_id'])
+        except OSError as err:
+            data_file_ids, error = None, str(err)
+        if error:
+            click.secho(error, color='red')
+            sys.exit(2)
+        rows = sum(verification.rows for verification in verifications)
+        if rows == data_file_ids.rows and verifier.combined_id_digest(verifications) == data_file_ids.id_digest:
+            click.secho('The _ids of the {} records match {}'.format(rows, opts['data_file']))
+        else:
+            failed = True
+            click.secho('The _ids of the {} records do not match the {} rows of {}'.format(
+                rows, data_file_ids.rows, opts['data_file']), color='red')
+
+    if failed:
+        sys.exit(2)
+
+
+csv2ved.add_command(infer_types)
+csv2ved.add_command(verify)
 
 
 if __name__ == '__main__':
@@ -1,5 +1,5 @@
 import json
-from dateutil.parser import parse
+from csv2ved.date_parser import parse_datetime_value
 
 
 def _is_integer(data):
@@ -16,12 +16,7 @@ def _is_bool(data):
 
 
 def _is_date(data):
-    try:
-        int(data)
-    except ValueError:
-        parse(data)
-    else:
-        raise ValueError
+    parse_datetime_value(data)
 
 
 class ValidateCsvTypes(object):
@@ -0,0 +1,59 @@
+import datetime
+import functools
+import re
+
+from dateutil.parser import parse
+
+DATE_CACHE_SIZE = 4096
+
+ISO_DATETIME_PATTERN = re.compile(
+    r'([0-9]{4})-([0-9]{2})-([0-9]{2})'
+    r'(?:[T ]([0-9]{2}):([0-9]{2})(?::([0-9]{2})(?:\.([0-9]{1,6}))?)?(Z|[+-][0-9]{2}:[0-9]{2})?)?\Z'
+)
+
+
+def _parse_iso_timezone(data):
+    if data is None:
+        return None
+    if data == 'Z':
+        return datetime.timezone.utc
+    offset = datetime.timedelta(hours=int(data[1:3]), minutes=int(data[4:6]))
+    return datetime.timezone(-offset if data[0] == '-' else offset)
+
+
+def parse_iso_datetime(data):
+    """
+    Strict parser for the ISO 8601 layouts partners use, returns None for anything else
+    so the caller can fall back to dateutil.
+    """
+    match = ISO_DATETIME_PATTERN.match(data)
+    if match is None:
+        return None
+
+    year, month, day, hour, minute, second, fraction, timezone = match.groups()
+    try:
+        return datetime.datetime(
+            int(year), int(month), int(day),
+            int(hour or 0), int(minute or 0), int(second or 0), int((fraction or '0').ljust(6, '0')),
+            tzinfo=_parse_iso_timezone(timezone)
+        )
+    except ValueError:
+        return None
+
+
+def parse_datetime_value(data):
+    parsed = parse_iso_datetime(data)
+    if parsed is not None:
+        return parsed
+
+    try:
+        int(data)
+    except ValueError:
+        return parse(data)
+    else:
+        raise ValueError
+
+
+def cached(parser, maxsize=DATE_CACHE_SIZE):
+    """Wraps a date parser in its own bounded LRU cache, invalid values are never cached"""
+    return functools.lru_cache(maxsize=maxsize)(parser)
@@ -0,0 +1,183 @@
+import collections
+import hashlib
+import os
+import shutil
+import struct
+import tempfile
+
+from csv2ved.record_encoder import id_token
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MANIFEST_MAGIC = b'CSV2VEDM'
+MANIFEST_VERSION = 1
+MANIFEST_HEADER = struct.Struct('<8sIIQ')
+COMPACT_FLAG = 1
+RAW_JSON_FLAG = 2
+BLOCK_SIZE = 16384
+
+# the manifest records are sorted by key, the hash of the record _id, and point to the _id in the ids section
+RECORD_FIELDS = [('key', '<u8'), ('content', '<u8'), ('id_offset', '<u8'), ('id_length', '<u8')]
+
+
+def _hash(data):
+    return hashlib.blake2b(data, digest_size=8).digest()
+
+
+class DeltaFilter(object):
+    """
+    Writes only the JSON lines that are new or changed since the run that wrote the manifest, and tombstones
+    for the records that are gone if tombstones is set.
+
+    The manifest is a sorted array of fixed size records with the 64 bit hashes of each _id and line, which
+    is memory mapped and searched a block of lines at a time. The manifest of this run is written next to it
+    with a .new extension and replaces it on commit(), once the output has been delivered, or is removed by
+    discard() if it isn't. written is the number of lines written to the output, tombstones included.
+    """
+
+    def __init__(self, manifest_file_name, tombstones=False, compact=False, raw_json=False):
+        self.manifest_file_name = manifest_file_name
+        self.new_manifest_file_name = manifest_file_name + '.new'
+        self.tombstones = tombstones
+        self.compact = compact
+        self.raw_json = raw_json
+        self.stats = collections.OrderedDict([('new', 0), ('changed', 0), ('unchanged', 0), ('removed', 0)])
+        self.written = 0
+        self.record_dtype = numpy.dtype(RECORD_FIELDS)
+        self.previous_records = numpy.zeros(0, self.record_dtype)
+        self.previous_ids = numpy.zeros(0, 'u1')
+        self.output_file = None
+        self.pending = []
+
+    def load(self):
+        """Maps the manifest of the previous run if there is one, returns an error or an empty string"""
+        if not os.path.exists(self.manifest_file_name):
+            return ""
+        try:
+            with open(self.manifest_file_name, 'rb') as manifest_file:
+                magic, version, flags, count = MANIFEST_HEADER.unpack(manifest_file.read(MANIFEST_HEADER.size))
+        except (OSError, struct.error) as err:
+            return "Delta manifest {} can't be read: {}".format(self.manifest_file_name, err)
+        if magic != MANIFEST_MAGIC or version != MANIFEST_VERSION:
+            return "{} is not a delta manifest".format(self.manifest_file_name)
+        if bool(flags & COMPACT_FLAG) != self.compact:
+            return "Delta manifest {} was written {} --compact-json".format(
+                self.manifest_file_name, 'with' if flags & COMPACT_FLAG else 'without')
+        if bool(flags & RAW_JSON_FLAG) != self.raw_json:
+            return "Delta manifest {} was written {} --raw-json".format(
+                self.manifest_file_name, 'with' if flags & RAW_JSON_FLAG else 'without')
+
+        ids_offset = MANIFEST_HEADER.size + count * self.record_dtype.itemsize
+        if count:
+            self.previous_records = numpy.memmap(self.manifest_file_name, self.record_dtype, 'r',
+                                                 offset=MANIFEST_HEADER.size, shape=(count,))
+        if os.path.getsize(self.manifest_file_name) > ids_offset:
+            self.previous_ids = numpy.memmap(self.manifest_file_name, 'u1', 'r', offset=ids_offset)
+        return ""
+
+    def start(self, output_file):
+        self.output_file = output_file
+        directory = os.path.dirname(os.path.abspath(self.manifest_file_name))
+        self.records_file = tempfile.TemporaryFile(dir=directory)
+        self.ids_file = tempfile.TemporaryFile(dir=directory)
+        self.ids_size = 0
+        self.count = 0
+
+    def write(self, text):
+        """Takes one or more whole JSON lines, each followed by a newline"""
+        self.pending.append(text)
+        if len(self.pending) >= BLOCK_SIZE or len(text) > BLOCK_SIZE:
+            self._filter_pending()
+
+    def _find(self, sorted_keys, keys):
+        # returns the position of each key in sorted_keys and whether it was found there
+        if not len(sorted_keys):
+            return numpy.zeros(len(keys), 'i8'), numpy.zeros(len(keys), bool)
+        positions = numpy.minimum(numpy.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+        return positions, sorted_keys[positions] == keys
+
+    def _filter_pending(self):
+        lines = ''.join(self.pending).split('\n')[:-1]
+        self.pending = []
+        if not lines:
+            return
+
+        ids = [id_token(line).encode() for line in lines]
+        keys = numpy.frombuffer(b''.join([_hash(_id) for _id in ids]), '<u8')
+        contents = numpy.frombuffer(b''.join([_hash(line.encode()) for line in lines]), '<u8')
+        positions, found = self._find(self.previous_records['key'], keys)
+        unchanged = found & (self.previous_records['content'][positions] == contents) if found.any() else found
+
+        self.output_file.write(''.join([line + '\n' for line, skip in zip(lines, unchanged) if not skip]))
+        self.stats['new'] += int((~found).sum())
+        self.stats['changed'] += int((found & ~unchanged).sum())
+        self.stats['unchanged'] += int(unchanged.sum())
+        self.written += len(lines) - int(unchanged.sum())
+
+        records = numpy.empty(len(lines), self.record_dtype)
+        records['key'] = keys
+        records['content'] = contents
+        records['id_length'] = [len(_id) for _id in ids]
+        records['id_offset'] = self.ids_size + numpy.cumsum(records['id_length']) - records['id_length']
+        self.records_file.write(records.tobytes())
+        self.ids_file.write(b''.join(ids))
+        self.ids_size += int(records['id_length'].sum())
+        self.count += len(lines)
+
+    def _write_tombstones(self, new_keys):
+        removed = []
+        for start in range(0, len(self.previous_records), BLOCK_SIZE):
+            previous = numpy.array(self.previous_records[start:start + BLOCK_SIZE])
+            _, found = self._find(new_keys, previous['key'])
+            removed.append(previous[~found])
+        removed = numpy.concatenate(removed) if removed else numpy.zeros(0, self.record_dtype)
+        self.stats['removed'] = len(removed)
+        if not self.tombstones or not len(removed):
+            return
+
+        # in the order of the previous run
+        removed.sort(order='id_offset')
+        item_separator, key_separator = (',', ':') if self.compact else (', ', ': ')
+        tombstone_start = '{"_id"' + key_separator
+        tombstone_end = item_separator + '"deleted"' + key_separator + 'true}\n'
+        for start in range(0, len(removed), BLOCK_SIZE):
+            block = removed[start:start + BLOCK_SIZE]
+            self.output_file.write(''.join([
+                tombstone_start + bytes(self.previous_ids[offset:offset + length]).decode() + tombstone_end
+                for offset, length in zip(block['id_offset'].tolist(), block['id_length'].tolist())]))
+        self.written += len(removed)
+
+    def finish(self):
+        """Writes the pending lines and the tombstones, and the manifest of this run to the .new file"""
+        self._filter_pending()
+        self.records_file.flush()
+        if self.count:
+            records = numpy.memmap(self.records_file, self.record_dtype, 'r', shape=(self.count,))
+        else:
+            records = numpy.zeros(0, self.record_dtype)
+        order = numpy.argsort(records['key'], kind='stable')
+        new_keys = records['key'][order]
+        self._write_tombstones(new_keys)
+
+        flags = (COMPACT_FLAG if self.compact else 0) | (RAW_JSON_FLAG if self.raw_json else 0)
+        with open(self.new_manifest_file_name, 'wb') as manifest_file:
+            manifest_file.write(MANIFEST_HEADER.pack(MANIFEST_MAGIC, MANIFEST_VERSION, flags, self.count))
+            for start in range(0, self.count, BLOCK_SIZE):
+                manifest_file.write(records[order[start:start + BLOCK_SIZE]].tobytes())
+            self.ids_file.seek(0)
+            shutil.copyfileobj(self.ids_file, manifest_file)
+        del records
+        self.records_file.close()
+        self.ids_file.close()
+
+    def commit(self):
+        """Replaces the manifest of the previous run with the manifest of this run"""
+        os.replace(self.new_manifest_file_name, self.manifest_file_name)
+
+    def discard(self):
+        """Removes the manifest of this run if it wasn't committed, the manifest of the previous run is kept"""
+        if os.path.exists(self.new_manifest_file_name):
+            os.remove(self.new_manifest_file_name)
@@ -0,0 +1,115 @@
+import array
+import hashlib
+import os
+
+from csv2ved.record_encoder import id_token
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+ALLOW = 'allow'
+ERROR = 'error'
+KEEP_FIRST = 'keep-first'
+KEEP_LAST = 'keep-last'
+POLICIES = [ALLOW, ERROR, KEEP_FIRST, KEEP_LAST]
+
+DIGEST_SIZE = 16
+
+
+def numpy_available():
+    return numpy is not None
+
+
+def _hash(data):
+    # 128 bits, two different ids with the same hash are unlikely enough to be treated as the same id
+    return hashlib.blake2b(data, digest_size=DIGEST_SIZE).digest()
+
+
+class DuplicateDetector(object):
+    """
+    Finds the records that have the same _id. The _id of each record is kept as a 128 bit hash in a packed
+    array next to its line number, the hashes are sorted with NumPy to find the duplicates once every record is
+    added.
+
+    With the error policy each duplicate is an error. keep-first and keep-last keep the first or the last
+    record of each _id, the others have to be removed from the output with remove_records.
+    """
+
+    def __init__(self, policy=ERROR):
+        self.policy = policy
+        self.digests = bytearray()
+        self.lines = array.array('Q')
+        self.duplicates = []
+
+    def add(self, json_line, line):
+        self.digests += _hash(id_token(json_line).encode())
+        self.lines.append(line)
+
+    def add_lines(self, output, lines):
+        """Adds the records of output, which has a JSON line followed by a newline for each number in lines"""
+        self.digests += b''.join([_hash(id_token(json_line).encode()) for json_line in output.split('\n')[:-1]])
+        self.lines.extend(lines)
+
+    def _sorted_duplicates(self):
+        # returns the positions of the records sorted by hash and the indexes in that order of the records that
+        # have the same hash as the next one, records with the same hash stay in the order they were added
+        digests = numpy.frombuffer(self.digests, dtype=[('high', '>u8'), ('low', '>u8')])
+        order = numpy.lexsort((digests['low'], digests['high']))
+        high, low = digests['high'][order], digests['low'][order]
+        same = (high[1:] == high[:-1]) & (low[1:] == low[:-1])
+        return order, numpy.flatnonzero(same).tolist()
+
+    def _groups(self):
+        order, indexes = self._sorted_duplicates()
+        group = []
+        last_index = None
+        for index in indexes:
+            if group and index == last_index + 1:
+                group.append(int(order[index + 1]))
+            else:
+                if group:
+                    yield group
+                group = [int(order[index]), int(order[index + 1])]
+            last_index = index
+        if group:
+            yield group
+
+    def find(self):
+        """
+        Sets duplicates to the sorted (line, line of the kept record) pairs of each record that isn't kept, the
+        first record of each _id is the one kept for the error policy. Returns the sorted positions of the
+        records that aren't kept, in the order they were added.
+        """
+        self.duplicates = []
+        removed = []
+        for group in self._groups():
+            kept = group[-1] if self.policy == KEEP_LAST else group[0]
+            for position in group:
+                if position != kept:
+                    self.duplicates.append((self.lines[position], self.lines[kept]))
+                    removed.append(position)
+        self.duplicates.sort()
+        return sorted(removed)
+
+
+def add_duplicate_errors(error_lines, duplicates, max_number_of_errors):
+    """Returns error_lines with an error for each duplicate, in line order and up to max_number_of_errors"""
+    error_lines = error_lines + [{line: "Duplicate MEMBER_ID, first seen on line {}".format(first_line)}
+                                 for line, first_line in duplicates]
+    error_lines.sort(key=lambda error_line: next(iter(error_line)))
+    return error_lines[:max_number_of_errors]
+
+
+def remove_records(jpl_file_name, positions):
+    """Rewrites the .jpl file without the lines at the sorted positions"""
+    positions = iter(positions)
+    next_position = next(positions, None)
+    with open(jpl_file_name) as jpl_file, open(jpl_file_name + '.tmp', 'w') as output_file:
+        for position, line in enumerate(jpl_file):
+            if position == next_position:
+                next_position = next(positions, None)
+                continue
+            output_file.write(line)
+    os.replace(jpl_file_name + '.tmp', jpl_file_name)
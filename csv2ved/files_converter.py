@@ -0,0 +1,111 @@
+import collections
+import fnmatch
+import multiprocessing
+import os
+import time
+
+from csv2ved import compressed_input
+from csv2ved import csv2jpl_converter
+from csv2ved import duplicates
+from csv2ved import jpl2vad_converter
+from csv2ved import stream_converter
+from csv2ved import vad2ved_converter
+from csv2ved.conversion_options import DEFAULT_OPTIONS
+
+TYPE_FILE_EXTENSION = '.csvt'
+
+FileResult = collections.namedtuple('FileResult', ['data_file', 'ved_file', 'lines', 'errors', 'seconds', 'message'])
+
+# per process state of the pool workers, set once by _init_worker
+_worker = {}
+
+
+def find_data_files(data_dir, pattern):
+    """Returns the sorted paths of the files in data_dir whose names match the glob pattern"""
+    return sorted(os.path.join(data_dir, name) for name in os.listdir(data_dir)
+                  if fnmatch.fnmatch(name, pattern) and os.path.isfile(os.path.join(data_dir, name)))
+
+
+def type_file_for(data_file_name):
+    """Returns the per file type file of a data file, data.csv and data.csv.gz are described by data.csvt"""
+    return os.path.splitext(compressed_input.strip_extension(data_file_name))[0] + TYPE_FILE_EXTENSION
+
+
+def _duplicate_detector(policy):
+    return None if policy == duplicates.ALLOW else duplicates.DuplicateDetector(policy)
+
+
+def _convert_to_ved(gpg, data_file, type_file, company_id, recipients, options, duplicate_detector):
+    jpl_file_name, lines, errors = csv2jpl_converter.convert(data_file, type_file, company_id, options=options,
+                                                             duplicate_detector=duplicate_detector)
+    if errors:
+        return None, lines, errors, 'Conversion failed'
+
+    vad_file_name, error, _, _ = jpl2vad_converter.convert(jpl_file_name, options.compression)
+    if error:
+        return None, lines, errors, error
+
+    ved_file_name, status = vad2ved_converter.encrypt(gpg, vad_file_name, recipients)
+    if ved_file_name is None:
+        return None, lines, errors, status
+    return ved_file_name, lines, errors, status.status
+
+
+def convert_file(gpg, data_file_name, type_file_name, company_id, recipients, options=DEFAULT_OPTIONS):
+    """
+    Converts, archives and encrypts one data file as set in a ConversionOptions, in a single pass with
+    options.stream, and returns its FileResult
+    """
+    start = time.perf_counter()
+    duplicate_detector = _duplicate_detector(options.duplicates)
+    try:
+        with compressed_input.open_data_file(data_file_name) as data_file, open(type_file_name) as type_file:
+            if options.stream:
+                ved_file_name, lines, errors, status = stream_converter.convert(
+                    gpg, data_file, type_file, company_id, recipients, options=options,
+                    duplicate_detector=duplicate_detector)
+                message = status.status if ved_file_name else status or 'Conversion failed'
+            else:
+                ved_file_name, lines, errors, message = _convert_to_ved(
+                    gpg, data_file, type_file, company_id, recipients, options, duplicate_detector)
+    except OSError as err:
+        ved_file_name, lines, errors, message = None, 0, [], str(err)
+    if ved_file_name and duplicate_detector is not None and duplicate_detector.duplicates:
+        message = '{}, {} duplicates left out'.format(message, len(duplicate_detector.duplicates))
+    return FileResult(data_file_name, ved_file_name, lines, errors, time.perf_counter() - start, message)
+
+
+def _init_worker(gpg):
+    _worker['gpg'] = gpg
+
+
+def _convert_file_in_worker(arguments):
+    return convert_file(_worker['gpg'], *arguments)
+
+
+def convert_files(gpg, file_names, company_id, recipients, jobs=1, options=DEFAULT_OPTIONS):
+    """
+    Converts each (data file name, type file name) pair with the same gpg instance and returns the FileResults
+    in the same order.
+
+    With more than one job the files are converted concurrently in a pool of that many processes. Pool
+    processes can't start processes of their own, so each file is then converted by a single worker.
+    """
+    if jobs == 1 or len(file_names) == 1:
+        return [convert_file(gpg, data_file_name, type_file_name, company_id, recipients, options)
+                for data_file_name, type_file_name in file_names]
+
+    tasks = [(data_file_name, type_file_name, company_id, recipients, options._replace(workers=1))
+             for data_file_name, type_file_name in file_names]
+    with multiprocessing.Pool(min(jobs, len(tasks)), initializer=_init_worker, initargs=(gpg,)) as pool:
+        return pool.map(_convert_file_in_worker, tasks, chunksize=1)
+
+
+def format_summary(results):
+    """Returns the lines of a table with the rows, errors and seconds of each file"""
+    header = ('file', 'status', 'rows', 'errors', 'seconds', 'output')
+    rows = [(result.data_file, 'ok' if result.ved_file else 'failed', str(result.lines), str(len(result.errors)),
+             '{:.2f}'.format(result.seconds), result.ved_file or result.message or '')
+            for result in results]
+    widths = [max(len(row[column]) for row in [header] + rows) for column in range(len(header))]
+    return ['  '.join(value.ljust(width) for value, width in zip(row, widths)).rstrip() for row in [header] + rows]
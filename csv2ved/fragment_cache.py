@@ -0,0 +1,47 @@
+CACHE_SIZE = 1024
+# a column is checked after every WINDOW values, it stops being cached if more than DISTINCT_LIMIT of them missed
+WINDOW = 4096
+DISTINCT_LIMIT = 256
+
+
+class FragmentCache(object):
+    """
+    Bounded cache of the encoded JSON fragment of each raw value of a column. Once it is full the oldest
+    fragment is evicted. A column with too many distinct values stops being cached, get then always returns
+    None and add does nothing, so its values go back to being converted and encoded one at a time.
+    """
+
+    def __init__(self, size=CACHE_SIZE, window=WINDOW, distinct_limit=DISTINCT_LIMIT):
+        self.size = size
+        self.window = window
+        self.distinct_limit = distinct_limit
+        self.active = True
+        self.fragments = {}
+        self.lookups = 0
+        self.misses = 0
+
+    def get(self, value):
+        fragment = self.fragments.get(value)
+        if fragment is not None:
+            self.lookups += 1
+            if self.lookups >= self.window:
+                self._check()
+        return fragment
+
+    def add(self, value, fragment):
+        if not self.active:
+            return
+        if len(self.fragments) >= self.size:
+            del self.fragments[next(iter(self.fragments))]
+        self.fragments[value] = fragment
+        self.lookups += 1
+        self.misses += 1
+        if self.lookups >= self.window:
+            self._check()
+
+    def _check(self):
+        if self.misses > self.distinct_limit:
+            self.active = False
+            self.fragments = {}
+        self.lookups = 0
+        self.misses = 0
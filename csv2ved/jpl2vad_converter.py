@@ -1,34 +1,187 @@
+import bz2
+import collections
+import contextlib
+import lzma
 import os
+import time
 import zipfile
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 JPL_FILENAME_IN_ARCHIVE = 'data.jpl'
 
+DEFAULT_CODEC = 'deflate'
+AUTO_CODEC = 'auto'
+ZSTD_CODEC = 'zstd'
+ZSTD_LEVEL = 3
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# zip entry compression and level of each codec, a None level is the codec's default
+ZIP_CODECS = collections.OrderedDict([(DEFAULT_CODEC, (zipfile.ZIP_DEFLATED, None))])
+ZIP_CODECS.update(('deflate-{}'.format(level), (zipfile.ZIP_DEFLATED, level)) for level in range(1, 10))
+ZIP_CODECS.update([('bzip2', (zipfile.ZIP_BZIP2, None)), ('lzma', (zipfile.ZIP_LZMA, None))])
+COMPRESSION_CHOICES = list(ZIP_CODECS) + [ZSTD_CODEC, AUTO_CODEC]
+
+# auto compresses the start of the JPL file with each candidate and picks the best ratio among the codecs that
+# keep up with AUTO_MIN_THROUGHPUT, or that compress the whole file within AUTO_MAX_SECONDS anyway
+AUTO_CANDIDATES = ['deflate-1', DEFAULT_CODEC, 'deflate-9', 'bzip2', 'lzma']
+AUTO_SAMPLE_SIZE = 4 * 1024 * 1024
+AUTO_MIN_THROUGHPUT = 20 * 1024 * 1024
+AUTO_MAX_SECONDS = 1.0
+
+SAMPLE_COMPRESSORS = {
+    zipfile.ZIP_DEFLATED: lambda data, level: zlib.compress(data, -1 if level is None else level),
+    zipfile.ZIP_BZIP2: lambda data, level: bz2.compress(data, level or 9),
+    zipfile.ZIP_LZMA: lambda data, level: lzma.compress(data)
+}
+
+CODEC_NAMES = {
+    zipfile.ZIP_STORED: 'stored',
+    zipfile.ZIP_DEFLATED: DEFAULT_CODEC,
+    zipfile.ZIP_BZIP2: 'bzip2',
+    zipfile.ZIP_LZMA: 'lzma'
+}
+
+CompressionInfo = collections.namedtuple('CompressionInfo', ['file_size', 'compress_size', 'codec', 'seconds'])
+
+
+def zstd_available():
+    return zstandard is not None
+
 
 def get_compression_info(vad_filename):
+    """Returns the JPL and compressed sizes of a .vad file, or None and None if it can't be read"""
+    compression_info = get_compression_details(vad_filename)
+    return compression_info.file_size, compression_info.compress_size
+
+
+def get_compression_details(vad_filename, codec=None, seconds=None):
+    """
+    Returns the CompressionInfo of a .vad file, its JPL and compressed sizes with its codec and the seconds
+    spent compressing it. The codec is read from the archive when it isn't given, the sizes are None if the
+    file can't be read.
+    """
     try:
+        with open(vad_filename, 'rb') as vad_file:
+            if vad_file.read(len(ZSTD_MAGIC)) == ZSTD_MAGIC:
+                return _get_zstd_compression_info(vad_file, codec, seconds)
         archive = zipfile.ZipFile(vad_filename)
         archive_info = archive.getinfo(JPL_FILENAME_IN_ARCHIVE)
-        return archive_info.file_size, archive_info.compress_size
-    except (OSError, AttributeError):
-        return None, None
+        return CompressionInfo(archive_info.file_size, archive_info.compress_size,
+                               codec or CODEC_NAMES.get(archive_info.compress_type), seconds)
+    except (OSError, TypeError, KeyError, zipfile.BadZipFile):
+        return CompressionInfo(None, None, codec, seconds)
+
+
+def _get_zstd_compression_info(vad_file, codec, seconds):
+    vad_file.seek(0)
+    file_size = None
+    if zstandard is not None:
+        content_size = zstandard.frame_content_size(vad_file.read(18))
+        file_size = content_size if content_size >= 0 else None
+    return CompressionInfo(file_size, os.fstat(vad_file.fileno()).st_size, codec or ZSTD_CODEC, seconds)
 
 
-def archive_jpl_data(vad_filename, jpl_filename_for_archive):
+def _zstd_compress_file(vad_filename, jpl_filename):
+    compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+    with open(jpl_filename, 'rb') as jpl_file, open(vad_filename, 'wb') as vad_file:
+        # the JPL size goes into the frame header, so consumers and get_compression_info can read it back
+        compressor.copy_stream(jpl_file, vad_file, size=os.fstat(jpl_file.fileno()).st_size)
+
+
+def archive_jpl_data(vad_filename, jpl_filename_for_archive, codec=DEFAULT_CODEC):
+    """
+    Compresses the JPL file into a .vad zip archive, or into a zstd frame instead of a zip archive with the
+    zstd codec. Returns the .vad file name, or None and the error.
+    """
     try:
-        with zipfile.ZipFile(vad_filename, mode='w', compression=zipfile.ZIP_DEFLATED) as vad_archive:
-                vad_archive.write(jpl_filename_for_archive, arcname=JPL_FILENAME_IN_ARCHIVE)
-                return vad_archive.filename, None
+        if codec == ZSTD_CODEC:
+            if zstandard is None:
+                return None, 'Error compressing {}\nzstd compression needs the zstandard package'.format(
+                    jpl_filename_for_archive)
+            _zstd_compress_file(vad_filename, jpl_filename_for_archive)
+            return vad_filename, None
+
+        compression, level = ZIP_CODECS[codec]
+        with zipfile.ZipFile(vad_filename, mode='w', compression=compression, compresslevel=level) as vad_archive:
+            vad_archive.write(jpl_filename_for_archive, arcname=JPL_FILENAME_IN_ARCHIVE)
+            return vad_archive.filename, None
     except OSError as err:
         if os.path.exists(vad_filename):
             os.remove(vad_filename)
         return None, 'Error compressing {}\n{}'.format(jpl_filename_for_archive, err)
 
 
-def convert(jpl_data_filename):
+def measure_codecs(sample, codecs=None):
+    """Compresses the sample with each codec, returns (codec, compression ratio, bytes per second) tuples"""
+    measures = []
+    for codec in codecs or AUTO_CANDIDATES:
+        compression, level = ZIP_CODECS[codec]
+        start = time.perf_counter()
+        compressed_size = len(SAMPLE_COMPRESSORS[compression](sample, level))
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        measures.append((codec, len(sample) / max(compressed_size, 1), len(sample) / elapsed))
+    return measures
+
+
+def choose_codec(jpl_filename):
+    """Picks a zip codec for the JPL file from how the codecs compress its first AUTO_SAMPLE_SIZE bytes"""
+    with open(jpl_filename, 'rb') as jpl_file:
+        sample = jpl_file.read(AUTO_SAMPLE_SIZE)
+        file_size = os.fstat(jpl_file.fileno()).st_size
+    if not sample:
+        return DEFAULT_CODEC
+
+    measures = measure_codecs(sample)
+    fast_enough = [(ratio, throughput, codec) for codec, ratio, throughput in measures
+                   if throughput >= AUTO_MIN_THROUGHPUT or file_size / throughput <= AUTO_MAX_SECONDS]
+    if fast_enough:
+        return max(fast_enough)[2]
+    return max(measures, key=lambda measure: measure[2])[0]
+
+
+@contextlib.contextmanager
+def archive_stream(vad_stream, codec=DEFAULT_CODEC):
+    """
+    Writes a .vad archive, or a zstd frame with the zstd codec, to a binary stream which doesn't need to be
+    seekable. Yields the writable binary stream of the archived JPL data.
+    """
+    if codec == ZSTD_CODEC:
+        if zstandard is None:
+            raise OSError('zstd compression needs the zstandard package')
+        with zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(vad_stream, closefd=False) as jpl_stream:
+            yield jpl_stream
+        return
+
+    compression, level = ZIP_CODECS[codec]
+    # the size of the data is unknown up front, zip64 sizes are always used
+    with zipfile.ZipFile(vad_stream, mode='w', compression=compression, compresslevel=level) as vad_archive:
+        with vad_archive.open(JPL_FILENAME_IN_ARCHIVE, mode='w', force_zip64=True) as jpl_stream:
+            yield jpl_stream
+
+
+def convert_with_compression_info(jpl_data_filename, compression=DEFAULT_CODEC):
+    """
+    Archives the JPL file with the compression codec, or with the codec picked by choose_codec for auto,
+    and removes it. Returns the .vad file name, the error and the CompressionInfo.
+    """
     filename_without_extension = os.path.splitext(jpl_data_filename)[0]
     vad_filename = "{}.vad".format(filename_without_extension)
-    archive_filename, errors = archive_jpl_data(vad_filename, jpl_data_filename)
+    start = time.perf_counter()
+    codec = choose_codec(jpl_data_filename) if compression == AUTO_CODEC else compression
+    archive_filename, errors = archive_jpl_data(vad_filename, jpl_data_filename, codec)
     original_jpl_size, vad_compress_size = get_compression_info(archive_filename)
+    compression_info = CompressionInfo(original_jpl_size, vad_compress_size, codec, time.perf_counter() - start)
     if os.path.exists(jpl_data_filename):
         os.remove(jpl_data_filename)
-    return archive_filename, errors, original_jpl_size, vad_compress_size
+    return archive_filename, errors, compression_info
+
+
+def convert(jpl_data_filename, compression=DEFAULT_CODEC):
+    """Archives the JPL file like convert_with_compression_info, returns the file name, error, and JPL and .vad sizes"""
+    archive_filename, errors, compression_info = convert_with_compression_info(jpl_data_filename, compression)
+    return archive_filename, errors, compression_info.file_size, compression_info.compress_size
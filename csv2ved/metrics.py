@@ -0,0 +1,121 @@
+import contextlib
+import cProfile
+import json
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def _cpu_seconds():
+    # includes the worker processes that have already been joined
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def peak_rss():
+    """Returns the peak resident memory in bytes of this process and of its largest finished child process"""
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return {
+        'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+        'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    }
+
+
+class StageMetrics(object):
+    """
+    Records the wall time, CPU time, bytes in and out and rows of each pipeline stage.
+    With a profile_file, the code run under profiled() is profiled and the stats are dumped to that file.
+    """
+
+    def __init__(self, profile_file=None):
+        self.stages = []
+        self.profile_file = profile_file
+
+    @contextlib.contextmanager
+    def stage(self, name, bytes_in=None):
+        """Times the stage, the yielded dict takes the 'bytes_in', 'bytes_out' and 'rows' of the stage"""
+        record = {'stage': name, 'bytes_in': bytes_in, 'bytes_out': None, 'rows': None}
+        wall_start = time.perf_counter()
+        cpu_start = _cpu_seconds()
+        try:
+            yield record
+        finally:
+            record['wall_seconds'] = round(time.perf_counter() - wall_start, 6)
+            record['cpu_seconds'] = round(_cpu_seconds() - cpu_start, 6)
+            self.stages.append(record)
+
+    @contextlib.contextmanager
+    def profiled(self):
+        if self.profile_file is None:
+            yield
+            return
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(self.profile_file)
+
+    def as_dict(self):
+        stages = []
+        for record in self.stages:
+            record = dict(record)
+            seconds = record['wall_seconds']
+            record['rows_per_second'] = round(record['rows'] / seconds, 1) if record['rows'] and seconds else None
+            stages.append(record)
+        return {'stages': stages, 'peak_rss_bytes': peak_rss()}
+
+    def write(self, file_name):
+        with open(file_name, 'w') as metrics_file:
+            json.dump(self.as_dict(), metrics_file, indent=2)
+
+    def report_lines(self):
+        metrics = self.as_dict()
+        lines = []
+        for record in metrics['stages']:
+            line = '{stage}: {wall_seconds:.3f}s wall, {cpu_seconds:.3f}s cpu'.format(**record)
+            if record['bytes_in'] is not None:
+                line += ', {} bytes in'.format(record['bytes_in'])
+            if record['bytes_out'] is not None:
+                line += ', {} bytes out'.format(record['bytes_out'])
+            if record['rows_per_second'] is not None:
+                line += ', {} rows/s'.format(record['rows_per_second'])
+            lines.append(line)
+        if metrics['peak_rss_bytes'] is not None:
+            lines.append('peak memory: {self} bytes, {children} bytes in child processes'.format(
+                **metrics['peak_rss_bytes']))
+        return lines
+
+
+class NullMetrics(object):
+    """Stands in for StageMetrics when nothing is recorded"""
+
+    profile_file = None
+
+    @contextlib.contextmanager
+    def stage(self, name, bytes_in=None):
+        yield {}
+
+    @contextlib.contextmanager
+    def profiled(self):
+        yield
+
+
+NULL_METRICS = NullMetrics()
+
+
+def file_size(file_object):
+    """Returns the size of a regular file, or None for other streams"""
+    try:
+        return os.fstat(file_object.fileno()).st_size
+    except (AttributeError, OSError, ValueError):
+        return None
@@ -0,0 +1,84 @@
+import csv
+import io
+import mmap
+import os
+
+from csv2ved import parallel_converter
+
+BLOCK_SIZE = 1024 * 1024
+
+
+def _block_end(data, start, size):
+    # the end of the last line that ends in the block, or of the first line if it's longer than a block
+    if start + BLOCK_SIZE >= size:
+        return size
+    end = data.rfind(b'\n', start, start + BLOCK_SIZE)
+    if end == -1:
+        end = data.find(b'\n', start + BLOCK_SIZE)
+    return size if end == -1 else end + 1
+
+
+def _record_end(data, start, end, size):
+    # extends the block until it doesn't end inside a quoted field
+    in_quotes = False
+    for line in data[start:end].split(b'\n'):
+        in_quotes = parallel_converter.line_ends_inside_quotes(line, in_quotes)
+    while in_quotes and end < size:
+        line_end = data.find(b'\n', end)
+        line_end = size if line_end == -1 else line_end + 1
+        in_quotes = parallel_converter.line_ends_inside_quotes(data[end:line_end], in_quotes)
+        end = line_end
+    return end
+
+
+def _is_unquoted(block):
+    # without quotes, NUL characters and bare carriage returns a block is split on newlines and delimiters alone
+    if b'"' in block or b'\0' in block:
+        return False
+    return b'\r' not in block or block.count(b'\r') == block.count(b'\r\n')
+
+
+def _split_rows(text):
+    # rows are yielded one by one, a block of row lists would keep the garbage collector busy
+    lines = text.split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    strip = str.strip
+    for line in lines:
+        yield list(map(strip, line.split(','))) if line else []
+
+
+def _parse_rows(text):
+    # universal newlines, the same as the text mode data file
+    csv_reader = csv.reader(io.StringIO(text, newline=None), delimiter=',', quotechar='"')
+    strip = str.strip
+    for line in csv_reader:
+        yield list(map(strip, line))
+
+
+def csv_file_iterator(csv_file):
+    """
+    Yields the same stripped rows as reading the text mode csv_file with csv.reader, from a memory map of
+    the file. Blocks of lines without quotes are split on delimiters and only blocks with a quote are parsed
+    with csv.reader, extended to the end of any quoted record that spans lines. The file must be a regular
+    file in an ASCII compatible encoding, see parallel_converter.can_split.
+    """
+    encoding = csv_file.encoding or 'utf-8'
+    errors = getattr(csv_file, 'errors', None) or 'strict'
+    with csv_file, open(csv_file.name, 'rb') as binary_file:
+        size = os.fstat(binary_file.fileno()).st_size
+        if not size:
+            return
+        with mmap.mmap(binary_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            start = 0
+            while start < size:
+                end = _block_end(data, start, size)
+                block = data[start:end]
+                if _is_unquoted(block):
+                    text = block.decode(encoding, errors)
+                    rows = _split_rows(text.replace('\r\n', '\n') if '\r' in text else text)
+                else:
+                    end = _record_end(data, start, end, size)
+                    rows = _parse_rows(data[start:end].decode(encoding, errors))
+                start = end
+                yield from rows
@@ -0,0 +1,201 @@
+import array
+import collections
+import csv
+import io
+import itertools
+import multiprocessing
+import os
+import re
+
+from csv2ved import batch_converter
+from csv2ved import compressed_input
+from csv2ved.conversion_plan import ConversionPlan
+
+CHUNK_SIZE = 16 * 1024 * 1024
+SCAN_BLOCK_SIZE = 1024 * 1024
+
+# the rest of a quoted field up to its closing quote, quotes inside it are doubled
+QUOTED_FIELD_REST = re.compile(rb'[^"]*(?:""[^"]*)*')
+
+# per process state of the pool workers, set once by _init_worker
+_worker = {}
+
+
+def _segment_ends_inside_quotes(segment, in_quotes):
+    # follows the csv module rules: a quote opens a quoted field only at the start of a field,
+    # anywhere else it is a literal character
+    position = 0
+    while True:
+        if in_quotes:
+            position = QUOTED_FIELD_REST.match(segment, position).end()
+            if position == len(segment):
+                return True
+            in_quotes = False
+            position += 1
+        elif segment[position:position + 1] == b'"':
+            in_quotes = True
+            position += 1
+            continue
+
+        delimiter = segment.find(b',', position)
+        if delimiter == -1:
+            return False
+        position = delimiter + 1
+
+
+def line_ends_inside_quotes(line, in_quotes=False):
+    """Returns True if a csv record is still open at the end of the line"""
+    # a bare carriage return ends the record in universal newlines mode, the same way a newline does
+    for segment in line.rstrip(b'\n').split(b'\r'):
+        in_quotes = _segment_ends_inside_quotes(segment, in_quotes)
+    return in_quotes
+
+
+def find_record_boundaries(data_file_path, chunk_size=None, start=None):
+    """
+    Scans the data file and returns the byte offsets of record boundaries at least chunk_size apart.
+
+    The first offset is the end of the header record, or start if it's given as the offset of an already
+    known boundary, and the last one is the file size. Blocks that contain no quote character are skipped
+    over without looking at individual lines. Returns None if the file doesn't use newline line endings.
+    """
+    chunk_size = chunk_size or CHUNK_SIZE
+    boundaries = []
+    offset = 0
+    in_quotes = False
+    with open(data_file_path, 'rb') as data_file:
+        if start is None:
+            for line in data_file:
+                if b'\r' in line.rstrip(b'\r\n'):
+                    # bare carriage return line endings, the header end can't be found from newlines
+                    return None
+                offset += len(line)
+                in_quotes = line_ends_inside_quotes(line, in_quotes)
+                if not in_quotes:
+                    boundaries.append(offset)
+                    break
+        else:
+            data_file.seek(start)
+            offset = start
+            boundaries.append(offset)
+        next_boundary = offset + chunk_size
+
+        while True:
+            block = data_file.read(SCAN_BLOCK_SIZE)
+            if not block:
+                break
+            block += data_file.readline()
+
+            if in_quotes or b'"' in block:
+                lines = block.split(b'\n')
+                for line in lines[:-1]:
+                    offset += len(line) + 1
+                    in_quotes = line_ends_inside_quotes(line, in_quotes)
+                    if offset >= next_boundary and not in_quotes:
+                        boundaries.append(offset)
+                        next_boundary = offset + chunk_size
+                offset += len(lines[-1])
+            else:
+                offset += len(block)
+                if offset >= next_boundary:
+                    boundaries.append(offset)
+                    next_boundary = offset + chunk_size
+
+    if not boundaries or boundaries[-1] != offset:
+        boundaries.append(offset)
+    return boundaries
+
+
+def can_split(data_file):
+    """Chunks are read by byte offset, which needs a regular uncompressed file in an ASCII compatible encoding"""
+    name = getattr(data_file, 'name', None)
+    if not isinstance(name, str) or not os.path.isfile(name) or compressed_input.detect_codec(name):
+        return False
+    encoding = getattr(data_file, 'encoding', None) or 'utf-8'
+    try:
+        return '\n\r,"'.encode(encoding) == b'\n\r,"'
+    except LookupError:
+        return False
+
+
+def _init_worker(data_file_path, encoding, csv_headers, csv_types, company_id, member_id_name,
+                 max_number_of_errors, options):
+    _worker['data_file_path'] = data_file_path
+    _worker['encoding'] = encoding
+    _worker['plan'] = ConversionPlan(csv_headers, csv_types, company_id, member_id_name, options.compact,
+                                     options.validate_only, options.raw_json)
+    _worker['max_number_of_errors'] = max_number_of_errors
+    _worker['batch_size'] = options.batch_size if batch_converter.numpy_available() else 0
+    if _worker['batch_size']:
+        _worker['batch'] = batch_converter.BatchConverter(_worker['plan'])
+
+
+def _convert_lines(csv_lines):
+    # yields the number and the (json_line, error) result of each non empty line
+    if _worker['batch_size']:
+        for line_numbers, rows, _ in batch_converter.read_blocks(csv_lines, _worker['batch_size']):
+            for result in zip(line_numbers, _worker['batch'].convert_block(rows)):
+                yield result
+    else:
+        conversion_plan = _worker['plan']
+        for current_line, line in enumerate(csv_lines, 1):
+            if line != []:
+                yield current_line, conversion_plan.make_json(line)
+
+
+def _convert_chunk(byte_range):
+    start, end = byte_range
+    with open(_worker['data_file_path'], 'rb') as data_file:
+        data_file.seek(start)
+        text = data_file.read(end - start).decode(_worker['encoding'])
+
+    max_number_of_errors = _worker['max_number_of_errors']
+    csv_reader = csv.reader(io.StringIO(text, newline=None), delimiter=',', quotechar='"')
+    record_counter = itertools.count()
+    csv_lines = ([value.strip() for value in line] for line, _ in zip(csv_reader, record_counter))
+    json_lines = []
+    written_line_numbers = array.array('L')
+    errors = []
+    for current_line, (json_line, error) in _convert_lines(csv_lines):
+        if json_line:
+            json_lines.append(json_line)
+            written_line_numbers.append(current_line)
+        else:
+            errors.append((current_line, error, len(json_lines)))
+            if len(errors) >= max_number_of_errors:
+                break
+
+    output = "\n".join(json_lines) + "\n" if json_lines else ""
+    return output, len(json_lines), errors, next(record_counter), written_line_numbers
+
+
+def convert_chunks(data_file, boundaries, csv_headers, csv_types, company_id, member_id_name,
+                   max_number_of_errors, options):
+    """
+    Converts the data records between the boundaries from find_record_boundaries in a pool of options.workers
+    processes, or in this process with a single worker.
+
+    Yields (output, number_of_written_lines, errors, number_of_records, written_line_numbers) for each chunk in
+    file order, where errors are (line number relative to the chunk, error, lines written before the error)
+    tuples and written_line_numbers are the line numbers relative to the chunk of the written lines.
+    """
+    byte_ranges = list(zip(boundaries, boundaries[1:]))
+    init_args = (data_file.name, data_file.encoding or 'utf-8', csv_headers, csv_types, company_id,
+                 member_id_name, max_number_of_errors, options)
+    workers = options.workers
+
+    if workers == 1:
+        _init_worker(*init_args)
+        for byte_range in byte_ranges:
+            yield _convert_chunk(byte_range)
+        return
+
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=init_args) as pool:
+        # a bounded window of chunks in flight keeps memory flat when an early chunk is slow
+        pending = collections.deque()
+        for byte_range in byte_ranges:
+            pending.append(pool.apply_async(_convert_chunk, (byte_range,)))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
@@ -0,0 +1,106 @@
+import queue
+import threading
+
+from csv2ved import batch_converter
+
+BLOCK_ROWS = 4096
+QUEUE_SIZE = 8
+WRITE_SIZE = 1024 * 1024
+
+# the last item a stage puts on its queue
+_END = object()
+
+
+class BlockReader(object):
+    """
+    Reads the csv lines in blocks in a thread of its own, up to queue_size blocks ahead of their conversion.
+    Iterating yields the same (line numbers, rows, last line read) blocks as batch_converter.read_blocks,
+    errors reading the lines are raised by the iteration. close stops the thread and closes csv_lines.
+    """
+
+    def __init__(self, csv_lines, block_rows=BLOCK_ROWS, current_line=0, queue_size=QUEUE_SIZE):
+        self.csv_lines = csv_lines
+        self._blocks = queue.Queue(queue_size)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._read, args=(block_rows, current_line), daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        # waits for room on the queue until the reader is stopped
+        while not self._stop.is_set():
+            try:
+                self._blocks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _read(self, block_rows, current_line):
+        try:
+            for block in batch_converter.read_blocks(self.csv_lines, block_rows, current_line):
+                if not self._put(block):
+                    return
+        except Exception as err:
+            self._put(err)
+            return
+        self._put(_END)
+
+    def __iter__(self):
+        while True:
+            item = self._blocks.get()
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.csv_lines.close()
+
+
+class BlockWriter(object):
+    """
+    Writes text to output_file in a thread of its own, joined into writes of about write_size characters.
+    Up to queue_size texts wait to be written. A failed write is raised by the next write or by close.
+    """
+
+    def __init__(self, output_file, write_size=WRITE_SIZE, queue_size=QUEUE_SIZE):
+        self.output_file = output_file
+        self.write_size = write_size
+        self._texts = queue.Queue(queue_size)
+        self._error = None
+        self._thread = threading.Thread(target=self._write, daemon=True)
+        self._thread.start()
+
+    def _flush(self, pending):
+        # after an error the texts are still taken off the queue, so write never blocks
+        if pending and self._error is None:
+            try:
+                self.output_file.write(''.join(pending))
+            except Exception as err:
+                self._error = err
+
+    def _write(self):
+        pending = []
+        size = 0
+        for text in iter(self._texts.get, _END):
+            pending.append(text)
+            size += len(text)
+            if size >= self.write_size:
+                self._flush(pending)
+                pending = []
+                size = 0
+        self._flush(pending)
+
+    def write(self, text):
+        if self._error is not None:
+            raise self._error
+        self._texts.put(text)
+
+    def close(self):
+        self._texts.put(_END)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
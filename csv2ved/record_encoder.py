@@ -0,0 +1,148 @@
+import json
+from json.encoder import encode_basestring_ascii
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DEFAULT_SEPARATORS = (', ', ': ')
+COMPACT_SEPARATORS = (',', ':')
+# floats that json.dumps writes without an exponent, orjson writes those the same way
+ORJSON_FLOAT_MIN = 1e-4
+ORJSON_FLOAT_LIMIT = 1e16
+
+
+def _encode_float(value):
+    # same output as json.dumps, which allows NaN and Infinity
+    if value != value:
+        return 'NaN'
+    if value == float('inf'):
+        return 'Infinity'
+    if value == -float('inf'):
+        return '-Infinity'
+    return float.__repr__(value)
+
+
+_encode_boolean = {True: 'true', False: 'false'}.__getitem__
+
+
+def id_token(json_line):
+    """Returns the encoded _id of a JSON line, the text between the "_id" key and the "augmentedData" key"""
+    start = json_line.index(':') + 1
+    end = json_line.index('"augmentedData"', start)
+    return json_line[start:end].strip(' ,')
+
+
+def _value_encoders(separators, exact, raw_json=False):
+    # raw json values are already encoded, see conversion_plan._raw_json
+    encode_json = str if raw_json else lambda value: json.dumps(value, separators=separators)
+    return {
+        'string': encode_basestring_ascii,
+        'integer': int.__repr__,
+        # repr() differs from json.dumps only for NaN and Infinity, lines that may have them are encoded again
+        'float': _encode_float if exact else float.__repr__,
+        'boolean': _encode_boolean,
+        'date': encode_basestring_ascii,
+        'datetime': encode_basestring_ascii,
+        'json': encode_json
+    }
+
+
+class RecordEncoder(object):
+    """
+    Encodes data records as JSON lines without building a dict per record. The escaped key of each column
+    and its separator are computed once, only the values are encoded per record.
+
+    The output is the same as json.dumps of {"_id": ..., "augmentedData": {...}}, with compact separators if
+    compact is set. Compact records are encoded by orjson when it is installed and it writes the same bytes,
+    records with floats it formats differently, and those it can't encode to the same ASCII, are encoded the same
+    way as without it. With raw_json the values of json columns are their encoded text, and are written as they are.
+    """
+
+    def __init__(self, names, csv_types, compact=False, raw_json=False):
+        separators = COMPACT_SEPARATORS if compact else DEFAULT_SEPARATORS
+        item_separator, key_separator = separators
+        self.names = list(names)
+        self.item_separator = item_separator
+        self.id_fragment = '{' + encode_basestring_ascii('_id') + key_separator
+        self.data_fragment = item_separator + encode_basestring_ascii('augmentedData') + key_separator + '{'
+        self.keys = [encode_basestring_ascii(name) + key_separator for name in self.names]
+        fast_encoders = _value_encoders(separators, exact=False, raw_json=raw_json)
+        exact_encoders = _value_encoders(separators, exact=True, raw_json=raw_json)
+        self.fast_encoders = [fast_encoders.get(csv_type, json.dumps) for csv_type in csv_types]
+        self.exact_encoders = [exact_encoders.get(csv_type, json.dumps) for csv_type in csv_types]
+        self.has_floats = 'float' in csv_types
+        # the floats nested in json values can't be checked without walking them
+        self.use_orjson = compact and orjson is not None and 'json' not in csv_types
+        self.float_indexes = [index for index, csv_type in enumerate(csv_types) if csv_type == 'float']
+
+    def _encode_values(self, _id, values, encoders):
+        encoded_values = self.item_separator.join([key + encode_value(value)
+                                                   for key, encode_value, value in zip(self.keys, encoders, values)
+                                                   if value is not None])
+        return self.id_fragment + encode_basestring_ascii(_id) + self.data_fragment + encoded_values + '}}'
+
+    def _encode_with_orjson(self, _id, values):
+        for index in self.float_indexes:
+            value = values[index]
+            # also false for NaN and Infinity, which orjson writes as null
+            if value is not None and value != 0 and not ORJSON_FLOAT_MIN <= abs(value) < ORJSON_FLOAT_LIMIT:
+                return None
+        augmented_data = {name: value for name, value in zip(self.names, values) if value is not None}
+        try:
+            encoded = orjson.dumps({'_id': _id, 'augmentedData': augmented_data})
+        except TypeError:
+            # integers over 64 bits
+            return None
+        # json.dumps escapes DEL as well as the characters over ASCII
+        return encoded.decode() if encoded.isascii() and b'\x7f' not in encoded else None
+
+    def encode(self, _id, values):
+        """Encodes a record, values are in column order and None for the values that are left out"""
+        if self.use_orjson:
+            line = self._encode_with_orjson(_id, values)
+            if line is not None:
+                return line
+
+        line = self._encode_values(_id, values, self.fast_encoders)
+        if self.has_floats and ('nan' in line or 'inf' in line):
+            line = self._encode_values(_id, values, self.exact_encoders)
+        return line
+
+    def encodes_fragments(self):
+        """Whether records can be encoded from the fragments of their values, orjson encodes whole records"""
+        return not self.use_orjson
+
+    def fragment(self, index, value):
+        """Returns the encoded key and value of the column at index, as encode writes them"""
+        return self.keys[index] + self.exact_encoders[index](value)
+
+    def fragments(self, index, values):
+        """Returns the fragments of the values of the column at index, which can't be left out or NaN or Infinity"""
+        key = self.keys[index]
+        return [key + encoded for encoded in map(self.fast_encoders[index], values)]
+
+    def encode_fragments(self, _id, fragments):
+        """Encodes a record from the fragments of the values that aren't left out, in column order"""
+        return self.id_fragment + encode_basestring_ascii(_id) + self.data_fragment + \
+            self.item_separator.join(fragments) + '}}'
+
+
+class IdOnlyEncoder(RecordEncoder):
+    """Encodes only the _id of a record, with empty data, for runs that validate the records without writing them"""
+
+    def encode(self, _id, values):
+        return self.id_fragment + encode_basestring_ascii(_id) + self.data_fragment + '}}'
+
+    def encodes_fragments(self):
+        return True
+
+    def fragment(self, index, value):
+        return ''
+
+    def fragments(self, index, values):
+        return [''] * len(values)
+
+    def encode_fragments(self, _id, fragments):
+        return self.encode(_id, None)
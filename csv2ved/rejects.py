@@ -0,0 +1,63 @@
+import collections
+import csv
+
+from csv2ved.conversion_plan import FUSED_CONVERTERS
+
+
+class Rejects(object):
+    """
+    Collects the rows that aren't valid instead of failing the conversion. The rejected rows are counted by
+    column and kind of error, and with a rejects_file_name they are written to that csv file with their line
+    number and error. Error messages are only formatted for the rows written to the rejects file.
+    """
+
+    def __init__(self, rejects_file_name=None):
+        self.rejects_file_name = rejects_file_name
+        self.counts = collections.Counter()
+        self.plan = None
+        self.rejects_file = None
+        self.writer = None
+
+    def start(self, plan, csv_headers):
+        self.plan = plan
+        if self.rejects_file_name:
+            self.rejects_file = open(self.rejects_file_name, 'w', newline='')
+            self.writer = csv.writer(self.rejects_file)
+            self.writer.writerow(['line', 'error'] + list(csv_headers))
+
+    def add(self, line, row, rejected):
+        """Adds the row rejected at line, with the (column index, value) from ConversionPlan.check_row"""
+        self.counts[rejected[0], rejected[1] == ""] += 1
+        if self.writer is not None:
+            self.writer.writerow([line, self.plan.error_message(rejected)] + row)
+
+    def close(self):
+        if self.rejects_file is not None:
+            self.rejects_file.close()
+            self.rejects_file = None
+            self.writer = None
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def _column_error(self, index, empty):
+        if index == -1:
+            return '(row)', 'wrong number of values'
+        name, csv_type = self.plan.columns[index][0], self.plan.types[index]
+        if csv_type not in FUSED_CONVERTERS:
+            return name, 'unknown type {}'.format(csv_type)
+        return name, 'empty' if empty else 'invalid {}'.format(csv_type)
+
+    def summary(self):
+        """Returns a (column, error, count) tuple for each kind of error, the most frequent first"""
+        counts = collections.Counter()
+        for (index, empty), count in self.counts.items():
+            counts[self._column_error(index, empty)] += count
+        return [(column, error, count) for (column, error), count in
+                sorted(counts.items(), key=lambda item: (-item[1], item[0]))]
+
+    def summary_lines(self):
+        rows = [('column', 'error', 'rows')] + [(column, error, str(count)) for column, error, count in self.summary()]
+        widths = [max(len(row[column]) for row in rows) for column in range(3)]
+        return ['  '.join(value.ljust(width) for value, width in zip(row, widths)).rstrip() for row in rows]
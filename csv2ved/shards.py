@@ -0,0 +1,175 @@
+import collections
+import hashlib
+import json
+import multiprocessing.pool
+import os
+
+from csv2ved import jpl2vad_converter
+from csv2ved import vad2ved_converter
+
+SHARD_MANIFEST_EXTENSION = '.shards.json'
+COPY_SIZE = 16 * 1024 * 1024
+
+Shard = collections.namedtuple('Shard', ['jpl_file', 'rows', 'jpl_bytes', 'jpl_sha256'])
+ShardResult = collections.namedtuple('ShardResult', ['shard', 'ved_file', 'sha256', 'error'])
+
+
+def shard_file_name(jpl_file_name, number):
+    """Returns the name of a shard of the .jpl file, data_<timestamp>.jpl is split into data_<timestamp>_0001.jpl..."""
+    name, extension = os.path.splitext(jpl_file_name)
+    return '{}_{:04d}{}'.format(name, number, extension)
+
+
+def shard_manifest_file_for(jpl_file_name):
+    """Returns the manifest of the shards of the .jpl file, data_<timestamp>.shards.json"""
+    return os.path.splitext(jpl_file_name)[0] + SHARD_MANIFEST_EXTENSION
+
+
+def file_sha256(file_name):
+    digest = hashlib.sha256()
+    with open(file_name, 'rb') as hashed_file:
+        for block in iter(lambda: hashed_file.read(COPY_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _line_blocks(jpl_file):
+    # blocks of about COPY_SIZE bytes that end at the end of a line
+    for block in iter(lambda: jpl_file.read(COPY_SIZE), b''):
+        if not block.endswith(b'\n'):
+            block += jpl_file.readline()
+        yield block
+
+
+class _ShardWriter(object):
+    # writes the numbered shards of a .jpl file one after the other, hashing them as they are written
+
+    def __init__(self, jpl_file_name):
+        self.jpl_file_name = jpl_file_name
+        self.shards = []
+        self.rows = 0
+        self.size = 0
+        self._file = None
+        self._digest = None
+
+    def write(self, data, rows):
+        if self._file is None:
+            self._file = open(shard_file_name(self.jpl_file_name, len(self.shards) + 1), 'wb')
+            self._digest = hashlib.sha256()
+        self._file.write(data)
+        self._digest.update(data)
+        self.rows += rows
+        self.size += len(data)
+
+    def close_shard(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self.shards.append(Shard(self._file.name, self.rows, self.size, self._digest.hexdigest()))
+        self._file = None
+        self.rows = 0
+        self.size = 0
+
+
+def _shard_end(block, position, writer, shard_rows, shard_bytes):
+    # returns where the current shard ends in the block, or None if the rest of the block fits in it
+    if shard_rows:
+        remaining = shard_rows - writer.rows
+        if block.count(b'\n', position) < remaining:
+            return None
+        end = position
+        for _ in range(remaining):
+            end = block.find(b'\n', end) + 1
+        return end
+
+    available = shard_bytes - writer.size
+    if len(block) - position < available:
+        return None
+    end = block.rfind(b'\n', position, position + available) + 1
+    if end == 0 and not writer.size:
+        # a single line longer than shard_bytes gets a shard of its own
+        end = block.find(b'\n', position) + 1 or len(block)
+    return max(end, position)
+
+
+def split_jpl(jpl_file_name, shard_rows=0, shard_bytes=0):
+    """
+    Splits the .jpl file into shards of shard_rows lines, or of whole lines up to shard_bytes bytes, and
+    removes it. Returns the Shards in order.
+    """
+    writer = _ShardWriter(jpl_file_name)
+    with open(jpl_file_name, 'rb') as jpl_file:
+        for block in _line_blocks(jpl_file):
+            view = memoryview(block)
+            position = 0
+            while position < len(block):
+                end = _shard_end(block, position, writer, shard_rows, shard_bytes)
+                if end is None:
+                    writer.write(view[position:], block.count(b'\n', position))
+                    break
+                if end > position:
+                    writer.write(view[position:end], block.count(b'\n', position, end))
+                writer.close_shard()
+                position = end
+        writer.close_shard()
+    os.remove(jpl_file_name)
+    return writer.shards
+
+
+def _archive_and_encrypt(gpg, shard, recipients, compression):
+    vad_file_name, error, _, _ = jpl2vad_converter.convert(shard.jpl_file, compression)
+    if error:
+        return ShardResult(shard, None, None, error)
+    ved_file_name, status = vad2ved_converter.encrypt(gpg, vad_file_name, recipients)
+    if ved_file_name is None:
+        return ShardResult(shard, None, None, status)
+    return ShardResult(shard, ved_file_name, file_sha256(ved_file_name), None)
+
+
+def convert_shards(gpg, shards, recipients, compression=jpl2vad_converter.DEFAULT_CODEC, jobs=None):
+    """
+    Archives and encrypts each shard into its own .ved file, jobs shards at the same time, one per CPU by
+    default. Returns the ShardResults in order.
+    """
+    jobs = min(jobs or os.cpu_count() or 1, len(shards))
+    if jobs <= 1:
+        return [_archive_and_encrypt(gpg, shard, recipients, compression) for shard in shards]
+    # compression and gpg don't hold the GIL, so threads are enough to run them in parallel
+    with multiprocessing.pool.ThreadPool(jobs) as pool:
+        return pool.map(lambda shard: _archive_and_encrypt(gpg, shard, recipients, compression), shards,
+                        chunksize=1)
+
+
+def remove_shard_outputs(results):
+    """
+    Removes the .ved files of the shards and the .jpl and .vad files left by the ones that failed, so a failed
+    run leaves no partial set of shards behind. Returns the names of the removed files.
+    """
+    removed = []
+    for result in results:
+        jpl_file_name = result.shard.jpl_file
+        vad_file_name = os.path.splitext(jpl_file_name)[0] + '.vad'
+        for file_name in (result.ved_file, vad_file_name, jpl_file_name):
+            if file_name and os.path.exists(file_name):
+                os.remove(file_name)
+                removed.append(file_name)
+    return removed
+
+
+def write_manifest(manifest_file_name, data_file_name, results):
+    """Writes the manifest of the encrypted shards, with the rows and sha256 checksums of each shard"""
+    manifest = {
+        'data_file': os.path.basename(data_file_name),
+        'rows': sum(result.shard.rows for result in results),
+        'shards': [{
+            'file': os.path.basename(result.ved_file),
+            'rows': result.shard.rows,
+            'sha256': result.sha256,
+            'jpl_bytes': result.shard.jpl_bytes,
+            'jpl_sha256': result.shard.jpl_sha256
+        } for result in results]
+    }
+    with open(manifest_file_name + '.tmp', 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    os.replace(manifest_file_name + '.tmp', manifest_file_name)
+    return manifest_file_name
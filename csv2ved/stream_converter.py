@@ -0,0 +1,91 @@
+import io
+import os
+
+from csv2ved import csv2jpl_converter
+from csv2ved import duplicates
+from csv2ved import jpl2vad_converter
+from csv2ved import metrics as stage_metrics
+from csv2ved import vad2ved_converter
+from csv2ved.conversion_options import DEFAULT_OPTIONS
+
+
+def convert(gpg, data_file, type_file, company_id, recipients, max_number_of_errors=100, options=DEFAULT_OPTIONS,
+            metrics=None, duplicate_detector=None, rejects=None):
+    """
+    Converts the data file straight into an encrypted .ved file in a single pass. The JSON lines are
+    compressed into the archive as they are converted and the archive is piped into gpg, so no
+    plaintext .jpl or .vad file is written to disk.
+
+    Returns the .ved file name, the number of written lines, the conversion errors and the encryption
+    status or error message. The .ved file name is None if anything failed.
+    The records are converted as set in a ConversionOptions, and archived with options.compression.
+    Conversion, archiving and encryption run together and are recorded as a single 'stream' stage.
+    Records can't be removed once they are streamed, a duplicate_detector must have the error policy.
+    With a rejects.Rejects the rows that aren't valid are collected by it instead of being errors.
+    """
+    metrics = metrics or stage_metrics.NULL_METRICS
+    current_line = 0
+    number_of_written_lines = 0
+    error_lines = []
+    with metrics.stage('type_load', stage_metrics.file_size(type_file)):
+        csv_types = csv2jpl_converter.get_csv_types(type_file)
+    if not csv_types:
+        error_lines.append({current_line: "Type file is invalid or empty"})
+        return None, number_of_written_lines, error_lines, None
+
+    member_id_name = csv2jpl_converter.get_member_id_name(csv_types)
+    jpl_file_name = csv2jpl_converter.generate_output_file_name(data_file.name)
+    ved_file_name = vad2ved_converter.generate_output_file_name(jpl_file_name)
+
+    csv_lines = csv2jpl_converter.csv_file_iterator(data_file)
+    csv_headers = next(csv_lines, None)
+    if csv_headers is None:
+        csv2jpl_converter.add_data_lines_errors(data_file.name, current_line, number_of_written_lines, error_lines)
+        return None, number_of_written_lines, error_lines, None
+
+    header_error = csv2jpl_converter.validate_headers(csv_headers, csv_types, member_id_name)
+    if header_error:
+        csv_lines.close()
+        error_lines.append({1: header_error})
+        return None, number_of_written_lines, error_lines, None
+
+    try:
+        with metrics.stage('stream', stage_metrics.file_size(data_file)) as record, metrics.profiled():
+            with vad2ved_converter.encrypt_stream(gpg, recipients, ved_file_name) as (vad_stream, encryption):
+                with jpl2vad_converter.archive_stream(vad_stream, options.compression) as jpl_stream:
+                    with io.TextIOWrapper(jpl_stream) as jpl_text:
+                        current_line, number_of_written_lines, error_lines = csv2jpl_converter.write_json_lines(
+                            jpl_text, csv_lines, data_file, csv_headers, csv_types, company_id, member_id_name,
+                            max_number_of_errors, options, duplicate_detector, rejects)
+            record['rows'] = number_of_written_lines
+            if os.path.exists(ved_file_name):
+                record['bytes_out'] = os.path.getsize(ved_file_name)
+    except OSError as err:
+        _remove(ved_file_name)
+        return None, number_of_written_lines, error_lines, 'Error encrypting {}\n{}'.format(data_file.name, err)
+    except BaseException:
+        # e.g. an error of a worker or KeyboardInterrupt, the partial .ved file isn't left behind
+        _remove(ved_file_name)
+        raise
+
+    if duplicate_detector is not None and not error_lines:
+        duplicate_detector.find()
+        error_lines = duplicates.add_duplicate_errors(error_lines, duplicate_detector.duplicates,
+                                                      max_number_of_errors)
+    csv2jpl_converter.add_data_lines_errors(data_file.name, current_line, number_of_written_lines, error_lines)
+    if error_lines:
+        _remove(ved_file_name)
+        return None, number_of_written_lines, error_lines, None
+
+    status = encryption.get('status')
+    if status is None or status.status != 'encryption ok':
+        _remove(ved_file_name)
+        return None, number_of_written_lines, error_lines, 'Error encrypting {}\n{}'.format(
+            data_file.name, status.status if status is not None else 'gpg did not return a status')
+
+    return ved_file_name, number_of_written_lines, error_lines, status
+
+
+def _remove(file_name):
+    if os.path.exists(file_name):
+        os.remove(file_name)
@@ -0,0 +1,166 @@
+import collections
+import csv
+import datetime
+import io
+import itertools
+import math
+import os
+import random
+
+from csv2ved import compressed_input
+from csv2ved import csv2jpl_converter
+from csv2ved.csv_type_validator import ValidateCsvTypes
+from csv2ved.date_parser import parse_datetime_value
+
+SAMPLE_ROWS = 10000
+# files up to SCAN_SIZE bytes and compressed files are read whole, larger ones are sampled at random offsets
+SCAN_SIZE = 64 * 1024 * 1024
+ROWS_PER_SEEK = 20
+SEEK_BLOCK_SIZE = 64 * 1024
+
+SCAN_METHOD = 'reservoir'
+SEEK_METHOD = 'random offsets'
+
+# from the narrowest type to the widest, string accepts any value
+CANDIDATE_TYPES = ['boolean', 'integer', 'float', 'date', 'datetime', 'json', 'string']
+BOOLEAN_WORDS = ['true', 'false']
+
+ColumnType = collections.namedtuple('ColumnType', ['name', 'type', 'values', 'empty', 'max_invalid_share',
+                                                   'ruled_out'])
+Inference = collections.namedtuple('Inference', ['columns', 'rows', 'method'])
+
+
+def _is_valid(csv_type, value):
+    try:
+        valid = ValidateCsvTypes.validate(csv_type, value) == ""
+    except (OverflowError, RecursionError):
+        return False
+    # date and datetime accept the same values, date is only proposed for values without a time
+    if valid and csv_type == 'date':
+        parsed = parse_datetime_value(value)
+        return parsed.time() == datetime.time() and parsed.tzinfo is None
+    return valid
+
+
+def infer_column(name, values, member_id_name=None):
+    """
+    Returns the ColumnType of the narrowest type that accepts every sampled value of the column. ruled_out
+    has a value that rules out each narrower type. A column of only 0 and 1 is an integer rather than a
+    boolean, and the MEMBER_ID column is always a string.
+    """
+    candidates = list(CANDIDATE_TYPES)
+    ruled_out = collections.OrderedDict()
+    boolean_words = False
+    number_of_values = 0
+    for value in values:
+        if value == "":
+            continue
+        number_of_values += 1
+        for csv_type in candidates[:-1]:
+            if not _is_valid(csv_type, value):
+                candidates.remove(csv_type)
+                ruled_out[csv_type] = value
+        boolean_words = boolean_words or value.lower() in BOOLEAN_WORDS
+
+    if not number_of_values:
+        candidates = ['string']
+    if candidates[0] == 'boolean' and not boolean_words and 'integer' in candidates:
+        candidates.remove('boolean')
+        ruled_out['boolean'] = '0 and 1 only'
+    if name == member_id_name and candidates[0] != 'string':
+        ruled_out[candidates[0]] = 'MEMBER_ID is a string'
+        candidates = ['string']
+
+    # rule of three, if none of n sampled values is invalid at most 3/n of all values are at 95% confidence
+    max_invalid_share = None
+    if number_of_values and candidates[0] != 'string':
+        max_invalid_share = min(3.0 / number_of_values, 1.0)
+    ruled_out = [(csv_type, value) for csv_type, value in ruled_out.items()
+                 if CANDIDATE_TYPES.index(csv_type) < CANDIDATE_TYPES.index(candidates[0])]
+    return ColumnType(name, candidates[0], number_of_values, len(values) - number_of_values, max_invalid_share,
+                      ruled_out)
+
+
+def _reservoir_sample(rows, sample_rows, rng):
+    sample = []
+    for number, row in enumerate(rows):
+        if number < sample_rows:
+            sample.append(row)
+        else:
+            index = rng.randrange(number + 1)
+            if index < sample_rows:
+                sample[index] = row
+    return sample
+
+
+def _seek_sample(data_file_name, encoding, number_of_columns, sample_rows, rng):
+    # the rows that follow the line at each offset, rows that don't have number_of_columns values are dropped,
+    # as are the rows read from the middle of a quoted value that spans lines
+    size = os.path.getsize(data_file_name)
+    sample = []
+    with open(data_file_name, 'rb') as data_file:
+        for offset in sorted(rng.randrange(size) for _ in range(math.ceil(sample_rows / ROWS_PER_SEEK))):
+            data_file.seek(offset)
+            block = data_file.read(SEEK_BLOCK_SIZE)
+            start = block.find(b'\n') + 1
+            end = block.rfind(b'\n') + 1
+            if start == 0 or end <= start:
+                continue
+            csv_reader = csv.reader(io.StringIO(block[start:end].decode(encoding, errors='replace'), newline=None),
+                                    delimiter=',', quotechar='"')
+            sample.extend([value.strip() for value in row] for row in itertools.islice(csv_reader, ROWS_PER_SEEK)
+                          if len(row) == number_of_columns)
+    return sample
+
+
+def infer_types(data_file_name, sample_rows=SAMPLE_ROWS, seed=None):
+    """
+    Proposes a type for each column of the data file from a sample of about sample_rows rows, a reservoir
+    sample of the whole file for small and compressed files, or the rows at random offsets of larger files.
+    Returns the Inference, or None and the error.
+    """
+    rng = random.Random(seed)
+    with compressed_input.open_data_file(data_file_name) as data_file:
+        encoding = data_file.encoding
+        csv_lines = csv2jpl_converter.csv_file_iterator(data_file)
+        csv_headers = next(csv_lines, None)
+        if not csv_headers:
+            csv_lines.close()
+            return None, "{} is empty".format(data_file_name)
+
+        seek = compressed_input.detect_codec(data_file_name) is None and \
+            os.path.getsize(data_file_name) > SCAN_SIZE
+        if seek:
+            csv_lines.close()
+            sample = _seek_sample(data_file_name, encoding, len(csv_headers), sample_rows, rng)
+        else:
+            sample = _reservoir_sample((line for line in csv_lines if line != []), sample_rows, rng)
+
+    member_id_name = next((name for name in csv_headers if name.upper() == csv2jpl_converter.MEMBER_ID_COLUMN),
+                          None)
+    columns = [infer_column(name, [row[index] for row in sample if len(row) == len(csv_headers)], member_id_name)
+               for index, name in enumerate(csv_headers)]
+    return Inference(columns, len(sample), SEEK_METHOD if seek else SCAN_METHOD), ""
+
+
+def write_type_file(type_file_name, columns):
+    """Writes the names and types of the columns as a type file"""
+    with open(type_file_name, 'w', newline='') as type_file:
+        writer = csv.writer(type_file, lineterminator='\n')
+        writer.writerow([column.name for column in columns])
+        writer.writerow([column.type for column in columns])
+
+
+def summary_lines(columns):
+    """Returns the lines of a table with the type of each column and how confident it is"""
+    rows = [('column', 'type', 'values', 'empty', 'invalid at most', 'ruled out')]
+    for column in columns:
+        confidence = '' if column.max_invalid_share is None else '{:.2%}'.format(column.max_invalid_share)
+        # the types ruled out by the same value are listed together
+        values = collections.OrderedDict()
+        for csv_type, value in column.ruled_out:
+            values.setdefault(value, []).append(csv_type)
+        ruled_out = ', '.join('{} ({!r})'.format('/'.join(csv_types), value) for value, csv_types in values.items())
+        rows.append((column.name, column.type, str(column.values), str(column.empty), confidence, ruled_out))
+    widths = [max(len(row[index]) for row in rows) for index in range(len(rows[0]))]
+    return ['  '.join(value.ljust(width) for value, width in zip(row, widths)).rstrip() for row in rows]
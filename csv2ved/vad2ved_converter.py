@@ -1,6 +1,12 @@
+import contextlib
+import hashlib
+import json
 import os
+import re
+import shutil
 import gnupg
 import subprocess
+import threading
 
 module_directory = os.path.dirname(os.path.realpath(__file__))
 GPG_HOME_DIRECTORY = os.path.join(module_directory, 'gpghome')
@@ -14,6 +20,12 @@ GPG_NON_PRODUCTION_KEY_DATA_DIRECTORY = [
     os.path.join(module_directory, 'gpg_keys', 'augmented_data_test.asc')
 ]
 
+# gpg binary and keyring index of the last successful init_gpg, kept in the gpg home directory
+KEYRING_CACHE_FILE_NAME = 'keyring_cache.json'
+KEYRING_CACHE_VERSION = 1
+KEYRING_FILE_NAMES = ['pubring.kbx', 'pubring.gpg']
+UID_ADDRESS_PATTERN = re.compile(r'<([^<>]+)>')
+
 
 def get_gpg_binary():
     try:
@@ -27,18 +39,90 @@ def get_gpg_binary():
             return False
 
 
-def public_keys_exist(public_keys, public_key_recipients):
-    found = []
-    for public_key_recipient in public_key_recipients:
-        for key in public_keys:
-            for uid in key['uids']:
-                if "<{}>".format(public_key_recipient) in uid:
-                    found.append(public_key_recipient)
+def build_key_index(public_keys):
+    """Maps the e-mail address of each key uid to the fingerprint of the key"""
+    key_index = {}
+    for key in public_keys:
+        for uid in key['uids']:
+            for address in UID_ADDRESS_PATTERN.findall(uid):
+                key_index.setdefault(address, key.get('fingerprint'))
+    return key_index
+
 
-    if found == public_key_recipients:
+def public_keys_exist(public_keys, public_key_recipients, key_index=None):
+    """Checks there is a key for each recipient, in key_index from build_key_index instead of public_keys if given"""
+    if key_index is None:
+        key_index = build_key_index(public_keys)
+    missing = [recipient for recipient in public_key_recipients if recipient not in key_index]
+    if not missing:
         return True, ""
     else:
-        return False, "missing required public key {}".format(list(set(public_key_recipients).difference(found)))
+        return False, "missing required public key {}".format(list(set(missing)))
+
+
+def _keyring_state(gnupg_home_dir):
+    # any import or key change rewrites the keyring file
+    state = []
+    for file_name in KEYRING_FILE_NAMES:
+        try:
+            file_stat = os.stat(os.path.join(gnupg_home_dir, file_name))
+        except OSError:
+            continue
+        state.append([file_name, file_stat.st_mtime_ns, file_stat.st_size])
+    return state
+
+
+def _key_files_digest(public_key_files):
+    digest = hashlib.sha256()
+    try:
+        for file in public_key_files or []:
+            with open(file, 'rb') as key_file:
+                digest.update(hashlib.sha256(key_file.read()).digest())
+    except (OSError, TypeError):
+        return None
+    return digest.hexdigest()
+
+
+def load_keyring_cache(gnupg_home_dir):
+    try:
+        with open(os.path.join(gnupg_home_dir, KEYRING_CACHE_FILE_NAME)) as cache_file:
+            cache = json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(cache, dict) or cache.get('version') != KEYRING_CACHE_VERSION:
+        return {}
+    return cache
+
+
+def save_keyring_cache(gnupg_home_dir, cache):
+    cache['version'] = KEYRING_CACHE_VERSION
+    cache_file_name = os.path.join(gnupg_home_dir, KEYRING_CACHE_FILE_NAME)
+    try:
+        with open(cache_file_name + '.tmp', 'w') as cache_file:
+            json.dump(cache, cache_file)
+        os.replace(cache_file_name + '.tmp', cache_file_name)
+    except OSError:
+        # the cache only saves time, a read only gpg home directory still works
+        pass
+
+
+def _binary_state(gpg_binary):
+    path = shutil.which(gpg_binary)
+    if path is None:
+        return None
+    return [path, os.stat(path).st_mtime_ns]
+
+
+def get_cached_gpg_binary(cache):
+    """Returns the cached gpg binary if it's still installed, or detects it and caches it"""
+    cached_binary = cache.get('gpg_binary')
+    if cached_binary and _binary_state(cached_binary['name']) == cached_binary['state']:
+        return cached_binary['name']
+
+    gpg_binary = get_gpg_binary()
+    if isinstance(gpg_binary, str) and _binary_state(gpg_binary):
+        cache['gpg_binary'] = {'name': gpg_binary, 'state': _binary_state(gpg_binary)}
+    return gpg_binary
 
 
 def import_keys(gpg, key_files):
@@ -52,8 +136,14 @@ def import_keys(gpg, key_files):
 
 
 def init_gpg(gnupg_home_dir, key_recipients, public_key_files=None):
-
-    gpg_binary = get_gpg_binary()
+    """
+    Returns a gpg instance with the public keys imported and checked, or False and the error.
+
+    The keys are imported and listed only when the key files or the keyring have changed since the last
+    successful call, otherwise the recipients are checked against the key index cached in the gpg home directory.
+    """
+    cache = load_keyring_cache(gnupg_home_dir)
+    gpg_binary = get_cached_gpg_binary(cache)
     if gpg_binary is False:
         return False, "gpg binary not found, it might not be running on the machine"
 
@@ -64,16 +154,27 @@ def init_gpg(gnupg_home_dir, key_recipients, public_key_files=None):
     except ValueError as e:
         return False, str(e)
 
-    if public_key_files:
-        result, error = import_keys(gpg, public_key_files)
-        if error:
-            return result, error
-
-    public_keys = gpg.list_keys(keys=key_recipients)
-    result, error = public_keys_exist(public_keys, key_recipients)
+    key_files_digest = _key_files_digest(public_key_files)
+    cached_keyring = cache.get('keyrings', {}).get(key_files_digest)
+    if cached_keyring and cached_keyring['state'] == _keyring_state(gnupg_home_dir):
+        key_index = cached_keyring['index']
+    else:
+        if public_key_files:
+            result, error = import_keys(gpg, public_key_files)
+            if error:
+                return result, error
+        key_index = build_key_index(gpg.list_keys())
+        if key_files_digest is not None:
+            cache.setdefault('keyrings', {})[key_files_digest] = {
+                'state': _keyring_state(gnupg_home_dir),
+                'index': key_index
+            }
+
+    result, error = public_keys_exist(None, key_recipients, key_index)
     if error:
         return result, error
 
+    save_keyring_cache(gnupg_home_dir, cache)
     return gpg, ""
 
 
@@ -99,3 +200,26 @@ def encrypt(gpg, file_to_encrypt, recipients):
         if os.path.exists(output_file_name):
             os.remove(output_file_name)
         return None, 'Error encrypting {}\n{}'.format(file_to_encrypt, err)
+
+
+@contextlib.contextmanager
+def encrypt_stream(gpg, recipients, output_file_name):
+    """
+    Encrypts everything written to the yielded binary stream into output_file_name.
+    The encryption status is stored under the 'status' key of the yielded dict once the stream is closed.
+    """
+    read_descriptor, write_descriptor = os.pipe()
+    result = {}
+
+    def _encrypt():
+        with open(read_descriptor, 'rb') as source:
+            result['status'] = gpg.encrypt_file(source, recipients=recipients, output=output_file_name,
+                                                always_trust=True)
+
+    encrypt_thread = threading.Thread(target=_encrypt)
+    encrypt_thread.start()
+    try:
+        with open(write_descriptor, 'wb') as encrypt_input:
+            yield encrypt_input, result
+    finally:
+        encrypt_thread.join()
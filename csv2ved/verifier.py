@@ -0,0 +1,295 @@
+import bz2
+import collections
+import contextlib
+import hashlib
+import json
+import lzma
+import os
+import struct
+import subprocess
+import threading
+import zipfile
+import zlib
+from json.encoder import encode_basestring_ascii
+
+from csv2ved import compressed_input
+from csv2ved import csv2jpl_converter
+from csv2ved import jpl2vad_converter
+from csv2ved import shards
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+READ_SIZE = 1024 * 1024
+
+ZIP_LOCAL_HEADER = struct.Struct('<4sHHHHHIIIHH')
+ZIP_LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+ZIP_DATA_DESCRIPTOR_SIGNATURE = b'PK\x07\x08'
+ZIP_DATA_DESCRIPTOR_FLAG = 0x08
+ZIP64_EXTRA_ID = 0x0001
+ZIP_SIZE_IN_ZIP64_EXTRA = 0xffffffff
+# a zip LZMA entry starts with the LZMA SDK version and the size of the LZMA1 properties that follow it
+ZIP_LZMA_HEADER = struct.Struct('<BBH')
+
+# the _ids of a file are summarized by the sum of their 64 bit hashes, which doesn't depend on their order and
+# can be added up across the shards of a file
+ID_DIGEST_MASK = 2 ** 64 - 1
+
+Verification = collections.namedtuple('Verification', ['ved_file', 'rows', 'deleted', 'jpl_bytes', 'jpl_sha256',
+                                                       'id_digest', 'error'])
+DataFileIds = collections.namedtuple('DataFileIds', ['rows', 'id_digest'])
+
+
+def _id_hash(id_token):
+    return int.from_bytes(hashlib.blake2b(id_token, digest_size=8).digest(), 'little')
+
+
+@contextlib.contextmanager
+def decrypt_stream(gpg_binary, gnupg_home_dir, ved_file_name):
+    """
+    Yields a binary stream of the decrypted .ved file, read from the output of gpg without writing it to disk.
+    Raises OSError with the gpg error once the stream is closed if gpg failed, e.g. without a secret key.
+    """
+    process = subprocess.Popen([gpg_binary, '--homedir', gnupg_home_dir, '--batch', '--no-tty', '--quiet',
+                                '--decrypt', ved_file_name],
+                               stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stderr = []
+    stderr_thread = threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)
+    stderr_thread.start()
+    try:
+        yield process.stdout
+    finally:
+        # the rest of the output, e.g. the zip central directory, is read so gpg checks the whole message, a gpg
+        # error is raised instead of what it caused, like a truncated archive
+        while process.stdout.read(READ_SIZE):
+            pass
+        process.stdout.close()
+        process.wait()
+        stderr_thread.join()
+        if process.returncode != 0:
+            error = b''.join(stderr).decode(errors='replace').strip() or 'exit status {}'.format(process.returncode)
+            raise OSError('gpg could not decrypt {}: {}'.format(ved_file_name, error))
+
+
+def _read_exactly(stream, size, pending=b''):
+    data = pending[:size]
+    pending = pending[size:]
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            raise OSError('The .vad archive ends unexpectedly')
+        data += chunk
+    return data, pending
+
+
+def _has_zip64_extra(extra):
+    position = 0
+    while position + 4 <= len(extra):
+        header_id, size = struct.unpack('<HH', extra[position:position + 4])
+        if header_id == ZIP64_EXTRA_ID:
+            return True
+        position += 4 + size
+    return False
+
+
+def _lzma_decompressor(stream, pending):
+    header, pending = _read_exactly(stream, ZIP_LZMA_HEADER.size, pending)
+    properties, pending = _read_exactly(stream, ZIP_LZMA_HEADER.unpack(header)[2], pending)
+    if len(properties) != 5:
+        raise OSError('The .vad archive has invalid LZMA properties')
+    # the first byte is (pb * 5 + lp) * 9 + lc, the next four the dictionary size
+    lc_lp_pb, dict_size = struct.unpack('<BI', properties)
+    lzma_filter = {'id': lzma.FILTER_LZMA1, 'dict_size': dict_size,
+                   'lc': lc_lp_pb % 9, 'lp': lc_lp_pb // 9 % 5, 'pb': lc_lp_pb // 45}
+    return lzma.LZMADecompressor(lzma.FORMAT_RAW, filters=[lzma_filter]), pending
+
+
+def _decompressor(compress_type, stream, pending):
+    # the decompressor of a zip entry, with the data that follows what it read from the stream
+    if compress_type == zipfile.ZIP_DEFLATED:
+        return zlib.decompressobj(-zlib.MAX_WBITS), pending
+    if compress_type == zipfile.ZIP_BZIP2:
+        return bz2.BZ2Decompressor(), pending
+    return _lzma_decompressor(stream, pending)
+
+
+def _zip_entry_chunks(stream, pending):
+    # the decompressed chunks of the first entry of a zip archive read from a stream, which isn't seekable
+    header, pending = _read_exactly(stream, ZIP_LOCAL_HEADER.size, pending)
+    (signature, _, flags, compress_type, _, _, crc, _, file_size,
+     name_length, extra_length) = ZIP_LOCAL_HEADER.unpack(header)
+    if signature != ZIP_LOCAL_HEADER_SIGNATURE:
+        raise OSError('The decrypted data is not a .vad archive')
+    _, pending = _read_exactly(stream, name_length, pending)
+    extra, pending = _read_exactly(stream, extra_length, pending)
+    if compress_type not in jpl2vad_converter.CODEC_NAMES or compress_type == zipfile.ZIP_STORED:
+        raise OSError('The .vad archive uses an unsupported compression {}'.format(compress_type))
+
+    decompressor, pending = _decompressor(compress_type, stream, pending)
+    actual_crc = 0
+    actual_size = 0
+    data = pending
+    while True:
+        chunk = decompressor.decompress(data)
+        actual_crc = zlib.crc32(chunk, actual_crc)
+        actual_size += len(chunk)
+        if chunk:
+            yield chunk
+        if decompressor.eof:
+            break
+        data = stream.read(READ_SIZE)
+        if not data:
+            raise OSError('The .vad archive ends unexpectedly')
+
+    if flags & ZIP_DATA_DESCRIPTOR_FLAG:
+        # written by archive_stream after the data, with zip64 sizes
+        pending = decompressor.unused_data
+        signature, pending = _read_exactly(stream, 4, pending)
+        if signature != ZIP_DATA_DESCRIPTOR_SIGNATURE:
+            pending = signature + pending
+        sizes_format = '<IQQ' if _has_zip64_extra(extra) else '<III'
+        descriptor, pending = _read_exactly(stream, struct.calcsize(sizes_format), pending)
+        crc, _, file_size = struct.unpack(sizes_format, descriptor)
+    if actual_crc != crc or (file_size != ZIP_SIZE_IN_ZIP64_EXTRA and actual_size != file_size):
+        raise OSError('The JSON lines in the .vad archive are corrupt, their CRC or size does not match')
+
+
+def _zstd_chunks(stream, pending):
+    if zstandard is None:
+        raise OSError('The .vad file is a zstd frame, reading it needs the zstandard package')
+    decompressor = zstandard.ZstdDecompressor().decompressobj()
+    data = pending
+    while data:
+        chunk = decompressor.decompress(data)
+        if chunk:
+            yield chunk
+        if decompressor.eof:
+            return
+        data = stream.read(READ_SIZE)
+    raise OSError('The .vad file ends unexpectedly')
+
+
+def jpl_chunks(vad_stream):
+    """Yields the decompressed JSON lines of a .vad zip archive or zstd frame read from a stream"""
+    magic, pending = _read_exactly(vad_stream, len(jpl2vad_converter.ZSTD_MAGIC))
+    if magic == jpl2vad_converter.ZSTD_MAGIC:
+        return _zstd_chunks(vad_stream, magic)
+    return _zip_entry_chunks(vad_stream, magic)
+
+
+class LineSummary(object):
+    """Counts and checksums JSON lines fed in chunks of any size, and adds up the hashes of their _ids"""
+
+    def __init__(self):
+        self.rows = 0
+        self.deleted = 0
+        self.jpl_bytes = 0
+        self.digest = hashlib.sha256()
+        self.id_digest = 0
+        self._rest = b''
+
+    def update(self, chunk):
+        self.digest.update(chunk)
+        self.jpl_bytes += len(chunk)
+        lines = (self._rest + chunk).split(b'\n')
+        self._rest = lines.pop()
+        self._add_lines(lines)
+
+    def _add_lines(self, lines):
+        id_digest = self.id_digest
+        for line in lines:
+            # the _id is the first value, followed by the data or by the deleted flag of a tombstone
+            start = line.find(b':') + 1
+            end = line.find(b'"augmentedData"', start)
+            if end == -1:
+                if b'"deleted"' not in line:
+                    raise ValueError('{!r} is not a JSON line of a record'.format(line[:100]))
+                self.deleted += 1
+                continue
+            self.rows += 1
+            id_digest += _id_hash(line[start:end].strip(b' ,'))
+        self.id_digest = id_digest & ID_DIGEST_MASK
+
+    def close(self):
+        # the last line of a .jpl file normally ends with a newline too
+        if self._rest:
+            self._add_lines([self._rest])
+            self._rest = b''
+
+    def jpl_sha256(self):
+        return self.digest.hexdigest()
+
+
+def verify_ved(gpg_binary, gnupg_home_dir, ved_file_name):
+    """
+    Decrypts and decompresses a .ved file in memory, and returns its Verification with the number of records
+    and tombstones, the size and sha256 checksum of its JSON lines and the digest of its _ids, or an error.
+    """
+    summary = LineSummary()
+    try:
+        with decrypt_stream(gpg_binary, gnupg_home_dir, ved_file_name) as vad_stream:
+            for chunk in jpl_chunks(vad_stream):
+                summary.update(chunk)
+        summary.close()
+    except compressed_input.DECOMPRESSION_ERRORS + (ValueError,) as err:
+        return Verification(ved_file_name, summary.rows, summary.deleted, summary.jpl_bytes, None, None, str(err))
+    return Verification(ved_file_name, summary.rows, summary.deleted, summary.jpl_bytes, summary.jpl_sha256(),
+                        summary.id_digest, "")
+
+
+def verify_shards(gpg_binary, gnupg_home_dir, manifest_file_name):
+    """
+    Verifies each .ved shard listed in a .shards.json manifest, and that its own checksum, rows and JSON lines
+    checksum are the ones in the manifest. Returns the Verifications, with an error for shards that don't match.
+    """
+    with open(manifest_file_name) as manifest_file:
+        manifest = json.load(manifest_file)
+    directory = os.path.dirname(manifest_file_name)
+    verifications = []
+    for shard in manifest['shards']:
+        ved_file_name = os.path.join(directory, shard['file'])
+        if not os.path.exists(ved_file_name):
+            verifications.append(Verification(ved_file_name, 0, 0, 0, None, None, 'Shard file is missing'))
+            continue
+        if shards.file_sha256(ved_file_name) != shard['sha256']:
+            verifications.append(Verification(ved_file_name, 0, 0, 0, None, None,
+                                              'sha256 of the .ved file does not match the manifest'))
+            continue
+        verification = verify_ved(gpg_binary, gnupg_home_dir, ved_file_name)
+        rows = verification.rows + verification.deleted
+        if not verification.error and (rows, verification.jpl_sha256) != (shard['rows'], shard['jpl_sha256']):
+            verification = verification._replace(error='{} rows and sha256 {} of the JSON lines do not match the '
+                                                       'manifest'.format(verification.rows, verification.jpl_sha256))
+        verifications.append(verification)
+    return verifications
+
+
+def data_file_ids(data_file_name, company_id):
+    """
+    Returns the DataFileIds of the records of a data file, with the digest of the _ids they are converted to,
+    or None and the error
+    """
+    with compressed_input.open_data_file(data_file_name) as data_file:
+        csv_lines = csv2jpl_converter.csv_file_iterator(data_file)
+        csv_headers = next(csv_lines, None)
+        member_id_index = next((index for index, name in enumerate(csv_headers or [])
+                                if name.upper() == csv2jpl_converter.MEMBER_ID_COLUMN), None)
+        if member_id_index is None:
+            csv_lines.close()
+            return None, "Missing required column {}".format(csv2jpl_converter.MEMBER_ID_COLUMN)
+
+        rows = 0
+        id_digest = 0
+        id_prefix = "{}_".format(company_id)
+        for line in csv_lines:
+            if len(line) > member_id_index and line[member_id_index] != "":
+                rows += 1
+                id_digest += _id_hash(encode_basestring_ascii(id_prefix + line[member_id_index]).encode())
+    return DataFileIds(rows, id_digest & ID_DIGEST_MASK), ""
+
+
+def combined_id_digest(verifications):
+    """Returns the digest of the _ids of all the verified files together"""
+    return sum(verification.id_digest for verification in verifications) & ID_DIGEST_MASK
@@ -40,6 +40,11 @@ setup(name='csv2ved',
       include_package_data=True,
       zip_safe=False,
       install_requires=REQUIREMENTS,
+      extras_require={
+          'batch': ['numpy'],
+          'fast-json': ['orjson'],
+          'zstd': ['zstandard'],
+      },
       entry_points={
           'console_scripts': [
               'csv2ved = csv2ved.csv2ved:csv2ved',
@@ -1,9 +1,16 @@
 import datetime
+import gzip
+import json
 import os
+import shutil
 import uuid
 import tempfile
+import gnupg
 from click import testing as click_testing
+from csv2ved import csv2jpl_converter
 from csv2ved import csv2ved
+from csv2ved import jpl2vad_converter
+from csv2ved import vad2ved_converter
 from unittest import mock
 
 
@@ -70,6 +77,104 @@ class TestCsv2Ved(object):
         assert '{} archived to {}.'.format(EXPECTED_OUTPUT_JPL_FILE, EXPECTED_OUTPUT_VAD_FILE) in result.output
         assert '{} encrypted to {}'.format(EXPECTED_OUTPUT_VAD_FILE, EXPECTED_OUTPUT_VED_FILE) in result.output
 
+    @mock.patch('datetime.datetime')
+    def test_script_streams_data_into_ved_file(self, datetime_mock):
+        datetime_mock.today.return_value = current_time
+        runner = click_testing.CliRunner()
+        result = runner.invoke(csv2ved.csv2ved,
+                               [
+                                   '--data-file', DATA_FILE,
+                                   '--type-file', TYPE_FILE,
+                                   '--company-id', COMPANY_ID,
+                                   '--stream',
+                                   '--no-input'
+                               ])
+        assert result is not None
+        assert result.exit_code == 0
+        assert '1 lines written' in result.output
+        assert '{} encrypted to {}'.format(DATA_FILE, EXPECTED_OUTPUT_VED_FILE) in result.output
+        assert not os.path.exists(EXPECTED_OUTPUT_JPL_FILE)
+        assert not os.path.exists(EXPECTED_OUTPUT_VAD_FILE)
+
+    @mock.patch('datetime.datetime')
+    def test_script_writes_stage_metrics(self, datetime_mock):
+        datetime_mock.today.return_value = current_time
+        metrics_file_name = os.path.join(temp_log_dir, 'metrics.json')
+        runner = click_testing.CliRunner()
+        result = runner.invoke(csv2ved.csv2ved,
+                               [
+                                   '--data-file', DATA_FILE,
+                                   '--type-file', TYPE_FILE,
+                                   '--company-id', COMPANY_ID,
+                                   '--profile',
+                                   '--metrics-file', metrics_file_name,
+                                   '--no-input'
+                               ])
+        assert result.exit_code == 0
+        assert 'stage metrics:' in result.output
+        with open(metrics_file_name) as metrics_file:
+            metrics = json.load(metrics_file)
+        os.remove(metrics_file_name)
+        assert [stage['stage'] for stage in metrics['stages']] == ['type_load', 'conversion', 'archive', 'encrypt']
+        assert metrics['stages'][1]['rows'] == 1
+        assert metrics['stages'][1]['bytes_in'] == os.path.getsize(DATA_FILE)
+
+    def test_script_converts_each_file_in_data_dir(self):
+        data_dir = tempfile.mkdtemp(dir=temp_log_dir)
+        overwrite_test_file_content(os.path.join(data_dir, 'a.csv'), "MEMBER_ID,name,balance\n1,John Smith,1000\n")
+        overwrite_test_file_content(os.path.join(data_dir, 'b.csv'), "MEMBER_ID,name,balance\n2,Jane Smith,ten\n")
+        for name in ['a.csvt', 'b.csvt']:
+            overwrite_test_file_content(os.path.join(data_dir, name), "MEMBER_ID,name,balance\nstring,string,integer\n")
+        runner = click_testing.CliRunner()
+        result = runner.invoke(csv2ved.csv2ved,
+                               [
+                                   '--data-dir', data_dir,
+                                   '--company-id', COMPANY_ID,
+                                   '--no-input'
+                               ])
+        output_files = sorted(os.listdir(data_dir))
+        for name in output_files:
+            os.remove(os.path.join(data_dir, name))
+        os.rmdir(data_dir)
+        assert result.exit_code == 2
+        assert 'Converting 2 files' in result.output
+        assert [name for name in output_files if name.endswith('.ved')][0].startswith('a_')
+        assert '{} line 2:'.format(os.path.join(data_dir, 'b.csv')) in result.output
+
+    @mock.patch('csv2ved.vad2ved_converter.init_gpg', return_value=(False, "init_gpg error message"))
+    def test_validate_only_reports_errors_without_gpg(self, mock_init_gpg):
+        overwrite_test_file_content(DATA_FILE, "MEMBER_ID,name,balance\n12345,John Smith,ten\n")
+        files_before = sorted(os.listdir(temp_log_dir))
+        runner = click_testing.CliRunner()
+        result = runner.invoke(csv2ved.csv2ved,
+                               [
+                                   '--data-file', DATA_FILE,
+                                   '--type-file', TYPE_FILE,
+                                   '--company-id', COMPANY_ID,
+                                   '--validate-only',
+                                   '--no-input'
+                               ])
+        assert result.exit_code == 2
+        assert 'line 2: ten is not a valid integer' in result.output
+        assert not mock_init_gpg.called
+        assert sorted(os.listdir(temp_log_dir)) == files_before
+
+    def test_validate_only_reads_compressed_data_file(self):
+        compressed_data_file = DATA_FILE + '.gz'
+        with open(DATA_FILE, 'rb') as data_file, gzip.open(compressed_data_file, 'wb') as compressed_file:
+            compressed_file.write(data_file.read())
+        runner = click_testing.CliRunner()
+        result = runner.invoke(csv2ved.csv2ved,
+                               [
+                                   '--data-file', compressed_data_file,
+                                   '--company-id', COMPANY_ID,
+                                   '--validate-only',
+                                   '--no-input'
+                               ])
+        os.remove(compressed_data_file)
+        assert result.exit_code == 0
+        assert '{} is valid, 1 lines'.format(compressed_data_file) in result.output
+
     @mock.patch('datetime.datetime')
     def test_script_does_not_write_corrupted_lines(self, datetime_mock):
         datetime_mock.today.return_value = current_time
@@ -177,7 +282,7 @@ class TestCsv2Ved(object):
                                [
                                    '--data-file', DATA_FILE,
                                    '--type-file', TYPE_FILE,
-                                   '--company-id',COMPANY_ID,
+                                   '--company-id', COMPANY_ID,
                                    '--no-input'
                                ])
         assert result is not None
@@ -199,3 +304,65 @@ class TestCsv2Ved(object):
         assert result is not None
         assert result.exit_code == 2
         assert 'encryption error message' in result.output
+
+    def test_infer_types_refuses_to_overwrite_the_type_file(self):
+        runner = click_testing.CliRunner()
+        result = runner.invoke(csv2ved.csv2ved, ['infer-types', '--data-file', DATA_FILE])
+        assert result.exit_code == 2
+        assert '{} exists, use --force to overwrite it'.format(TYPE_FILE) in result.output
+
+    def test_infer_types_writes_the_type_file(self):
+        runner = click_testing.CliRunner()
+        result = runner.invoke(csv2ved.csv2ved, ['infer-types', '--data-file', DATA_FILE, '--force'])
+        assert result.exit_code == 0
+        assert 'Sampled 1 rows of {}'.format(DATA_FILE) in result.output
+        assert 'Type file written to {}'.format(TYPE_FILE) in result.output
+        with open(TYPE_FILE) as type_file:
+            assert type_file.read() == "MEMBER_ID,name,balance\nstring,string,integer\n"
+
+
+class TestVerify(object):
+    recipient = 'verify@example.com'
+
+    @classmethod
+    def setup_class(cls):
+        cls.gnupg_home_dir = tempfile.mkdtemp()
+        cls.gpg = gnupg.GPG(gpgbinary=vad2ved_converter.get_gpg_binary(), gnupghome=cls.gnupg_home_dir)
+        cls.gpg.gen_key(cls.gpg.gen_key_input(key_type='RSA', key_length=1024, name_email=cls.recipient,
+                                              no_protection=True))
+
+    @classmethod
+    def teardown_class(cls):
+        shutil.rmtree(cls.gnupg_home_dir, ignore_errors=True)
+
+    def setup_method(self, method):
+        overwrite_test_file_content(DATA_FILE, "MEMBER_ID,name,balance\n12345,John Smith,1000\n6789,Jane,5\n")
+        overwrite_test_file_content(TYPE_FILE, "MEMBER_ID,name,balance\nstring,string,integer\n")
+        jpl_file_name, _, _ = csv2jpl_converter.convert(open(DATA_FILE), open(TYPE_FILE), COMPANY_ID)
+        vad_file_name, _, _, _ = jpl2vad_converter.convert(jpl_file_name)
+        self.ved_file_name, _ = vad2ved_converter.encrypt(self.gpg, vad_file_name, [self.recipient])
+
+    def teardown_method(self, method):
+        for file_name in [DATA_FILE, TYPE_FILE, self.ved_file_name]:
+            os.remove(file_name)
+
+    def _verify(self, *args):
+        return click_testing.CliRunner().invoke(csv2ved.csv2ved, ['verify', '--ved-file', self.ved_file_name,
+                                                                  '--gpg-home', self.gnupg_home_dir] + list(args))
+
+    def test_verify_prints_the_records_of_the_ved_file(self):
+        result = self._verify('--data-file', DATA_FILE, '--company-id', COMPANY_ID)
+        assert result.exit_code == 0
+        assert '{}: 2 records, 0 deleted'.format(self.ved_file_name) in result.output
+        assert 'The _ids of the 2 records match {}'.format(DATA_FILE) in result.output
+
+    def test_verify_fails_when_the_ids_do_not_match(self):
+        overwrite_test_file_content(DATA_FILE, "MEMBER_ID,name,balance\n12345,John Smith,1000\n6780,Jane,5\n")
+        result = self._verify('--data-file', DATA_FILE, '--company-id', COMPANY_ID)
+        assert result.exit_code == 2
+        assert 'The _ids of the 2 records do not match the 2 rows of {}'.format(DATA_FILE) in result.output
+
+    def test_verify_fails_without_the_secret_key(self):
+        result = self._verify('--gpg-home', temp_log_dir)
+        assert result.exit_code == 2
+        assert 'gpg could not decrypt {}'.format(self.ved_file_name) in result.output
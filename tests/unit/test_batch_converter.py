@@ -0,0 +1,130 @@
+import io
+import os
+import tempfile
+import uuid
+import pytest
+from collections import OrderedDict
+from csv2ved import batch_converter
+from csv2ved import csv2jpl_converter
+from csv2ved.conversion_options import ConversionOptions
+from csv2ved.conversion_plan import ConversionPlan
+from unittest import mock
+
+pytest.importorskip('numpy')
+
+
+class TestReadBlocks(object):
+
+    def test_blocks_skip_empty_lines_and_keep_line_numbers(self):
+        csv_lines = iter([['1', 'a'], [], ['2', 'b'], ['3', 'c']])
+        blocks = list(batch_converter.read_blocks(csv_lines, 2, 1))
+        assert blocks == [([2], [['1', 'a']], 3), ([4, 5], [['2', 'b'], ['3', 'c']], 5)]
+
+    def test_no_blocks_for_no_lines(self):
+        assert list(batch_converter.read_blocks(iter([]), 2)) == []
+
+
+class TestBatchConverter(object):
+    headers = ["MEMBER_ID", "balance", "risk_factor", "opt_in", "name", "dob"]
+    csv_types = OrderedDict([
+        ("MEMBER_ID", "string"),
+        ("balance", "integer"),
+        ("risk_factor", "float"),
+        ("opt_in", "boolean"),
+        ("name", "string"),
+        ("dob", "date")
+    ])
+    company_id = str(uuid.uuid4())
+
+    def _assert_same_as_plan(self, rows, compact=False):
+        plan = ConversionPlan(self.headers, self.csv_types, self.company_id, "MEMBER_ID", compact)
+        batch = batch_converter.BatchConverter(plan)
+        assert batch.convert_block(rows) == [plan.make_json(row) for row in rows]
+
+    def test_valid_rows_match_plan_output(self):
+        self._assert_same_as_plan([
+            ["1", "100", "0.25", "True", "John", "1972-05-15"],
+            ["2", "-007", "1e3", "0", "Jane", "1980-01-01"],
+            ["3", "12345678901234567890", "-.5", "FALSE", "Joe", "Mar 1, 2020"]
+        ])
+
+    def test_empty_values_are_left_out(self):
+        self._assert_same_as_plan([
+            ["1", "", "", "", "", ""],
+            ["2", "100", "0.25", "true", "Jane", "1980-01-01"]
+        ])
+
+    def test_invalid_values_report_plan_errors(self):
+        self._assert_same_as_plan([
+            ["1", "1.5", "0.25", "true", "John", "1972-05-15"],
+            ["2", "100", "nan", "yes", "Jane", "1980-01-01"],
+            ["3", "1oo", "abc", "true", "Joe", "foo"],
+            ["4", "9007199254740993", "0.25", "true", "Joe", "1980-01-01"]
+        ])
+
+    @pytest.mark.parametrize('compact', [False, True])
+    def test_repeated_and_special_values_match_plan_output(self, compact):
+        self._assert_same_as_plan([
+            ["1", "+5", "nan", "1", "John", "1972-05-15"],
+            ["2", "1_000", "-Infinity", "TRUE", "John", "1972-05-15"],
+            ["3", "9007199254740992", "1e999", "1", "John", "1972-05-15"],
+            ["4", "5", "0.1", "1", "John", "1972-05-15"]
+        ], compact)
+
+    def test_blocks_larger_than_the_batch_size_match_plan_output(self):
+        rows = [[str(number), str(number), "{}.5".format(number), "true", "John", "1972-05-15"] for number in range(5)]
+        rows[3][1] = "1.5"
+        with mock.patch('csv2ved.batch_converter.BATCH_SIZE', 2):
+            self._assert_same_as_plan(rows)
+
+    def test_empty_member_id_and_wrong_width_rows_report_plan_errors(self):
+        self._assert_same_as_plan([
+            ["", "100", "0.25", "true", "John", "1972-05-15"],
+            ["2", "100", "0.25"],
+            ["3", "100", "0.25", "true", "Joe", "1980-01-01"]
+        ])
+
+
+class TestConvertWithBatchSize(object):
+    type_file_content = 'MEMBER_ID,balance,risk_factor,opt_in\nstring,integer,float,boolean'
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_file_path = os.path.join(self.tmp_dir, 'data.csv')
+        lines = ['MEMBER_ID,balance,risk_factor,opt_in']
+        for number in range(100):
+            if number % 30 == 0:
+                lines.append('{},1oo,0.5,true'.format(number))
+            elif number % 10 == 0:
+                lines.append('')
+            else:
+                lines.append('{},{},{}.5,{}'.format(number, number, number, number % 2))
+        with open(self.data_file_path, 'w') as data_file:
+            data_file.write('\n'.join(lines))
+
+    def teardown_method(self):
+        for name in os.listdir(self.tmp_dir):
+            os.remove(os.path.join(self.tmp_dir, name))
+        os.rmdir(self.tmp_dir)
+
+    def _convert(self, batch_size, max_number_of_errors=100):
+        output_file_name = os.path.join(self.tmp_dir, 'data_{}.jpl'.format(batch_size))
+        with mock.patch('csv2ved.csv2jpl_converter.generate_output_file_name', return_value=output_file_name), \
+                mock.patch('os.remove'):
+            result = csv2jpl_converter.convert(open(self.data_file_path), io.StringIO(self.type_file_content),
+                                               self.company_id, max_number_of_errors,
+                                               ConversionOptions(batch_size=batch_size))
+        with open(output_file_name) as output_file:
+            return result[1:], output_file.read()
+
+    def test_batches_produce_same_output_and_errors(self):
+        self.company_id = str(uuid.uuid4())
+        line_by_line = self._convert(0)
+        batched = self._convert(16)
+        assert line_by_line == batched
+        assert line_by_line[0][1] == [{2: '1oo is not a valid integer'}, {32: '1oo is not a valid integer'},
+                                      {62: '1oo is not a valid integer'}, {92: '1oo is not a valid integer'}]
+
+    def test_max_number_of_errors_applies_to_batches(self):
+        self.company_id = str(uuid.uuid4())
+        assert self._convert(0, 2) == self._convert(16, 2)
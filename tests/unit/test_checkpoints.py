@@ -0,0 +1,61 @@
+import os
+import tempfile
+from collections import OrderedDict
+from csv2ved import checkpoints
+
+
+class TestLoadCheckpoint(object):
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_file_name = os.path.join(self.tmp_dir, 'data.csv')
+        self.output_file_name = os.path.join(self.tmp_dir, 'data_1.jpl')
+        self.checkpoint_file_name = checkpoints.checkpoint_file_for(self.data_file_name)
+        with open(self.data_file_name, 'w') as data_file:
+            data_file.write('MEMBER_ID\n1\n')
+        with open(self.output_file_name, 'w') as output_file:
+            output_file.write('{"_id": "1"}\n')
+        self.settings = checkpoints.checkpoint_settings(self.data_file_name, OrderedDict([('MEMBER_ID', 'string')]),
+                                                        'company', False)
+        self.checkpoint = checkpoints.new_checkpoint(self.settings, self.output_file_name)
+        self.checkpoint.update({'input_offset': 10, 'line': 2, 'output_size': 13, 'written_lines': 1})
+
+    def teardown_method(self):
+        for name in os.listdir(self.tmp_dir):
+            os.remove(os.path.join(self.tmp_dir, name))
+        os.rmdir(self.tmp_dir)
+
+    def test_checkpoint_file_has_the_data_file_name(self):
+        assert self.checkpoint_file_name == os.path.join(self.tmp_dir, 'data.checkpoint')
+
+    def test_saved_checkpoint_is_loaded(self):
+        checkpoints.save_checkpoint(self.checkpoint_file_name, self.checkpoint)
+        assert checkpoints.load_checkpoint(self.checkpoint_file_name, self.settings) == (self.checkpoint, "")
+        assert not os.path.exists(self.checkpoint_file_name + '.tmp')
+
+    def test_missing_checkpoint_is_not_an_error(self):
+        assert checkpoints.load_checkpoint(self.checkpoint_file_name, self.settings) == (None, "")
+
+    def test_checkpoint_of_a_changed_data_file_is_an_error(self):
+        checkpoints.save_checkpoint(self.checkpoint_file_name, self.checkpoint)
+        with open(self.data_file_name, 'a') as data_file:
+            data_file.write('2\n')
+        settings = checkpoints.checkpoint_settings(self.data_file_name, OrderedDict([('MEMBER_ID', 'string')]),
+                                                   'company', False)
+        checkpoint, error = checkpoints.load_checkpoint(self.checkpoint_file_name, settings)
+        assert checkpoint is None
+        assert 'different data file' in error
+
+    def test_truncated_output_is_an_error(self):
+        self.checkpoint['output_size'] = 100
+        checkpoints.save_checkpoint(self.checkpoint_file_name, self.checkpoint)
+        checkpoint, error = checkpoints.load_checkpoint(self.checkpoint_file_name, self.settings)
+        assert checkpoint is None
+        assert 'missing or truncated' in error
+
+    def test_invalid_checkpoint_is_an_error(self):
+        with open(self.checkpoint_file_name, 'w') as checkpoint_file:
+            checkpoint_file.write('{"version"')
+        checkpoint, error = checkpoints.load_checkpoint(self.checkpoint_file_name, self.settings)
+        assert checkpoint is None
+        assert "can't be read" in error
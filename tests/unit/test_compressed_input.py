@@ -0,0 +1,89 @@
+import bz2
+import gzip
+import lzma
+import os
+import tempfile
+import uuid
+import pytest
+from csv2ved import compressed_input
+from csv2ved import csv2jpl_converter
+from csv2ved.conversion_options import ConversionOptions
+from csv2ved import parallel_converter
+from unittest import mock
+
+DATA = 'MEMBER_ID,name,balance\n1,"Smith,\nJohn",10\n2,Jane,ten\n\n3,Joe,30\r\n'
+
+COMPRESSORS = {
+    '.gz': gzip.compress,
+    '.bz2': bz2.compress,
+    '.xz': lzma.compress,
+}
+
+
+class TestCompressedInput(object):
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def teardown_method(self):
+        for name in os.listdir(self.tmp_dir):
+            os.remove(os.path.join(self.tmp_dir, name))
+        os.rmdir(self.tmp_dir)
+
+    def _write(self, name, content):
+        file_name = os.path.join(self.tmp_dir, name)
+        with open(file_name, 'wb') as data_file:
+            data_file.write(content)
+        return file_name
+
+    def _compressed(self, extension, name='data.csv'):
+        return self._write(name + extension, COMPRESSORS[extension](DATA.encode()))
+
+    @pytest.mark.parametrize('extension, codec', [('.gz', compressed_input.GZIP_CODEC),
+                                                  ('.bz2', compressed_input.BZIP2_CODEC),
+                                                  ('.xz', compressed_input.XZ_CODEC)])
+    def test_codec_is_detected_by_magic_bytes(self, extension, codec):
+        assert compressed_input.detect_codec(self._compressed(extension, name='data.csv.renamed')) == codec
+
+    def test_uncompressed_and_missing_files_have_no_codec(self):
+        assert compressed_input.detect_codec(self._write('data.csv', DATA.encode())) is None
+        assert compressed_input.detect_codec(os.path.join(self.tmp_dir, 'missing.csv.gz')) is None
+
+    def test_compression_extension_is_stripped(self):
+        assert compressed_input.strip_extension('/tmp/data.csv.gz') == '/tmp/data.csv'
+        assert compressed_input.strip_extension('/tmp/data.csv.ZST') == '/tmp/data.csv'
+        assert compressed_input.strip_extension('/tmp/data.csv') == '/tmp/data.csv'
+
+    @pytest.mark.parametrize('extension', sorted(COMPRESSORS))
+    def test_decompressed_rows_are_the_same(self, extension):
+        file_name = self._compressed(extension)
+        with compressed_input.open_data_file(file_name) as data_file:
+            assert data_file.name == file_name
+            assert not parallel_converter.can_split(data_file)
+            rows = list(csv2jpl_converter.csv_file_iterator(data_file))
+        with open(self._write('data.csv', DATA.encode())) as data_file:
+            assert rows == list(csv2jpl_converter.csv_file_iterator(data_file))
+
+    @mock.patch('csv2ved.compressed_input.zstandard', None)
+    def test_zstd_needs_zstandard(self):
+        file_name = self._write('data.csv.zst', b'\x28\xb5\x2f\xfd' + b'\0' * 16)
+        with pytest.raises(OSError, match='needs the zstandard package'):
+            compressed_input.open_data_file(file_name)
+
+    def test_corrupt_data_is_an_os_error(self):
+        file_name = self._write('data.csv.gz', gzip.compress(DATA.encode())[:-12])
+        with compressed_input.open_data_file(file_name) as data_file:
+            with pytest.raises(OSError, match='is not a valid gzip file'):
+                data_file.read()
+
+    @pytest.mark.parametrize('workers', [1, 2])
+    def test_conversion_errors_have_the_uncompressed_line_numbers(self, workers):
+        type_file_name = self._write('data.csvt', b'MEMBER_ID,name,balance\nstring,string,integer\n')
+        results = []
+        for file_name in (self._write('data.csv', DATA.encode()), self._compressed('.gz')):
+            with compressed_input.open_data_file(file_name) as data_file, open(type_file_name) as type_file:
+                results.append(csv2jpl_converter.convert(data_file, type_file, str(uuid.uuid4()),
+                                                         options=ConversionOptions(workers=workers)))
+        assert results[0][1:] == results[1][1:]
+        assert results[1][2] == [{3: 'ten is not a valid integer'}]
+        assert results[0][0] == results[1][0]
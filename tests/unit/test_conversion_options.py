@@ -0,0 +1,62 @@
+import pickle
+import pytest
+from csv2ved import conversion_options
+from csv2ved import duplicates
+from csv2ved.conversion_options import ConversionOptions
+from unittest import mock
+
+REJECTS_ERROR = ("--rejects-file and --error-summary convert the rows one at a time and can't be used with --workers "
+                 "or --batch-size")
+
+
+class TestConversionOptions(object):
+
+    def test_defaults_are_valid(self):
+        assert ConversionOptions().validate() == ""
+        assert conversion_options.DEFAULT_OPTIONS == ConversionOptions()
+
+    def test_options_survive_pickling(self):
+        # the options are sent to the processes that convert files and chunks
+        options = ConversionOptions(workers=2, compact=True)
+        assert pickle.loads(pickle.dumps(options)) == options
+
+    @pytest.mark.parametrize('options, error', [
+        ({'stream': True, 'compression': 'auto'}, "--compression auto samples the .jpl file and can't be used with "
+                                                  "--stream"),
+        ({'multiple_files': True, 'profiled': True}, '--profile, --metrics-file and --profile-file need a single '
+                                                     '--data-file'),
+        ({'resume': True, 'stream': True}, "--checkpoint-interval and --resume need a single --data-file and can't "
+                                           "be used with --stream"),
+        ({'duplicates': duplicates.KEEP_LAST, 'stream': True}, "--duplicates keep-last can't be used with --stream "
+                                                               "or --delta-manifest"),
+        ({'duplicates': duplicates.ERROR, 'checkpoint_interval': 1}, "--duplicates can't be used with "
+                                                                     "--checkpoint-interval or --resume"),
+        ({'error_summary': True, 'multiple_files': True}, "--rejects-file and --error-summary need a single "
+                                                          "--data-file and can't be used with --checkpoint-interval "
+                                                          "or --resume"),
+        ({'rejects_file': 'rejects.csv', 'workers': 2}, REJECTS_ERROR),
+        ({'error_summary': True, 'batch_size': 10}, REJECTS_ERROR),
+        ({'pipelined': True, 'workers': 2}, "--pipeline can't be used with --workers, --rejects-file, "
+                                            "--error-summary, --checkpoint-interval or --resume"),
+        ({'shard_rows': 10, 'shard_size': 1}, "--shard-rows and --shard-size can't be used together"),
+        ({'tombstones': True}, '--tombstones needs --delta-manifest'),
+    ])
+    def test_options_that_cant_be_used_together_are_an_error(self, options, error):
+        assert ConversionOptions(**options).validate() == error
+
+    def test_options_that_can_be_used_together_are_valid(self):
+        options = ConversionOptions(workers=2, batch_size=0, duplicates=duplicates.ERROR, stream=True, compact=True,
+                                    raw_json=True)
+        assert options.validate() == ""
+
+    def test_missing_packages_are_an_error(self):
+        with mock.patch('csv2ved.batch_converter.numpy_available', return_value=False):
+            assert ConversionOptions(batch_size=10).validate() == \
+                '--batch-size requires NumPy, install it or convert line by line'
+            assert ConversionOptions(delta_manifest='manifest').validate() == '--delta-manifest requires NumPy'
+        with mock.patch('csv2ved.duplicates.numpy_available', return_value=False):
+            assert ConversionOptions(duplicates=duplicates.KEEP_FIRST).validate() == '--duplicates requires NumPy'
+            assert ConversionOptions(duplicates=duplicates.ALLOW).validate() == ""
+        with mock.patch('csv2ved.jpl2vad_converter.zstd_available', return_value=False):
+            assert ConversionOptions(compression='zstd').validate() == \
+                '--compression zstd requires the zstandard package'
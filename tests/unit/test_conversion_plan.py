@@ -0,0 +1,227 @@
+import copy
+import json
+import uuid
+import pytest
+from collections import OrderedDict
+from unittest import mock
+from csv2ved import conversion_plan
+from csv2ved import csv2jpl_converter
+from csv2ved.conversion_plan import ConversionPlan
+from csv2ved.csv2json_type_converter import ConvertCsvDataToJson
+from csv2ved.csv_type_validator import ValidateCsvTypes
+
+
+def reference_make_json(csv_headers, csv_types, data, company_id, member_id_name):
+    # validates and converts each value on its own, the way rows were converted before the conversion plan
+    if len(csv_headers) != len(data):
+        return False, "Data length does not match headers"
+
+    augmented_data = {}
+    for name, value in zip(csv_headers, data):
+        error = ValidateCsvTypes.validate(csv_types[name], value)
+        if error:
+            return False, error
+        json_value = ConvertCsvDataToJson.convert(csv_types[name], value)
+        if name == member_id_name and json_value is None:
+            return False, "MEMBER_ID cannot be empty"
+        if json_value is not None:
+            augmented_data[name] = json_value
+
+    _id = "{}_{}".format(company_id, augmented_data[member_id_name])
+    return json.dumps({"_id": _id, "augmentedData": augmented_data}), ""
+
+
+class TestConversionPlan(object):
+    headers = [
+        "name",
+        "MEMBER_ID",
+        "balance",
+        "risk_factor",
+        "opt_in",
+        "dob",
+        "transaction_time",
+        "userData"
+    ]
+    csv_types = OrderedDict([
+        ("name", "string"),
+        ("MEMBER_ID", "string"),
+        ("balance", "integer"),
+        ("risk_factor", "float"),
+        ("opt_in", "boolean"),
+        ("dob", "date"),
+        ("transaction_time", "datetime"),
+        ("userData", "json")
+    ])
+    member_id_column = "MEMBER_ID"
+    data = [
+        "John",
+        "12345",
+        "100",
+        "0.25",
+        "True",
+        "1972-05-15T15:08:56",
+        "2017-10-21T12:13:14",
+        '{"foo":"bar"}'
+    ]
+    company_id = str(uuid.uuid4())
+
+    def _plan(self, csv_types=None):
+        return ConversionPlan(self.headers, csv_types or self.csv_types, self.company_id, self.member_id_column)
+
+    def _assert_same_as_make_json(self, data, csv_types=None):
+        csv_types = csv_types or self.csv_types
+        expected_result = reference_make_json(
+            self.headers, csv_types, data, self.company_id, self.member_id_column)
+        assert self._plan(csv_types).make_json(data) == expected_result
+
+    def test_plan_precomputes_member_id_index(self):
+        assert self._plan().member_id_index == 1
+
+    def test_plan_output_matches_make_json(self):
+        self._assert_same_as_make_json(self.data)
+
+    def test_plan_output_is_valid_json(self):
+        json_result, error = self._plan().make_json(self.data)
+        assert error == ""
+        assert json.loads(json_result)["_id"] == "{}_12345".format(self.company_id)
+        assert json.loads(json_result)["augmentedData"]["dob"] == "1972-05-15"
+
+    def test_plan_skips_empty_values_like_make_json(self):
+        data = copy.deepcopy(self.data)
+        data[0] = ""
+        data[6] = ""
+        self._assert_same_as_make_json(data)
+
+    def test_plan_returns_same_error_for_invalid_values(self):
+        invalid_values = {2: "1.5", 3: "abc", 4: "yes", 5: "1234", 6: "foo", 7: "{foo}"}
+        for index, value in invalid_values.items():
+            data = copy.deepcopy(self.data)
+            data[index] = value
+            self._assert_same_as_make_json(data)
+
+    def test_plan_reports_first_invalid_column(self):
+        data = copy.deepcopy(self.data)
+        data[2] = "1oo"
+        data[7] = "not a json"
+        assert self._plan().make_json(data) == (False, "1oo is not a valid integer")
+
+    def test_plan_rejects_integers_not_representable_as_float(self):
+        data = copy.deepcopy(self.data)
+        data[2] = "12345678901234567891"
+        self._assert_same_as_make_json(data)
+
+    def test_plan_returns_error_if_member_id_is_empty(self):
+        data = copy.deepcopy(self.data)
+        data[1] = ""
+        assert self._plan().make_json(data) == (False, "MEMBER_ID cannot be empty")
+
+    def test_plan_returns_error_if_data_length_does_not_match(self):
+        assert self._plan().make_json(self.data[:-1]) == (False, "Data length does not match headers")
+
+    def test_plan_returns_error_for_unknown_type(self):
+        csv_types = OrderedDict(self.csv_types)
+        csv_types["userData"] = "foo"
+        self._assert_same_as_make_json(self.data, csv_types)
+        data = copy.deepcopy(self.data)
+        data[7] = ""
+        self._assert_same_as_make_json(data, csv_types)
+
+    def test_plan_returns_error_if_a_converter_fails(self):
+        with mock.patch.dict(conversion_plan.FUSED_CONVERTERS, float=mock.Mock(side_effect=ValueError)):
+            plan = self._plan()
+        assert plan.make_json(self.data) == (False, "0.25 is not a valid float")
+
+    def test_csv2jpl_make_json_returns_the_plan_result(self):
+        data = copy.deepcopy(self.data)
+        data[6] = ""
+        for row in (self.data, data, self.data[:-1]):
+            assert csv2jpl_converter.make_json(self.headers, self.csv_types, row, self.company_id,
+                                               self.member_id_column) == self._plan().make_json(row)
+
+    def test_check_row_returns_the_same_values_as_convert_row(self):
+        assert self._plan().check_row(self.data) == (self._plan().convert_row(self.data)[0], None)
+
+    def test_check_row_error_messages_match_convert_row(self):
+        csv_types = OrderedDict(self.csv_types)
+        csv_types["userData"] = "foo"
+        plan = self._plan(csv_types)
+        rows = [self.data[:-1]]
+        for index, value in [(1, ""), (2, "1oo"), (3, "abc"), (5, "1972-13-45"), (7, ""), (7, "{}")]:
+            data = copy.deepcopy(self.data)
+            data[index] = value
+            rows.append(data)
+        for data in rows:
+            values, rejected = plan.check_row(data)
+            assert values is None
+            assert plan.error_message(rejected) == plan.convert_row(data)[1]
+
+    def test_cached_lines_match_plain_lines(self):
+        cached_plan = self._plan()
+        plain_plan = self._plan()
+        plain_plan.caches = None
+        rows = []
+        for number in range(50):
+            data = copy.deepcopy(self.data)
+            data[1] = str(number)
+            data[2] = str(number % 3)
+            data[3] = ["nan", "0.25", "inf"][number % 3]
+            data[0] = "" if number % 4 else "John"
+            data[4] = "yes" if number == 20 else data[4]
+            rows.append(data)
+        assert [cached_plan.make_json(data) for data in rows] == [plain_plan.make_json(data) for data in rows]
+        assert cached_plan.caches[cached_plan.member_id_index] is None
+
+    @mock.patch('csv2ved.fragment_cache.WINDOW', 8)
+    def test_columns_with_many_distinct_values_go_back_to_the_plain_path(self):
+        plan = self._plan()
+        for cache in plan.caches:
+            if cache is not None:
+                cache.window, cache.distinct_limit = 8, 4
+        for number in range(16):
+            data = copy.deepcopy(self.data)
+            data[2] = str(number)
+            plan.make_json(data)
+        assert plan.caches[2] is None
+        assert plan.caches[0].active
+
+    def test_validate_only_plan_caches_valid_values(self):
+        plan = ConversionPlan(self.headers, self.csv_types, self.company_id, self.member_id_column,
+                              validate_only=True)
+        assert plan.make_json(self.data) == plan.make_json(self.data)
+        assert plan.caches[7].get(self.data[7]) == ''
+
+
+class TestRawJson(object):
+    headers = ["MEMBER_ID", "userData"]
+    csv_types = OrderedDict([("MEMBER_ID", "string"), ("userData", "json")])
+
+    def _make_json(self, value, compact=False):
+        plan = ConversionPlan(self.headers, self.csv_types, "company", "MEMBER_ID", compact, raw_json=True)
+        return plan.make_json(["1", value])
+
+    def test_json_text_is_written_as_it_is(self):
+        json_line, error = self._make_json('{"b":1,  "a": [1.50, true]}')
+        assert json_line == '{"_id": "company_1", "augmentedData": {"MEMBER_ID": "1", ' \
+                            '"userData": {"b":1,  "a": [1.50, true]}}}'
+        assert json.loads(json_line)["augmentedData"]["userData"] == {"b": 1, "a": [1.5, True]}
+
+    def test_tabs_and_line_breaks_are_left_out(self):
+        assert self._make_json('{\n\t"a": "b c",\r\n "d": 1}')[0].endswith('{"a": "b c", "d": 1}}}')
+
+    def test_non_ascii_characters_are_escaped_like_json_dumps(self):
+        value = '["é中", "\U0001f600"]'
+        expected = json.dumps(json.loads(value))
+        assert self._make_json(value)[0].endswith(expected + '}}')
+
+    @pytest.mark.parametrize('use_orjson', [False, True])
+    def test_values_are_checked_like_the_json_module(self, use_orjson):
+        if use_orjson:
+            pytest.importorskip('orjson')
+        with mock.patch('csv2ved.conversion_plan.orjson', conversion_plan.orjson if use_orjson else None):
+            assert self._make_json('{foo}') == (False, "{foo} is not a valid json")
+            assert self._make_json('{"a": "b\nc"}') == (False, '{"a": "b\nc"} is not a valid json')
+            assert self._make_json('[NaN, 123456789012345678901234]')[1] == ""
+
+    def test_compact_lines_are_not_encoded_by_orjson(self):
+        json_line, error = self._make_json('{"a": 1}', compact=True)
+        assert json_line == '{"_id":"company_1","augmentedData":{"MEMBER_ID":"1","userData":{"a": 1}}}'
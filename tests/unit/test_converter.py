@@ -0,0 +1,179 @@
+import collections
+import io
+import os
+import tempfile
+import zipfile
+import pytest
+from csv2ved import converter
+from csv2ved import csv2jpl_converter
+from unittest import mock
+
+COMPANY_ID = 'company'
+CSV_TYPES = collections.OrderedDict([('MEMBER_ID', 'string'), ('age', 'integer'), ('city', 'string')])
+
+
+class MockEncryptFile(object):
+
+    def __init__(self, status):
+        self.status = status
+
+
+class MockGPG(object):
+    """Writes the plaintext as the 'encrypted' output"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def encrypt_file(self, file, recipients, output, always_trust):
+        self.calls += 1
+        with open(output, 'wb') as output_file:
+            output_file.write(file.read())
+        return MockEncryptFile('encryption ok')
+
+
+def data_content(rows=3, city='Paris'):
+    return 'MEMBER_ID,age,city\n' + ''.join('{0},{0}0,{1}\n'.format(number, city) for number in range(rows))
+
+
+class TestConverter(object):
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_file_name = os.path.join(self.tmp_dir, 'data.csv')
+        self.jpl_file_name = os.path.join(self.tmp_dir, 'data.jpl')
+        with open(self.data_file_name, 'w') as data_file:
+            data_file.write(data_content())
+
+    def teardown_method(self):
+        for name in os.listdir(self.tmp_dir):
+            os.remove(os.path.join(self.tmp_dir, name))
+        os.rmdir(self.tmp_dir)
+
+    def _read(self, file_name):
+        with open(file_name) as output_file:
+            return output_file.read()
+
+    def test_types_without_member_id_are_an_error(self):
+        with pytest.raises(ValueError, match='Missing required column MEMBER_ID'):
+            converter.Converter({'age': 'integer'}, COMPANY_ID)
+
+    def test_member_id_must_be_a_string(self):
+        with pytest.raises(ValueError, match="'MEMBER_ID' type must be string"):
+            converter.Converter({'MEMBER_ID': 'integer'}, COMPANY_ID)
+
+    def test_path_is_converted_like_the_command(self):
+        result = converter.Converter(CSV_TYPES, COMPANY_ID).convert_path(self.data_file_name, self.jpl_file_name)
+        assert result == converter.ConversionResult(self.jpl_file_name, 3, [], "")
+        type_file = io.StringIO('MEMBER_ID,age,city\nstring,integer,string\n')
+        expected_jpl_file_name, _, _ = csv2jpl_converter.convert(open(self.data_file_name), type_file, COMPANY_ID)
+        assert self._read(self.jpl_file_name) == self._read(expected_jpl_file_name)
+
+    def test_converter_is_reused_across_files(self):
+        csv_converter = converter.Converter(CSV_TYPES, COMPANY_ID)
+        outputs = []
+        for city in ['Paris', 'Oslo']:
+            with open(self.data_file_name, 'w') as data_file:
+                data_file.write(data_content(2000, city))
+            result = csv_converter.convert_path(self.data_file_name, self.jpl_file_name)
+            assert (result.rows, result.errors) == (2000, [])
+            outputs.append(self._read(self.jpl_file_name))
+        assert '"Paris"' not in outputs[1]
+        assert outputs[1] == outputs[0].replace('"Paris"', '"Oslo"')
+
+    def test_file_with_other_headers_is_an_error(self):
+        result = converter.Converter(CSV_TYPES, COMPANY_ID).convert_file(io.StringIO('MEMBER_ID,age\n1,2\n'))
+        assert result == converter.ConversionResult(None, 0, [{1: "Headers in data file don't match the types file"}],
+                                                    'Conversion failed')
+
+    def test_file_object_without_a_name_is_converted(self):
+        result = converter.Converter(CSV_TYPES, COMPANY_ID).convert_file(io.StringIO(data_content()),
+                                                                         self.jpl_file_name)
+        assert result == converter.ConversionResult(self.jpl_file_name, 3, [], "")
+        assert len(self._read(self.jpl_file_name).splitlines()) == 3
+
+    def test_empty_file_object_without_a_name_is_an_error(self):
+        result = converter.Converter(CSV_TYPES, COMPANY_ID).convert_file(io.StringIO(''), self.jpl_file_name)
+        assert result.errors == [{0: '<data> is empty'}]
+
+    def test_file_object_without_a_name_needs_an_output_file_name(self):
+        result = converter.Converter(CSV_TYPES, COMPANY_ID).convert_file(io.StringIO(data_content()))
+        assert result == converter.ConversionResult(None, 0, [], 'A data file without a name needs an output file '
+                                                                 'name')
+
+    def test_invalid_lines_are_errors_and_nothing_is_written(self):
+        with open(self.data_file_name, 'a') as data_file:
+            data_file.write('4,forty,Paris\n')
+        result = converter.Converter(CSV_TYPES, COMPANY_ID).convert_path(self.data_file_name, self.jpl_file_name)
+        assert (result.output_file, result.errors) == (None, [{5: 'forty is not a valid integer'}])
+        assert not os.path.exists(self.jpl_file_name)
+
+    def test_missing_file_is_an_error(self):
+        result = converter.Converter(CSV_TYPES, COMPANY_ID).convert_path(os.path.join(self.tmp_dir, 'missing.csv'))
+        assert result.output_file is None
+        assert 'missing.csv' in result.message
+
+    def test_rows_are_numbered_from_one(self):
+        csv_converter = converter.Converter(CSV_TYPES, COMPANY_ID)
+        result = csv_converter.convert_rows([['1', '10', 'Paris'], ['2', 'x', 'Oslo']], self.jpl_file_name)
+        assert result.errors == [{2: 'x is not a valid integer'}]
+        assert csv_converter.convert_rows([], self.jpl_file_name).errors == [{0: 'There are no rows to convert'}]
+        result = csv_converter.convert_rows(iter([['1', '10', 'Paris']]), self.jpl_file_name)
+        assert result == converter.ConversionResult(self.jpl_file_name, 1, [], "")
+
+    def test_output_is_archived_and_encrypted_with_the_gpg_instance(self):
+        gpg = MockGPG()
+        csv_converter = converter.Converter(CSV_TYPES, COMPANY_ID, gpg, ['recipient'])
+        for _ in range(2):
+            result = csv_converter.convert_path(self.data_file_name, self.jpl_file_name)
+            assert result == converter.ConversionResult(os.path.join(self.tmp_dir, 'data.ved'), 3, [],
+                                                        'encryption ok')
+            with zipfile.ZipFile(result.output_file) as vad_file:
+                assert len(vad_file.read(vad_file.namelist()[0]).splitlines()) == 3
+        assert gpg.calls == 2
+        assert sorted(os.listdir(self.tmp_dir)) == ['data.csv', 'data.ved']
+
+    def test_records_are_yielded_from_any_source(self):
+        csv_converter = converter.Converter(CSV_TYPES, COMPANY_ID, compact=True)
+        records = list(csv_converter.iter_records(self.data_file_name))
+        assert [record.line for record in records] == [2, 3, 4]
+        assert records[0] == converter.Record(
+            2, '{"_id":"company_0","augmentedData":{"MEMBER_ID":"0","age":0,"city":"Paris"}}', None)
+        assert list(csv_converter.iter_records(io.StringIO(data_content()))) == records
+        assert list(csv_converter.iter_records([['1', 'x', 'Oslo']])) == \
+            [converter.Record(1, None, 'x is not a valid integer')]
+
+    def test_records_of_a_file_with_other_headers_are_an_error(self):
+        with pytest.raises(ValueError, match="Headers in data file don't match the types file"):
+            list(converter.Converter(CSV_TYPES, COMPANY_ID).iter_records(io.StringIO('MEMBER_ID,age\n1,2\n')))
+
+
+class TestCreateConverter(object):
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.type_file_name = os.path.join(self.tmp_dir, 'data.csvt')
+        with open(self.type_file_name, 'w') as type_file:
+            type_file.write('MEMBER_ID,age,city\nstring,integer,string\n')
+
+    def teardown_method(self):
+        for name in os.listdir(self.tmp_dir):
+            os.remove(os.path.join(self.tmp_dir, name))
+        os.rmdir(self.tmp_dir)
+
+    def test_gpg_is_set_up_once_for_the_recipients(self):
+        with mock.patch('csv2ved.vad2ved_converter.init_gpg', return_value=('gpg', "")) as init_gpg:
+            csv_converter, error = converter.create_converter(self.type_file_name, COMPANY_ID, prod=False,
+                                                              compact=True)
+        assert error == ""
+        assert init_gpg.call_count == 1
+        assert (csv_converter.gpg, csv_converter.options.compact) == ('gpg', True)
+        assert list(csv_converter.csv_types) == ['MEMBER_ID', 'age', 'city']
+
+    def test_gpg_error_is_returned(self):
+        with mock.patch('csv2ved.vad2ved_converter.init_gpg', return_value=(None, 'no keys')):
+            assert converter.create_converter(self.type_file_name, COMPANY_ID) == (None, 'no keys')
+
+    def test_invalid_type_file_is_an_error(self):
+        with open(self.type_file_name, 'w') as type_file:
+            type_file.write('')
+        assert converter.create_converter(self.type_file_name, COMPANY_ID) == (None, 'Type file is invalid or empty')
@@ -2,9 +2,14 @@ import copy
 import datetime
 import io
 import json
+import os
+import pytest
+import tempfile
 import uuid
 from collections import OrderedDict
+from csv2ved import checkpoints
 from csv2ved import csv2jpl_converter
+from csv2ved.conversion_options import ConversionOptions
 from unittest import mock
 
 
@@ -69,7 +74,7 @@ class TestGetMemberIdName(object):
         for name in member_id_names:
             self.csv_types[name] = "string"
             assert csv2jpl_converter.get_member_id_name(self.csv_types) == name
-            del(self.csv_types[name])
+            del self.csv_types[name]
 
     def test_returns_none_if_member_id_is_missing(self):
         assert csv2jpl_converter.get_member_id_name(self.csv_types) is None
@@ -192,9 +197,9 @@ class TestMakeJson(object):
         assert csv2jpl_converter.make_json(
             self.headers, self.csv_types, corrupted_data, self.company_id, self.member_id_column) == expected_result
 
-    @mock.patch('csv2ved.csv2json_type_converter.ConvertCsvDataToJson.convert', side_effect=ValueError)
-    def test_function_returns_error_if_data_conversion_fails(self, mock_csv2json_convert):
-        expected_result = (False, "Cannot convert 'MEMBER_ID' value '12345' to 'string'")
+    @mock.patch.dict('csv2ved.conversion_plan.FUSED_CONVERTERS', string=mock.Mock(side_effect=ValueError))
+    def test_function_returns_error_if_data_conversion_fails(self):
+        expected_result = (False, "12345 is not a valid string")
         assert csv2jpl_converter.make_json(
             self.headers, self.csv_types, self.data, self.company_id, self.member_id_column) == expected_result
 
@@ -346,3 +351,148 @@ class TestConverter(object):
         company_id = str(uuid.uuid4())
         result = csv2jpl_converter.convert(data_file, type_file, company_id, 2)
         assert ("", 0, [{1: "'MEMBER_ID' type must be string"}]) == result
+
+
+class Interrupted(Exception):
+    pass
+
+
+class TestCheckpointedConverter(object):
+    type_file_content = 'MEMBER_ID,name,balance\nstring,string,integer\n'
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_file_name = os.path.join(self.tmp_dir, 'data.csv')
+        self.type_file_name = os.path.join(self.tmp_dir, 'data.csvt')
+        self.company_id = str(uuid.uuid4())
+        rows = ['{},"name, {}",{}'.format(number, number, 'ten' if number in (7, 31) else number)
+                for number in range(1, 60)]
+        with open(self.data_file_name, 'w') as data_file:
+            data_file.write('MEMBER_ID,name,balance\n' + '\n'.join(rows) + '\n')
+        with open(self.type_file_name, 'w') as type_file:
+            type_file.write(self.type_file_content)
+
+    def teardown_method(self):
+        for name in os.listdir(self.tmp_dir):
+            os.remove(os.path.join(self.tmp_dir, name))
+        os.rmdir(self.tmp_dir)
+
+    def _convert(self, output_name, **options):
+        output_file_name = os.path.join(self.tmp_dir, output_name)
+        with mock.patch('csv2ved.csv2jpl_converter.generate_output_file_name', return_value=output_file_name):
+            return csv2jpl_converter.convert(open(self.data_file_name), open(self.type_file_name), self.company_id,
+                                             options=ConversionOptions(**options))
+
+    def _uninterrupted(self):
+        with mock.patch('os.remove'):
+            jpl_file_name, lines, errors = self._convert('expected.jpl')
+        with open(jpl_file_name) as jpl_file:
+            return jpl_file.read(), lines, errors
+
+    def test_checkpoints_give_the_same_output(self):
+        expected_output, expected_lines, expected_errors = self._uninterrupted()
+        with mock.patch('os.remove', side_effect=lambda name: None if name.endswith('.jpl') else os.unlink(name)):
+            jpl_file_name, lines, errors = self._convert('data_1.jpl', checkpoint_interval=100)
+        assert (lines, errors) == (expected_lines, expected_errors)
+        assert open(jpl_file_name).read() == expected_output
+        assert not os.path.exists(os.path.join(self.tmp_dir, 'data.checkpoint'))
+
+    def test_resume_continues_from_the_last_checkpoint(self):
+        expected_output, expected_lines, expected_errors = self._uninterrupted()
+        save_checkpoint = checkpoints.save_checkpoint
+        saved = []
+
+        def interrupt_after_three_saves(checkpoint_file_name, checkpoint):
+            save_checkpoint(checkpoint_file_name, checkpoint)
+            saved.append(checkpoint['input_offset'])
+            if len(saved) == 3:
+                raise Interrupted()
+
+        with mock.patch('csv2ved.checkpoints.save_checkpoint', side_effect=interrupt_after_three_saves):
+            with pytest.raises(Interrupted):
+                self._convert('data_1.jpl', checkpoint_interval=100)
+        # output written after the last checkpoint is dropped on resume
+        with open(os.path.join(self.tmp_dir, 'data_1.jpl'), 'a') as jpl_file:
+            jpl_file.write('{"partial": ')
+
+        with mock.patch('os.remove', side_effect=lambda name: None if name.endswith('.jpl') else os.unlink(name)):
+            jpl_file_name, lines, errors = self._convert('data_2.jpl', checkpoint_interval=100, resume=True)
+        assert jpl_file_name == os.path.join(self.tmp_dir, 'data_1.jpl')
+        assert (lines, errors) == (expected_lines, expected_errors)
+        assert open(jpl_file_name).read() == expected_output
+        assert not os.path.exists(os.path.join(self.tmp_dir, 'data.checkpoint'))
+
+    def test_resume_of_a_run_interrupted_before_its_first_chunk_uses_its_output_file(self):
+        expected_output, expected_lines, expected_errors = self._uninterrupted()
+        with mock.patch('csv2ved.parallel_converter.find_record_boundaries', side_effect=Interrupted):
+            with pytest.raises(Interrupted):
+                self._convert('data_1.jpl', checkpoint_interval=100)
+        assert os.path.exists(os.path.join(self.tmp_dir, 'data.checkpoint'))
+
+        with mock.patch('os.remove', side_effect=lambda name: None if name.endswith('.jpl') else os.unlink(name)):
+            jpl_file_name, lines, errors = self._convert('data_2.jpl', resume=True)
+        assert jpl_file_name == os.path.join(self.tmp_dir, 'data_1.jpl')
+        assert (lines, errors) == (expected_lines, expected_errors)
+        assert open(jpl_file_name).read() == expected_output
+        assert not os.path.exists(os.path.join(self.tmp_dir, 'data_2.jpl'))
+
+    def test_resume_rejects_a_checkpoint_of_other_types(self):
+        checkpoint = checkpoints.new_checkpoint(checkpoints.checkpoint_settings(
+            self.data_file_name, OrderedDict([('MEMBER_ID', 'string')]), self.company_id, False), 'data_1.jpl')
+        with open(os.path.join(self.tmp_dir, 'data.checkpoint'), 'w') as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file)
+        jpl_file_name, lines, errors = self._convert('data_2.jpl', resume=True)
+        assert jpl_file_name == ''
+        assert 'different data file, type file or options' in errors[0][0]
+
+    def test_resume_without_checkpoint_converts_the_whole_file(self):
+        expected_output, expected_lines, expected_errors = self._uninterrupted()
+        with mock.patch('os.remove', side_effect=lambda name: None if name.endswith('.jpl') else os.unlink(name)):
+            jpl_file_name, lines, errors = self._convert('data_1.jpl', resume=True)
+        assert (lines, errors) == (expected_lines, expected_errors)
+        assert open(jpl_file_name).read() == expected_output
+
+
+class TestValidate(object):
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_file_name = os.path.join(self.tmp_dir, 'data.csv')
+        self.type_file_name = os.path.join(self.tmp_dir, 'data.csvt')
+        self.company_id = str(uuid.uuid4())
+        with open(self.type_file_name, 'w') as type_file:
+            type_file.write('MEMBER_ID,name,balance\nstring,string,integer\n')
+
+    def teardown_method(self):
+        for name in os.listdir(self.tmp_dir):
+            os.remove(os.path.join(self.tmp_dir, name))
+        os.rmdir(self.tmp_dir)
+
+    def _write_data(self, content):
+        with open(self.data_file_name, 'w') as data_file:
+            data_file.write(content)
+
+    @pytest.mark.parametrize('kwargs', [{}, {'options': ConversionOptions(workers=2)}, {'max_number_of_errors': 2}])
+    def test_errors_are_the_same_as_convert(self, kwargs):
+        self._write_data('MEMBER_ID,name,balance\n1,John,ten\n2,Jane\n3,Jim,3\n,Joe,4\n')
+        with mock.patch('os.remove'):
+            _, _, expected_errors = csv2jpl_converter.convert(open(self.data_file_name), open(self.type_file_name),
+                                                              self.company_id, **kwargs)
+        _, errors = csv2jpl_converter.validate(open(self.data_file_name), open(self.type_file_name), self.company_id,
+                                               **kwargs)
+        assert errors == expected_errors
+
+    def test_valid_file_writes_no_output(self):
+        self._write_data('MEMBER_ID,name,balance\n1,John,1\n2,Jane,2\n')
+        assert csv2jpl_converter.validate(open(self.data_file_name), open(self.type_file_name),
+                                          self.company_id) == (2, [])
+        assert sorted(os.listdir(self.tmp_dir)) == ['data.csv', 'data.csvt']
+
+    def test_header_and_empty_file_errors(self):
+        self._write_data('MEMBER_ID,name\n1,John\n')
+        assert csv2jpl_converter.validate(open(self.data_file_name), open(self.type_file_name),
+                                          self.company_id) == (0, [{1: "Headers in data file don't match the "
+                                                                       "types file"}])
+        self._write_data('')
+        assert csv2jpl_converter.validate(open(self.data_file_name), open(self.type_file_name),
+                                          self.company_id) == (0, [{0: "{} is empty".format(self.data_file_name)}])
@@ -0,0 +1,77 @@
+import pytest
+from dateutil.parser import parse
+from csv2ved import date_parser
+
+
+class TestParseIsoDatetime(object):
+    iso_values = [
+        '2013-01-01',
+        '0001-01-01',
+        '2018-01-31T12:13:14',
+        '2018-01-31 12:13:14',
+        '2018-01-31T12:13',
+        '2018-01-31T12:13:14.5',
+        '2018-01-31T12:13:14.000',
+        '2018-01-31T12:13:14.123456',
+        '2018-01-31T12:13:14Z',
+        '2018-01-31T12:13:14.5Z',
+        '2018-01-31T12:13:14+05:30',
+        '2018-01-31T12:13:14-00:00',
+        '2018-01-31T23:59:59+14:00'
+    ]
+
+    def test_fast_path_matches_dateutil_output(self):
+        for value in self.iso_values:
+            parsed = date_parser.parse_iso_datetime(value)
+            expected = parse(value)
+            assert parsed.isoformat() == expected.isoformat()
+            assert parsed.strftime("%Y-%m-%d") == expected.strftime("%Y-%m-%d")
+
+    def test_fast_path_returns_none_for_other_layouts(self):
+        test_data = ['Mar 1, 2020', '3/1/2020', '2018-1-3', '2018-01-31T12', '2018-01-31Z',
+                     '2018-01-31T12:13:14.1234567', '2018-01-31T12:13:14 +05:30', '20180131', '٢٠١٨-01-31']
+        for value in test_data:
+            assert date_parser.parse_iso_datetime(value) is None
+
+    def test_fast_path_returns_none_for_out_of_range_values(self):
+        test_data = ['2018-02-30', '2018-13-01', '2018-01-31T24:00:00', '2018-01-31T12:13:14+24:00']
+        for value in test_data:
+            assert date_parser.parse_iso_datetime(value) is None
+
+
+class TestParseDatetimeValue(object):
+
+    def test_falls_back_to_dateutil(self):
+        assert date_parser.parse_datetime_value('Mar 1, 2020').isoformat() == '2020-03-01T00:00:00'
+
+    def test_rejects_integers(self):
+        with pytest.raises(ValueError):
+            date_parser.parse_datetime_value('1234')
+
+    def test_rejects_invalid_iso_dates(self):
+        with pytest.raises(ValueError):
+            date_parser.parse_datetime_value('2018-02-30')
+
+
+class TestCached(object):
+
+    def test_cached_parser_keeps_its_own_cache(self):
+        first = date_parser.cached(date_parser.parse_datetime_value)
+        second = date_parser.cached(date_parser.parse_datetime_value)
+        first('2013-01-01')
+        first('2013-01-01')
+        assert first.cache_info().hits == 1
+        assert second.cache_info().currsize == 0
+
+    def test_cached_parser_is_bounded(self):
+        parser = date_parser.cached(date_parser.parse_datetime_value, maxsize=2)
+        for value in ['2013-01-01', '2013-01-02', '2013-01-03']:
+            parser(value)
+        assert parser.cache_info().currsize == 2
+
+    def test_cached_parser_raises_for_invalid_values(self):
+        parser = date_parser.cached(date_parser.parse_datetime_value)
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                parser('foo')
+        assert parser.cache_info().currsize == 0
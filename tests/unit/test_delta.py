@@ -0,0 +1,152 @@
+import io
+import json
+import os
+import tempfile
+import pytest
+from csv2ved import csv2jpl_converter
+from csv2ved import delta
+from unittest import mock
+
+pytest.importorskip('numpy')
+
+
+def json_line(member_id, balance, compact=False):
+    separators = (',', ':') if compact else (', ', ': ')
+    return json.dumps({"_id": "company_{}".format(member_id),
+                       "augmentedData": {"MEMBER_ID": member_id, "balance": balance}},
+                      separators=separators)
+
+
+class TestDeltaFilter(object):
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.manifest_file_name = os.path.join(self.tmp_dir, 'partner.manifest')
+
+    def teardown_method(self):
+        for name in os.listdir(self.tmp_dir):
+            os.remove(os.path.join(self.tmp_dir, name))
+        os.rmdir(self.tmp_dir)
+
+    def _run(self, lines, tombstones=False, compact=False, commit=True):
+        delta_filter = delta.DeltaFilter(self.manifest_file_name, tombstones, compact)
+        assert delta_filter.load() == ""
+        output = io.StringIO()
+        delta_filter.start(output)
+        for line in lines:
+            delta_filter.write(line + '\n')
+        delta_filter.finish()
+        if commit:
+            delta_filter.commit()
+        return output.getvalue().splitlines(), dict(delta_filter.stats)
+
+    def test_first_run_writes_every_line(self):
+        lines = [json_line(str(number), number) for number in range(5)]
+        assert self._run(lines) == (lines, {'new': 5, 'changed': 0, 'unchanged': 0, 'removed': 0})
+
+    def test_next_run_writes_only_new_and_changed_lines(self):
+        self._run([json_line(str(number), number) for number in range(5)])
+        lines = [json_line("0", 0), json_line("1", 100), json_line("3", 3), json_line("4", 4), json_line("5", 5)]
+        output, stats = self._run(lines)
+        assert output == [json_line("1", 100), json_line("5", 5)]
+        assert stats == {'new': 1, 'changed': 1, 'unchanged': 3, 'removed': 1}
+
+    def test_tombstones_are_written_for_removed_records(self):
+        self._run([json_line(str(number), number) for number in range(3)])
+        output, _ = self._run([json_line("1", 1)], tombstones=True)
+        assert [json.loads(line) for line in output] == [{"_id": "company_0", "deleted": True},
+                                                         {"_id": "company_2", "deleted": True}]
+
+    def test_manifest_is_only_replaced_on_commit(self):
+        self._run([json_line("1", 1)])
+        self._run([json_line("1", 2)], commit=False)
+        output, stats = self._run([json_line("1", 2)])
+        assert output == [json_line("1", 2)]
+        assert stats['changed'] == 1
+
+    def test_written_lines_are_the_changed_lines_and_tombstones(self):
+        self._run([json_line(str(number), number) for number in range(3)])
+        delta_filter = delta.DeltaFilter(self.manifest_file_name, tombstones=True)
+        delta_filter.load()
+        delta_filter.start(io.StringIO())
+        delta_filter.write(json_line("1", 1) + '\n' + json_line("2", 20) + '\n' + json_line("3", 3) + '\n')
+        delta_filter.finish()
+        assert delta_filter.written == 3
+
+    def test_discarded_manifest_keeps_the_previous_one(self):
+        self._run([json_line("1", 1)])
+        with open(self.manifest_file_name, 'rb') as manifest_file:
+            manifest = manifest_file.read()
+        delta_filter = delta.DeltaFilter(self.manifest_file_name)
+        delta_filter.load()
+        delta_filter.start(io.StringIO())
+        delta_filter.write(json_line("1", 2) + '\n')
+        delta_filter.finish()
+        delta_filter.discard()
+        assert os.listdir(self.tmp_dir) == ['partner.manifest']
+        with open(self.manifest_file_name, 'rb') as manifest_file:
+            assert manifest_file.read() == manifest
+
+    def test_lines_written_in_blocks_are_filtered(self):
+        self._run([json_line(str(number), number) for number in range(3)])
+        delta_filter = delta.DeltaFilter(self.manifest_file_name)
+        delta_filter.load()
+        output = io.StringIO()
+        delta_filter.start(output)
+        delta_filter.write(''.join(json_line(str(number), number * 2) + '\n' for number in range(3)))
+        delta_filter.finish()
+        assert output.getvalue().splitlines() == [json_line("1", 2), json_line("2", 4)]
+
+    def test_manifest_of_other_separators_is_rejected(self):
+        self._run([json_line("1", 1)])
+        assert 'without --compact-json' in delta.DeltaFilter(self.manifest_file_name, compact=True).load()
+
+    def test_manifest_of_raw_json_lines_is_rejected(self):
+        delta_filter = delta.DeltaFilter(self.manifest_file_name, raw_json=True)
+        delta_filter.start(io.StringIO())
+        delta_filter.write(json_line("1", 1) + '\n')
+        delta_filter.finish()
+        delta_filter.commit()
+        assert 'with --raw-json' in delta.DeltaFilter(self.manifest_file_name).load()
+
+    def test_other_files_are_rejected(self):
+        with open(self.manifest_file_name, 'wb') as manifest_file:
+            manifest_file.write(b'MEMBER_ID,name\n1,John Smith\n')
+        assert 'is not a delta manifest' in delta.DeltaFilter(self.manifest_file_name).load()
+
+
+class TestConvertWithDelta(object):
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.manifest_file_name = os.path.join(self.tmp_dir, 'partner.manifest')
+        self.data_file_name = os.path.join(self.tmp_dir, 'data.csv')
+
+    def teardown_method(self):
+        for name in os.listdir(self.tmp_dir):
+            os.remove(os.path.join(self.tmp_dir, name))
+        os.rmdir(self.tmp_dir)
+
+    def _convert(self, content):
+        with open(self.data_file_name, 'w') as data_file:
+            data_file.write('MEMBER_ID,balance\n' + content)
+        delta_filter = delta.DeltaFilter(self.manifest_file_name)
+        assert delta_filter.load() == ""
+        with mock.patch('csv2ved.csv2jpl_converter.generate_output_file_name',
+                        return_value=os.path.join(self.tmp_dir, 'data_1.jpl')):
+            type_file = io.StringIO('MEMBER_ID,balance\nstring,integer')
+            result = csv2jpl_converter.convert(open(self.data_file_name), type_file, 'company',
+                                               delta_filter=delta_filter)
+        if not result[2]:
+            os.remove(result[0])
+            delta_filter.commit()
+        return result[1:]
+
+    def test_lines_written_are_the_lines_that_changed(self):
+        assert self._convert('1,1\n2,2\n3,3\n') == (3, [])
+        assert self._convert('1,1\n2,20\n3,3\n') == (1, [])
+
+    def test_manifest_of_a_failed_conversion_is_removed(self):
+        self._convert('1,1\n')
+        assert self._convert('1,1\n2,two\n')[1] == [{3: 'two is not a valid integer'}]
+        assert sorted(os.listdir(self.tmp_dir)) == ['data.csv', 'partner.manifest']
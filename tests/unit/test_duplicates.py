@@ -0,0 +1,90 @@
+import json
+import os
+import tempfile
+import uuid
+import pytest
+from csv2ved import csv2jpl_converter
+from csv2ved import duplicates
+from csv2ved.conversion_options import ConversionOptions
+
+pytest.importorskip('numpy')
+
+
+def json_line(member_id, balance=0):
+    return json.dumps({"_id": "company_{}".format(member_id),
+                       "augmentedData": {"MEMBER_ID": member_id, "balance": balance}})
+
+
+class TestDuplicateDetector(object):
+    member_ids = ["1", "2", "1", "3", "2", "1"]
+
+    def _detector(self, policy):
+        detector = duplicates.DuplicateDetector(policy)
+        for line, member_id in enumerate(self.member_ids, 2):
+            detector.add(json_line(member_id), line)
+        return detector
+
+    def test_no_duplicates(self):
+        detector = duplicates.DuplicateDetector()
+        detector.add_lines(json_line("1") + "\n" + json_line("2") + "\n", [2, 3])
+        assert detector.find() == []
+        assert detector.duplicates == []
+
+    def test_duplicates_are_reported_with_the_first_line(self):
+        detector = self._detector(duplicates.ERROR)
+        assert detector.find() == [2, 4, 5]
+        assert detector.duplicates == [(4, 2), (6, 3), (7, 2)]
+
+    def test_keep_first_removes_the_later_records(self):
+        detector = self._detector(duplicates.KEEP_FIRST)
+        assert detector.find() == [2, 4, 5]
+
+    def test_keep_last_removes_the_earlier_records(self):
+        detector = self._detector(duplicates.KEEP_LAST)
+        assert detector.find() == [0, 1, 2]
+        assert detector.duplicates == [(2, 7), (3, 6), (4, 7)]
+
+    def test_duplicate_errors_are_merged_in_line_order(self):
+        error_lines = duplicates.add_duplicate_errors([{5: "error"}], [(4, 2), (7, 2)], 2)
+        assert error_lines == [{4: "Duplicate MEMBER_ID, first seen on line 2"}, {5: "error"}]
+
+
+class TestConvertWithDuplicates(object):
+    type_file_content = 'MEMBER_ID,name,balance\nstring,string,integer\n'
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_file_name = os.path.join(self.tmp_dir, 'data.csv')
+        self.type_file_name = os.path.join(self.tmp_dir, 'data.csvt')
+        self.company_id = str(uuid.uuid4())
+        with open(self.data_file_name, 'w') as data_file:
+            data_file.write('MEMBER_ID,name,balance\n1,first,1\n2,other,2\n\n1,second,3\n3,other,4\n')
+        with open(self.type_file_name, 'w') as type_file:
+            type_file.write(self.type_file_content)
+
+    def teardown_method(self):
+        for name in os.listdir(self.tmp_dir):
+            os.remove(os.path.join(self.tmp_dir, name))
+        os.rmdir(self.tmp_dir)
+
+    def _convert(self, policy, **options):
+        detector = duplicates.DuplicateDetector(policy)
+        jpl_file_name, lines, errors = csv2jpl_converter.convert(
+            open(self.data_file_name), open(self.type_file_name), self.company_id,
+            options=ConversionOptions(**options), duplicate_detector=detector)
+        names = []
+        if jpl_file_name and os.path.exists(jpl_file_name):
+            with open(jpl_file_name) as jpl_file:
+                names = [json.loads(line)["augmentedData"]["name"] for line in jpl_file]
+        return lines, errors, names
+
+    @pytest.mark.parametrize('kwargs', [{}, {'batch_size': 2}, {'workers': 2}])
+    def test_error_policy_fails_the_conversion(self, kwargs):
+        lines, errors, _ = self._convert(duplicates.ERROR, **kwargs)
+        assert errors == [{5: "Duplicate MEMBER_ID, first seen on line 2"}]
+
+    def test_keep_first_leaves_out_the_later_record(self):
+        assert self._convert(duplicates.KEEP_FIRST) == (3, [], ['first', 'other', 'other'])
+
+    def test_keep_last_leaves_out_the_earlier_record(self):
+        assert self._convert(duplicates.KEEP_LAST, workers=2) == (3, [], ['other', 'second', 'other'])
@@ -0,0 +1,113 @@
+import os
+import tempfile
+import uuid
+from csv2ved import files_converter
+from csv2ved.conversion_options import ConversionOptions
+
+
+class MockEncryptFile(object):
+
+    def __init__(self, status):
+        self.status = status
+
+
+class MockGPG(object):
+    """Writes the plaintext as the 'encrypted' output"""
+
+    def encrypt_file(self, file, recipients, output, always_trust):
+        with open(output, 'wb') as output_file:
+            output_file.write(file.read())
+        return MockEncryptFile('encryption ok')
+
+
+class TestFindDataFiles(object):
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        for name in ['b.csv', 'a.csv', 'a.csvt', 'notes.txt']:
+            open(os.path.join(self.tmp_dir, name), 'w').close()
+        os.mkdir(os.path.join(self.tmp_dir, 'dir.csv'))
+
+    def teardown_method(self):
+        os.rmdir(os.path.join(self.tmp_dir, 'dir.csv'))
+        for name in os.listdir(self.tmp_dir):
+            os.remove(os.path.join(self.tmp_dir, name))
+        os.rmdir(self.tmp_dir)
+
+    def test_returns_sorted_matching_files(self):
+        assert files_converter.find_data_files(self.tmp_dir, '*.csv') == \
+            [os.path.join(self.tmp_dir, 'a.csv'), os.path.join(self.tmp_dir, 'b.csv')]
+
+    def test_type_file_has_the_data_file_name(self):
+        assert files_converter.type_file_for(os.path.join('dir', 'data.csv')) == os.path.join('dir', 'data.csvt')
+
+    def test_type_file_of_a_compressed_data_file_has_the_data_file_name(self):
+        assert files_converter.type_file_for(os.path.join('dir', 'data.csv.gz')) == os.path.join('dir', 'data.csvt')
+
+
+class TestConvertFiles(object):
+    type_file_content = 'MEMBER_ID,name,balance\nstring,string,integer\n'
+    recipients = ['rroy@tucowsinc.com']
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.company_id = str(uuid.uuid4())
+        self._write('good.csv', 'MEMBER_ID,name,balance\n1,John,10\n2,Jane,20\n')
+        self._write('good.csvt', self.type_file_content)
+        self._write('bad.csv', 'MEMBER_ID,name,balance\n1,John,ten\n')
+        self._write('bad.csvt', self.type_file_content)
+
+    def teardown_method(self):
+        for name in os.listdir(self.tmp_dir):
+            os.remove(os.path.join(self.tmp_dir, name))
+        os.rmdir(self.tmp_dir)
+
+    def _write(self, name, content):
+        with open(os.path.join(self.tmp_dir, name), 'w') as output_file:
+            output_file.write(content)
+
+    def _file_names(self, *names):
+        return [(os.path.join(self.tmp_dir, name), files_converter.type_file_for(os.path.join(self.tmp_dir, name)))
+                for name in names]
+
+    def test_each_file_gets_a_result_in_order(self):
+        results = files_converter.convert_files(MockGPG(), self._file_names('good.csv', 'bad.csv'),
+                                                self.company_id, self.recipients)
+        assert [result.data_file for result in results] == [os.path.join(self.tmp_dir, 'good.csv'),
+                                                            os.path.join(self.tmp_dir, 'bad.csv')]
+        assert results[0].ved_file.endswith('.ved') and os.path.exists(results[0].ved_file)
+        assert results[0].lines == 2
+        assert results[0].errors == []
+        assert results[1].ved_file is None
+        assert list(results[1].errors[0]) == [2]
+
+    def test_a_missing_type_file_fails_only_that_file(self):
+        os.remove(os.path.join(self.tmp_dir, 'bad.csvt'))
+        results = files_converter.convert_files(MockGPG(), self._file_names('bad.csv', 'good.csv'),
+                                                self.company_id, self.recipients)
+        assert results[0].ved_file is None
+        assert 'bad.csvt' in results[0].message
+        assert results[1].ved_file is not None
+
+    def test_jobs_convert_files_in_a_pool(self):
+        self._write('other.csv', 'MEMBER_ID,name,balance\n3,Jim,30\n')
+        self._write('other.csvt', self.type_file_content)
+        results = files_converter.convert_files(MockGPG(), self._file_names('good.csv', 'other.csv', 'bad.csv'),
+                                                self.company_id, self.recipients, jobs=2)
+        assert [result.lines for result in results] == [2, 1, 0]
+        assert [result.ved_file is not None for result in results] == [True, True, False]
+
+    def test_stream_mode_writes_ved_files(self):
+        results = files_converter.convert_files(MockGPG(), self._file_names('good.csv'), self.company_id,
+                                                self.recipients, options=ConversionOptions(stream=True))
+        assert results[0].ved_file is not None and os.path.exists(results[0].ved_file)
+        assert results[0].lines == 2
+
+    def test_summary_has_a_row_per_file(self):
+        results = [files_converter.FileResult('a.csv', 'a_1.ved', 2, [], 0.5, 'encryption ok'),
+                   files_converter.FileResult('long_name.csv', None, 1, [{2: 'error'}], 0.25, 'Conversion failed')]
+        lines = files_converter.format_summary(results)
+        assert lines[0].split() == ['file', 'status', 'rows', 'errors', 'seconds', 'output']
+        assert lines[1].split() == ['a.csv', 'ok', '2', '0', '0.50', 'a_1.ved']
+        assert lines[2].split() == ['long_name.csv', 'failed', '1', '1', '0.25', 'Conversion', 'failed']
+        assert lines[1].index('ok') == lines[2].index('failed') == lines[0].index('status')
@@ -0,0 +1,32 @@
+from csv2ved.fragment_cache import FragmentCache
+
+
+class TestFragmentCache(object):
+
+    def test_added_fragments_are_returned(self):
+        cache = FragmentCache()
+        assert cache.get('Toronto') is None
+        cache.add('Toronto', '"city": "Toronto"')
+        assert cache.get('Toronto') == '"city": "Toronto"'
+
+    def test_oldest_fragment_is_evicted_when_full(self):
+        cache = FragmentCache(size=2)
+        for value in ['a', 'b', 'c']:
+            cache.add(value, value.upper())
+        assert [cache.get(value) for value in ['a', 'b', 'c']] == [None, 'B', 'C']
+
+    def test_cache_stops_after_too_many_distinct_values_in_a_window(self):
+        cache = FragmentCache(window=10, distinct_limit=3)
+        for value in range(10):
+            cache.add(str(value), str(value))
+        assert not cache.active
+        cache.add('1', '1')
+        assert cache.get('1') is None
+
+    def test_cache_stays_active_while_values_repeat(self):
+        cache = FragmentCache(window=10, distinct_limit=3)
+        for value in range(100):
+            if cache.get(str(value % 3)) is None:
+                cache.add(str(value % 3), str(value % 3))
+        assert cache.active
+        assert cache.get('2') == '2'
@@ -1,6 +1,9 @@
 from unittest import mock
+import io
 import os
+import pytest
 import tempfile
+import zipfile
 
 from csv2ved import jpl2vad_converter
 
@@ -70,6 +73,87 @@ class TestArchiveJplData(object):
         assert type(jpl_size) is int
         assert type(vad_size) is int
 
+    def test_get_compression_details_with_valid_vad_file(self):
+        vad_file, errors = jpl2vad_converter.archive_jpl_data(self._vad_filename, self._jpl_filename)
+        assert errors is None
+        info = jpl2vad_converter.get_compression_details(vad_file, seconds=0.5)
+        sizes = jpl2vad_converter.get_compression_info(vad_file)
+        os.remove(vad_file)
+        assert (info.file_size, info.compress_size) == sizes
+        assert type(info.file_size) is int
+        assert (info.codec, info.seconds) == ('deflate', 0.5)
+
+
+class TestCompressionCodecs(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.TMP_DIR = tempfile.mkdtemp()
+        cls._vad_filename = os.path.join(cls.TMP_DIR, 'file_YYYYMMDDhhmmss.vad')
+        cls._jpl_filename = os.path.join(cls.TMP_DIR, 'file_YYYYMMDDhhmmss.jpl')
+        cls._jpl_data = b''.join(b'{"_id": "company_%d", "augmentedData": {"balance": %d}}\n' % (number, number)
+                                 for number in range(1000))
+        with open(cls._jpl_filename, 'wb') as f:
+            f.write(cls._jpl_data)
+
+    @classmethod
+    def teardown_class(cls):
+        os.remove(cls._jpl_filename)
+        os.rmdir(cls.TMP_DIR)
+
+    def test_zip_codecs_write_readable_archives(self):
+        for codec, compression in [('deflate-1', zipfile.ZIP_DEFLATED), ('deflate-9', zipfile.ZIP_DEFLATED),
+                                   ('bzip2', zipfile.ZIP_BZIP2), ('lzma', zipfile.ZIP_LZMA)]:
+            vad_file, errors = jpl2vad_converter.archive_jpl_data(self._vad_filename, self._jpl_filename, codec)
+            assert errors is None
+            with zipfile.ZipFile(vad_file) as archive:
+                assert archive.read(jpl2vad_converter.JPL_FILENAME_IN_ARCHIVE) == self._jpl_data
+                assert archive.getinfo(jpl2vad_converter.JPL_FILENAME_IN_ARCHIVE).compress_type == compression
+            info = jpl2vad_converter.get_compression_details(vad_file)
+            os.remove(vad_file)
+            assert info.file_size == len(self._jpl_data)
+            assert info.codec == codec.split('-')[0]
+
+    def test_zstd_codec_writes_zstd_frame(self):
+        zstandard = pytest.importorskip('zstandard')
+        vad_file, errors = jpl2vad_converter.archive_jpl_data(self._vad_filename, self._jpl_filename, 'zstd')
+        assert errors is None
+        with open(vad_file, 'rb') as f:
+            assert zstandard.ZstdDecompressor().decompress(f.read()) == self._jpl_data
+        info = jpl2vad_converter.get_compression_details(vad_file)
+        os.remove(vad_file)
+        assert (info.file_size, info.codec) == (len(self._jpl_data), 'zstd')
+
+    @mock.patch('csv2ved.jpl2vad_converter.zstandard', None)
+    def test_zstd_codec_without_zstandard_returns_error(self):
+        vad_file, errors = jpl2vad_converter.archive_jpl_data(self._vad_filename, self._jpl_filename, 'zstd')
+        assert vad_file is None
+        assert 'zstandard' in errors
+
+    def test_measure_codecs_reports_ratio_and_throughput(self):
+        measures = jpl2vad_converter.measure_codecs(self._jpl_data, ['deflate-1', 'lzma'])
+        assert [codec for codec, _, _ in measures] == ['deflate-1', 'lzma']
+        assert all(ratio > 1 and throughput > 0 for _, ratio, throughput in measures)
+
+    def test_choose_codec_picks_best_ratio_for_small_files(self):
+        measures = [('deflate-1', 3.0, 1e6), ('deflate', 4.0, 1e6), ('lzma', 5.0, 1e5)]
+        with mock.patch('csv2ved.jpl2vad_converter.measure_codecs', return_value=measures):
+            assert jpl2vad_converter.choose_codec(self._jpl_filename) == 'lzma'
+
+    @mock.patch('csv2ved.jpl2vad_converter.AUTO_MAX_SECONDS', 0)
+    def test_choose_codec_picks_best_ratio_above_throughput_target(self):
+        fast = jpl2vad_converter.AUTO_MIN_THROUGHPUT
+        measures = [('deflate-1', 3.0, fast * 4), ('deflate', 4.0, fast * 2), ('lzma', 5.0, fast / 4)]
+        with mock.patch('csv2ved.jpl2vad_converter.measure_codecs', return_value=measures):
+            assert jpl2vad_converter.choose_codec(self._jpl_filename) == 'deflate'
+
+    @mock.patch('csv2ved.jpl2vad_converter.AUTO_MAX_SECONDS', 0)
+    def test_choose_codec_picks_fastest_below_throughput_target(self):
+        slow = jpl2vad_converter.AUTO_MIN_THROUGHPUT / 10
+        measures = [('deflate-1', 3.0, slow * 2), ('lzma', 5.0, slow)]
+        with mock.patch('csv2ved.jpl2vad_converter.measure_codecs', return_value=measures):
+            assert jpl2vad_converter.choose_codec(self._jpl_filename) == 'deflate-1'
+
 
 class TestConvert(object):
 
@@ -95,5 +179,61 @@ class TestConvert(object):
         mock_compression_info.return_value = None, None
         result = jpl2vad_converter.convert(self._jpl_filename)
         assert result is not None
-        assert mock_data_archiver.call_args_list == [mock.call(self._vad_filename, self._jpl_filename)]
+        assert mock_data_archiver.call_args_list == [mock.call(self._vad_filename, self._jpl_filename, 'deflate')]
         assert mock_compression_info.call_args_list == [mock.call(self._vad_filename)]
+
+    def test_vad_convert_returns_the_jpl_and_vad_sizes(self):
+        with open(self._jpl_filename, 'w') as f:
+            f.write('{"_id": "1"}\n')
+        vad_file, errors, jpl_size, vad_size = jpl2vad_converter.convert(self._jpl_filename)
+        os.remove(vad_file)
+        assert (vad_file, errors, jpl_size) == (self._vad_filename, None, 13)
+        assert type(vad_size) is int
+
+    @mock.patch('csv2ved.jpl2vad_converter.choose_codec', return_value='lzma')
+    @mock.patch('csv2ved.jpl2vad_converter.archive_jpl_data')
+    def test_vad_convert_with_auto_compression_uses_chosen_codec(self, mock_data_archiver, mock_choose_codec):
+        mock_data_archiver.return_value = None, 'error'
+        jpl2vad_converter.convert(self._jpl_filename, 'auto')
+        assert mock_data_archiver.call_args_list == [mock.call(self._vad_filename, self._jpl_filename, 'lzma')]
+
+
+class TestArchiveStream(object):
+
+    def test_archive_written_to_unseekable_stream_contains_jpl_data(self):
+        read_descriptor, write_descriptor = os.pipe()
+        with open(write_descriptor, 'wb') as vad_stream:
+            with jpl2vad_converter.archive_stream(vad_stream) as jpl_stream:
+                jpl_stream.write(b'{"_id": "1"}\n')
+        with open(read_descriptor, 'rb') as vad_stream:
+            vad_data = vad_stream.read()
+
+        archive = zipfile.ZipFile(io.BytesIO(vad_data))
+        assert archive.namelist() == [jpl2vad_converter.JPL_FILENAME_IN_ARCHIVE]
+        assert archive.read(jpl2vad_converter.JPL_FILENAME_IN_ARCHIVE) == b'{"_id": "1"}\n'
+        assert archive.getinfo(jpl2vad_converter.JPL_FILENAME_IN_ARCHIVE).compress_type == zipfile.ZIP_DEFLATED
+
+    def test_archive_stream_uses_codec(self):
+        read_descriptor, write_descriptor = os.pipe()
+        with open(write_descriptor, 'wb') as vad_stream:
+            with jpl2vad_converter.archive_stream(vad_stream, 'bzip2') as jpl_stream:
+                jpl_stream.write(b'{"_id": "1"}\n')
+        with open(read_descriptor, 'rb') as vad_stream:
+            vad_data = vad_stream.read()
+
+        archive = zipfile.ZipFile(io.BytesIO(vad_data))
+        assert archive.read(jpl2vad_converter.JPL_FILENAME_IN_ARCHIVE) == b'{"_id": "1"}\n'
+        assert archive.getinfo(jpl2vad_converter.JPL_FILENAME_IN_ARCHIVE).compress_type == zipfile.ZIP_BZIP2
+
+    def test_archive_stream_uses_codec_level(self):
+        jpl_data = b''.join(b'{"_id": "%d", "augmentedData": {"name": "name %d"}}\n' % (number, number * 7)
+                            for number in range(5000))
+        compress_sizes = []
+        for codec in ['deflate-1', 'deflate-9']:
+            vad_stream = io.BytesIO()
+            with jpl2vad_converter.archive_stream(vad_stream, codec) as jpl_stream:
+                jpl_stream.write(jpl_data)
+            archive = zipfile.ZipFile(vad_stream)
+            assert archive.read(jpl2vad_converter.JPL_FILENAME_IN_ARCHIVE) == jpl_data
+            compress_sizes.append(archive.getinfo(jpl2vad_converter.JPL_FILENAME_IN_ARCHIVE).compress_size)
+        assert compress_sizes[0] > compress_sizes[1]
@@ -0,0 +1,72 @@
+import io
+import os
+import pstats
+import tempfile
+from csv2ved import metrics
+
+
+class TestStageMetrics(object):
+
+    def test_stage_records_times_bytes_and_rows(self):
+        stage_metrics = metrics.StageMetrics()
+        with stage_metrics.stage('conversion', 100) as record:
+            record['bytes_out'] = 200
+            record['rows'] = 10
+        stage = stage_metrics.as_dict()['stages'][0]
+        assert stage['stage'] == 'conversion'
+        assert stage['bytes_in'] == 100
+        assert stage['bytes_out'] == 200
+        assert stage['wall_seconds'] >= 0
+        assert stage['cpu_seconds'] >= 0
+
+    def test_stage_is_recorded_when_it_raises(self):
+        stage_metrics = metrics.StageMetrics()
+        try:
+            with stage_metrics.stage('archive'):
+                raise SystemExit(2)
+        except SystemExit:
+            pass
+        assert [stage['stage'] for stage in stage_metrics.stages] == ['archive']
+
+    def test_rows_per_second_is_none_without_rows(self):
+        stage_metrics = metrics.StageMetrics()
+        with stage_metrics.stage('type_load'):
+            pass
+        assert stage_metrics.as_dict()['stages'][0]['rows_per_second'] is None
+
+    def test_report_lines_include_peak_memory(self):
+        stage_metrics = metrics.StageMetrics()
+        with stage_metrics.stage('encrypt', 100):
+            pass
+        lines = stage_metrics.report_lines()
+        assert lines[0].startswith('encrypt: ')
+        assert '100 bytes in' in lines[0]
+        assert lines[-1].startswith('peak memory: ')
+
+    def test_profiled_dumps_stats(self):
+        profile_file_name = os.path.join(tempfile.mkdtemp(), 'conversion.prof')
+        stage_metrics = metrics.StageMetrics(profile_file_name)
+        with stage_metrics.profiled():
+            sorted(range(1000))
+        assert pstats.Stats(profile_file_name).total_calls > 0
+        os.remove(profile_file_name)
+
+
+class TestNullMetrics(object):
+
+    def test_null_metrics_record_nothing(self):
+        with metrics.NULL_METRICS.stage('conversion', 100) as record, metrics.NULL_METRICS.profiled():
+            record['rows'] = 10
+        assert not hasattr(metrics.NULL_METRICS, 'stages')
+
+
+class TestFileSize(object):
+
+    def test_file_size_of_regular_file(self):
+        with tempfile.TemporaryFile() as data_file:
+            data_file.write(b'12345')
+            data_file.flush()
+            assert metrics.file_size(data_file) == 5
+
+    def test_file_size_of_in_memory_stream_is_none(self):
+        assert metrics.file_size(io.StringIO('12345')) is None
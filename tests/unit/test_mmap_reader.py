@@ -0,0 +1,70 @@
+import csv
+import os
+import tempfile
+import pytest
+from csv2ved import csv2jpl_converter
+from csv2ved import mmap_reader
+from unittest import mock
+
+
+def csv_reader_rows(file_name, encoding):
+    with open(file_name, encoding=encoding) as csv_file:
+        return [[value.strip() for value in line] for line in csv.reader(csv_file, delimiter=',', quotechar='"')]
+
+
+class TestMmapCsvFileIterator(object):
+    contents = [
+        '',
+        'MEMBER_ID,name\n',
+        'MEMBER_ID,name\n1,John Smith\n2, Jane Doe \n',
+        'MEMBER_ID,name\n1,John Smith',
+        'MEMBER_ID,name\n\n1,John Smith\n\n\n2,Jane\n',
+        'MEMBER_ID,name\r\n1,John Smith\r\n2,Jane\r\n',
+        'MEMBER_ID,name\r1,John Smith\r2,Jane\r',
+        'MEMBER_ID,name\n1,John\r\n2,Jane\r3,Joe\n',
+        'MEMBER_ID,name\n1,"Smith, John"\n2,"Jane ""JD"" Doe"\n3,Joe\n',
+        'MEMBER_ID,name\n1,"John\nSmith"\n2,Jane\n3,"Joe\r\nBloggs"\n4,Jim\n',
+        'MEMBER_ID,name\n1,"John\n\n,Smith\n"\n2,Jane\n',
+        'MEMBER_ID,name\n1,a"b\n2,"unterminated\n3,Joe\n',
+        'MEMBER_ID,name\n1,Zoë\n2,"Jürgen, K"\n',
+    ]
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_file_name = os.path.join(self.tmp_dir, 'data.csv')
+
+    def teardown_method(self):
+        os.remove(self.data_file_name)
+        os.rmdir(self.tmp_dir)
+
+    def _rows(self, content, encoding='utf-8'):
+        with open(self.data_file_name, 'w', encoding=encoding, newline='') as data_file:
+            data_file.write(content)
+        data_file = open(self.data_file_name, encoding=encoding)
+        rows = list(mmap_reader.csv_file_iterator(data_file))
+        assert data_file.closed
+        return rows, csv_reader_rows(self.data_file_name, encoding)
+
+    @pytest.mark.parametrize('content', contents)
+    def test_rows_are_the_same_as_csv_reader(self, content):
+        rows, expected = self._rows(content)
+        assert rows == expected
+
+    @pytest.mark.parametrize('content', contents)
+    def test_rows_are_the_same_across_blocks(self, content):
+        for block_size in range(1, 12):
+            with mock.patch('csv2ved.mmap_reader.BLOCK_SIZE', block_size):
+                rows, expected = self._rows(content * 3)
+                assert rows == expected
+
+    def test_file_encoding_is_used(self):
+        rows, expected = self._rows('MEMBER_ID,name\n1,Zoë\n', encoding='latin-1')
+        assert rows == expected == [['MEMBER_ID', 'name'], ['1', 'Zoë']]
+
+    def test_regular_files_are_read_from_a_memory_map(self):
+        with open(self.data_file_name, 'w') as data_file:
+            data_file.write('MEMBER_ID,name\n1,John Smith\n')
+        with mock.patch('csv2ved.mmap_reader.csv_file_iterator', return_value=iter([])) as iterator, \
+                open(self.data_file_name) as data_file:
+            csv2jpl_converter.csv_file_iterator(data_file)
+        assert iterator.called
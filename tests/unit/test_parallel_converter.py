@@ -0,0 +1,144 @@
+import csv
+import io
+import os
+import random
+import tempfile
+import uuid
+from csv2ved import csv2jpl_converter
+from csv2ved import parallel_converter
+from csv2ved.conversion_options import ConversionOptions
+from unittest import mock
+
+
+class TestLineEndsInsideQuotes(object):
+
+    def test_unquoted_line_is_closed(self):
+        assert parallel_converter.line_ends_inside_quotes(b'12345,John,100\n') is False
+
+    def test_quoted_field_with_newline_is_open(self):
+        assert parallel_converter.line_ends_inside_quotes(b'12345,"John\n') is True
+
+    def test_open_record_is_closed_by_next_line(self):
+        assert parallel_converter.line_ends_inside_quotes(b'Smith",100\n', True) is False
+
+    def test_escaped_quotes_do_not_close_the_field(self):
+        assert parallel_converter.line_ends_inside_quotes(b'12345,"say ""hi"",\n') is True
+        assert parallel_converter.line_ends_inside_quotes(b'12345,"say ""hi""",100\n') is False
+
+    def test_quote_inside_unquoted_field_is_literal(self):
+        assert parallel_converter.line_ends_inside_quotes(b'12345,5" screen,100\n') is False
+
+    def test_carriage_return_ends_the_record(self):
+        assert parallel_converter.line_ends_inside_quotes(b'12345,John\r"Jane\n') is True
+        assert parallel_converter.line_ends_inside_quotes(b'12345,"John\r\n') is True
+
+    def test_runs_of_doubled_quotes_are_skipped(self):
+        assert parallel_converter.line_ends_inside_quotes(b'1,"' + b'""' * 1000 + b'\n') is True
+        assert parallel_converter.line_ends_inside_quotes(b'1,"' + b'""' * 1000 + b'",2\n') is False
+        assert parallel_converter.line_ends_inside_quotes(b'1,"",""\n') is False
+
+    def test_open_records_are_the_ones_the_csv_module_continues(self):
+        tokens = ['a', ',', '"', '""', ' ']
+        generator = random.Random(1)
+        for _ in range(2000):
+            line = ''.join(generator.choice(tokens) for _ in range(generator.randint(0, 12)))
+            # an open record takes the next line in, which has no quote to close it
+            records = list(csv.reader(io.StringIO(line + '\nx,y\n')))
+            assert parallel_converter.line_ends_inside_quotes(line.encode() + b'\n') is (len(records) == 1), line
+
+
+class TestFindRecordBoundaries(object):
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_file_path = os.path.join(self.tmp_dir, 'data.csv')
+
+    def teardown_method(self):
+        os.remove(self.data_file_path)
+        os.rmdir(self.tmp_dir)
+
+    def _write(self, content):
+        with open(self.data_file_path, 'wb') as data_file:
+            data_file.write(content)
+
+    def test_first_boundary_is_end_of_header(self):
+        self._write(b'MEMBER_ID,name\n1,John\n2,Jane\n')
+        assert parallel_converter.find_record_boundaries(self.data_file_path, 1) == [15, 29]
+
+    def test_boundaries_skip_quoted_newlines(self):
+        self._write(b'MEMBER_ID,name\n1,"John\nSmith"\n2,Jane\n')
+        assert parallel_converter.find_record_boundaries(self.data_file_path, 1) == [15, 30, 37]
+
+    def test_boundaries_are_at_least_chunk_size_apart(self):
+        self._write(b'MEMBER_ID,name\n' + b'1,John\n' * 100)
+        with mock.patch('csv2ved.parallel_converter.SCAN_BLOCK_SIZE', 10):
+            boundaries = parallel_converter.find_record_boundaries(self.data_file_path, 70)
+        assert boundaries[0] == 15
+        assert boundaries[-1] == 715
+        assert all(end - start >= 70 for start, end in zip(boundaries[:-2], boundaries[1:-1]))
+        assert all((boundary - 15) % 7 == 0 for boundary in boundaries)
+
+    def test_returns_none_for_carriage_return_line_endings(self):
+        self._write(b'MEMBER_ID,name\r1,John\r')
+        assert parallel_converter.find_record_boundaries(self.data_file_path) is None
+
+
+class TestConvertWithWorkers(object):
+    type_file_content = 'MEMBER_ID,name,balance\nstring,string,integer'
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_file_path = os.path.join(self.tmp_dir, 'data.csv')
+        lines = ['MEMBER_ID,name,balance']
+        for number in range(200):
+            if number % 7 == 0:
+                lines.append('{},"Smith,\nJohn",{}'.format(number, number))
+            elif number % 50 == 0:
+                lines.append('{},John,1oo'.format(number))
+            else:
+                lines.append('{},John,{}'.format(number, number))
+        with open(self.data_file_path, 'w') as data_file:
+            data_file.write('\n'.join(lines))
+
+    def teardown_method(self):
+        for name in os.listdir(self.tmp_dir):
+            os.remove(os.path.join(self.tmp_dir, name))
+        os.rmdir(self.tmp_dir)
+
+    def _convert(self, workers, max_number_of_errors=100, raw_json=False):
+        output_file_name = os.path.join(self.tmp_dir, 'data_{}.jpl'.format(workers))
+        with mock.patch('csv2ved.csv2jpl_converter.generate_output_file_name', return_value=output_file_name), \
+                mock.patch('os.remove'):
+            result = csv2jpl_converter.convert(open(self.data_file_path), io.StringIO(self.type_file_content),
+                                               self.company_id, max_number_of_errors,
+                                               ConversionOptions(workers=workers, raw_json=raw_json))
+        with open(output_file_name) as output_file:
+            return result[1:], output_file.read()
+
+    @mock.patch('csv2ved.parallel_converter.CHUNK_SIZE', 300)
+    def test_workers_produce_same_output_and_errors(self):
+        self.company_id = str(uuid.uuid4())
+        sequential = self._convert(1)
+        parallel = self._convert(2)
+        assert sequential == parallel
+        assert sequential[0][1] == [{52: '1oo is not a valid integer'}, {102: '1oo is not a valid integer'},
+                                    {152: '1oo is not a valid integer'}]
+
+    @mock.patch('csv2ved.parallel_converter.CHUNK_SIZE', 300)
+    def test_max_number_of_errors_applies_across_workers(self):
+        self.company_id = str(uuid.uuid4())
+        sequential = self._convert(1, 2)
+        parallel = self._convert(2, 2)
+        assert sequential[0] == parallel[0]
+        assert len(parallel[0][1]) == 2
+
+    @mock.patch('csv2ved.parallel_converter.CHUNK_SIZE', 300)
+    def test_workers_write_raw_json(self):
+        self.type_file_content = 'MEMBER_ID,name,balance\nstring,string,json'
+        self.company_id = str(uuid.uuid4())
+        assert self._convert(2, raw_json=True) == self._convert(1)
+
+    def test_can_split_rejects_in_memory_files(self):
+        data_file = io.StringIO('MEMBER_ID,name,balance\n12345,John,100')
+        data_file.name = ""
+        assert parallel_converter.can_split(data_file) is False
@@ -0,0 +1,117 @@
+import io
+import itertools
+import os
+import tempfile
+import uuid
+import pytest
+from csv2ved import batch_converter
+from csv2ved import csv2jpl_converter
+from csv2ved import pipeline
+from csv2ved.conversion_options import ConversionOptions
+
+
+class FailingFile(object):
+
+    def write(self, text):
+        raise OSError('No space left on device')
+
+
+class TestBlockReader(object):
+
+    def test_blocks_are_the_same_as_read_blocks(self):
+        lines = [['1'], [], ['2'], ['3'], [], [], ['4']]
+        reader = pipeline.BlockReader((line for line in lines), block_rows=3, current_line=1, queue_size=1)
+        assert list(reader) == list(batch_converter.read_blocks(iter(lines), 3, 1))
+        reader.close()
+
+    def test_read_errors_are_raised(self):
+        def lines():
+            yield ['1']
+            raise OSError('data.csv.gz is not a valid gzip file')
+
+        reader = pipeline.BlockReader(lines(), block_rows=1)
+        with pytest.raises(OSError, match='not a valid gzip file'):
+            list(reader)
+        reader.close()
+
+    def test_close_stops_reading_and_closes_the_lines(self):
+        def lines():
+            try:
+                for number in itertools.count():
+                    yield [str(number)]
+            finally:
+                closed.append(True)
+
+        closed = []
+        reader = pipeline.BlockReader(lines(), block_rows=10, queue_size=2)
+        assert next(iter(reader))[0] == list(range(1, 11))
+        reader.close()
+        assert closed == [True]
+
+
+class TestBlockWriter(object):
+
+    def test_texts_are_written_in_order_in_large_writes(self):
+        output_file = io.StringIO()
+        writes = []
+        output_file.write = writes.append
+        writer = pipeline.BlockWriter(output_file, write_size=10, queue_size=1)
+        for number in range(20):
+            writer.write('{}\n'.format(number))
+        writer.close()
+        assert ''.join(writes) == ''.join('{}\n'.format(number) for number in range(20))
+        assert len(writes) < 10
+
+    def test_write_errors_are_raised(self):
+        writer = pipeline.BlockWriter(FailingFile(), write_size=1)
+        writer.write('1\n')
+        with pytest.raises(OSError, match='No space left'):
+            for _ in range(100):
+                writer.write('2\n')
+            writer.close()
+
+
+class TestPipelinedConversion(object):
+    type_file_content = 'MEMBER_ID,name,balance\nstring,string,integer\n'
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_file_name = os.path.join(self.tmp_dir, 'data.csv')
+        self.type_file_name = os.path.join(self.tmp_dir, 'data.csvt')
+        self.company_id = str(uuid.uuid4())
+        with open(self.type_file_name, 'w') as type_file:
+            type_file.write(self.type_file_content)
+
+    def teardown_method(self):
+        for name in os.listdir(self.tmp_dir):
+            os.remove(os.path.join(self.tmp_dir, name))
+        os.rmdir(self.tmp_dir)
+
+    def _convert(self, content, **options):
+        with open(self.data_file_name, 'w') as data_file:
+            data_file.write(content)
+        jpl_file_name, lines, errors = csv2jpl_converter.convert(
+            open(self.data_file_name), open(self.type_file_name), self.company_id, max_number_of_errors=3,
+            options=ConversionOptions(**options))
+        output = None
+        if os.path.exists(jpl_file_name):
+            with open(jpl_file_name) as jpl_file:
+                output = jpl_file.read()
+            os.remove(jpl_file_name)
+        return output, lines, errors
+
+    @pytest.mark.parametrize('batch_size', [0, 7])
+    def test_output_is_the_same_as_without_pipeline(self, batch_size):
+        if batch_size:
+            pytest.importorskip('numpy')
+        content = 'MEMBER_ID,name,balance\n' + ''.join('{0},name {0},{0}\n\n'.format(number) for number in range(100))
+        assert self._convert(content, batch_size=batch_size, pipelined=True) == \
+            self._convert(content, batch_size=batch_size)
+
+    def test_errors_are_the_same_as_without_pipeline(self):
+        content = 'MEMBER_ID,name,balance\n' + ''.join('{0},name {0},{1}\n'.format(number, 'x' if number % 7 else 1)
+                                                       for number in range(100))
+        result = self._convert(content, pipelined=True)
+        assert result == self._convert(content)
+        assert result[2] == [{3: 'x is not a valid integer'}, {4: 'x is not a valid integer'},
+                             {5: 'x is not a valid integer'}]
@@ -0,0 +1,93 @@
+import json
+import pytest
+from collections import OrderedDict
+from csv2ved.record_encoder import IdOnlyEncoder, RecordEncoder, id_token
+from unittest import mock
+
+
+class TestRecordEncoder(object):
+    csv_types = OrderedDict([
+        ("MEMBER_ID", "string"),
+        ("balance", "integer"),
+        ("risk_factor", "float"),
+        ("opt_in", "boolean"),
+        ("dob", "date"),
+        ("userData", "json")
+    ])
+    values = ["12345", 100, 0.25, True, "1972-05-15", {"foo": ["bar", 1.5, None]}]
+
+    def _encoder(self, compact=False):
+        return RecordEncoder(list(self.csv_types.keys()), list(self.csv_types.values()), compact)
+
+    def _expected(self, values, **kwargs):
+        augmented_data = OrderedDict((name, value) for name, value in zip(self.csv_types, values) if value is not None)
+        return json.dumps({"_id": "company_12345", "augmentedData": augmented_data}, **kwargs)
+
+    def test_output_matches_json_dumps(self):
+        assert self._encoder().encode("company_12345", self.values) == self._expected(self.values)
+
+    def test_none_values_are_left_out(self):
+        values = ["12345", None, None, False, None, None]
+        assert self._encoder().encode("company_12345", values) == self._expected(values)
+
+    def test_special_characters_are_escaped(self):
+        values = ['a "quoted"\nname é中', 2 ** 70, 1e16, False, "1972-05-15", ["é"]]
+        assert self._encoder().encode("company_12345", values) == self._expected(values)
+
+    def test_non_finite_floats_match_json_dumps(self):
+        for value in [float('nan'), float('inf'), -float('inf')]:
+            values = ["nan and inf", 1, value, True, None, None]
+            assert self._encoder().encode("company_12345", values) == self._expected(values)
+
+    @mock.patch('csv2ved.record_encoder.orjson', None)
+    @pytest.mark.parametrize('compact', [False, True])
+    def test_fragments_encode_the_same_record(self, compact):
+        encoder = self._encoder(compact)
+        encoder.use_orjson = False
+        for values in [self.values, ["12345", None, float('nan'), True, None, None]]:
+            fragments = [encoder.fragment(index, value) for index, value in enumerate(values) if value is not None]
+            assert encoder.encode_fragments("company_12345", fragments) == encoder.encode("company_12345", values)
+
+    def test_fragments_of_a_column_match_its_fragment(self):
+        encoder = self._encoder()
+        for index, values in [(1, [100, -7]), (2, [0.25, 1e16, -0.0]), (3, [True, False])]:
+            assert encoder.fragments(index, values) == [encoder.fragment(index, value) for value in values]
+
+    def test_compact_output_matches_json_dumps(self):
+        assert self._encoder(compact=True).encode("company_12345", self.values) == \
+            self._expected(self.values, separators=(',', ':'))
+
+    @pytest.mark.parametrize('value', [0.25, 0.0, 1e-4, 9.99e-5, 1e16, 1e300, float('nan'), -float('inf')])
+    def test_compact_output_with_orjson_matches_json_dumps(self, value):
+        pytest.importorskip('orjson')
+        names = ["MEMBER_ID", "name", "balance", "rate"]
+        encoder = RecordEncoder(names, ["string", "string", "integer", "float"], compact=True)
+        assert encoder.use_orjson
+        for values in [["12345", "a\x7fé\n", 2 ** 70, value], ["12345", "name", 100, value]]:
+            expected = json.dumps({"_id": "company_12345", "augmentedData": dict(zip(names, values))},
+                                  separators=(',', ':'))
+            assert encoder.encode("company_12345", values) == expected
+
+    def test_orjson_is_not_used_for_json_columns(self):
+        assert not self._encoder(compact=True).use_orjson
+
+
+class TestIdOnlyEncoder(object):
+
+    def test_only_the_id_is_encoded(self):
+        encoder = IdOnlyEncoder(["MEMBER_ID", "balance"], ["string", "integer"])
+        line = encoder.encode("company_12345", ["12345", 100])
+        assert json.loads(line) == {"_id": "company_12345", "augmentedData": {}}
+        assert id_token(line) == '"company_12345"'
+
+
+class TestIdToken(object):
+
+    def test_returns_the_encoded_id(self):
+        data = {"_id": "company_1", "augmentedData": {"MEMBER_ID": "1"}}
+        assert id_token(json.dumps(data)) == '"company_1"'
+        assert id_token(json.dumps(data, separators=(',', ':'))) == '"company_1"'
+
+    def test_id_may_contain_the_data_key(self):
+        line = json.dumps({"_id": 'a, "augmentedData": b', "augmentedData": {}})
+        assert json.loads(id_token(line)) == 'a, "augmentedData": b'
@@ -0,0 +1,62 @@
+import csv
+import os
+import tempfile
+import uuid
+from csv2ved import csv2jpl_converter
+from csv2ved import rejects
+from unittest import mock
+
+
+class TestRejects(object):
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_file_name = os.path.join(self.tmp_dir, 'data.csv')
+        self.type_file_name = os.path.join(self.tmp_dir, 'data.csvt')
+        self.rejects_file_name = os.path.join(self.tmp_dir, 'data.rejects.csv')
+        self.company_id = str(uuid.uuid4())
+        with open(self.data_file_name, 'w') as data_file:
+            data_file.write('MEMBER_ID,name,balance\n1,John,ten\n2,Jane,2\n3,Jim\n,Joe,4\n5,Jack,1.5\n6,Jill,6\n')
+        with open(self.type_file_name, 'w') as type_file:
+            type_file.write('MEMBER_ID,name,balance\nstring,string,integer\n')
+
+    def teardown_method(self):
+        for name in os.listdir(self.tmp_dir):
+            os.remove(os.path.join(self.tmp_dir, name))
+        os.rmdir(self.tmp_dir)
+
+    def _convert(self, rejected_rows, **kwargs):
+        with mock.patch('csv2ved.csv2jpl_converter.generate_output_file_name',
+                        return_value=os.path.join(self.tmp_dir, 'data_1.jpl')):
+            return csv2jpl_converter.convert(open(self.data_file_name), open(self.type_file_name), self.company_id,
+                                             rejects=rejected_rows, **kwargs)
+
+    def test_valid_rows_are_converted_and_rejected_rows_written(self):
+        rejected_rows = rejects.Rejects(self.rejects_file_name)
+        jpl_file_name, lines, errors = self._convert(rejected_rows)
+        assert (lines, errors) == (2, [])
+        with open(self.rejects_file_name) as rejects_file:
+            assert list(csv.reader(rejects_file)) == [
+                ['line', 'error', 'MEMBER_ID', 'name', 'balance'],
+                ['2', 'ten is not a valid integer', '1', 'John', 'ten'],
+                ['4', 'Data length does not match headers', '3', 'Jim'],
+                ['5', 'MEMBER_ID cannot be empty', '', 'Joe', '4'],
+                ['6', '1.5 is not a valid integer', '5', 'Jack', '1.5']
+            ]
+
+    def test_rejected_rows_are_counted_by_column_and_error(self):
+        rejected_rows = rejects.Rejects()
+        with mock.patch('csv2ved.conversion_plan.ConversionPlan.error_message') as error_message:
+            self._convert(rejected_rows, max_number_of_errors=1)
+        assert not error_message.called
+        assert rejected_rows.total == 4
+        assert rejected_rows.summary() == [('balance', 'invalid integer', 2), ('(row)', 'wrong number of values', 1),
+                                           ('MEMBER_ID', 'empty', 1)]
+        assert rejected_rows.summary_lines()[0].split() == ['column', 'error', 'rows']
+        assert not os.path.exists(self.rejects_file_name)
+
+    def test_validate_collects_the_same_rejects(self):
+        rejected_rows = rejects.Rejects()
+        lines, errors = csv2jpl_converter.validate(open(self.data_file_name), open(self.type_file_name),
+                                                   self.company_id, rejects=rejected_rows)
+        assert (lines, errors, rejected_rows.total) == (2, [], 4)
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+import pytest
+from csv2ved import shards
+from csv2ved import vad2ved_converter
+from unittest import mock
+
+
+class MockEncryptFile(object):
+
+    def __init__(self, status):
+        self.status = status
+
+
+class MockGPG(object):
+    """Writes the plaintext as the 'encrypted' output"""
+
+    def encrypt_file(self, file, recipients, output, always_trust):
+        with open(output, 'wb') as output_file:
+            output_file.write(file.read())
+        return MockEncryptFile('encryption ok')
+
+
+def json_line(number, padding=0):
+    return '{{"_id": "company_{}", "augmentedData": {{"name": "{}"}}}}\n'.format(number, 'x' * padding)
+
+
+class TestSplitJpl(object):
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.jpl_file_name = os.path.join(self.tmp_dir, 'data_20180101000000.jpl')
+
+    def teardown_method(self):
+        for name in os.listdir(self.tmp_dir):
+            os.remove(os.path.join(self.tmp_dir, name))
+        os.rmdir(self.tmp_dir)
+
+    def _split(self, lines, **kwargs):
+        with open(self.jpl_file_name, 'w') as jpl_file:
+            jpl_file.write(''.join(lines))
+        jpl_shards = shards.split_jpl(self.jpl_file_name, **kwargs)
+        assert not os.path.exists(self.jpl_file_name)
+        contents = []
+        for shard in jpl_shards:
+            with open(shard.jpl_file, 'rb') as shard_file:
+                content = shard_file.read()
+            assert shard.rows == content.count(b'\n')
+            assert shard.jpl_bytes == len(content)
+            assert shard.jpl_sha256 == hashlib.sha256(content).hexdigest()
+            contents.append(content.decode())
+        assert ''.join(contents) == ''.join(lines)
+        return jpl_shards, contents
+
+    def test_shards_are_numbered_after_the_jpl_file(self):
+        jpl_shards, _ = self._split([json_line(number) for number in range(5)], shard_rows=2)
+        assert [os.path.basename(shard.jpl_file) for shard in jpl_shards] == \
+            ['data_20180101000000_0001.jpl', 'data_20180101000000_0002.jpl', 'data_20180101000000_0003.jpl']
+        assert [shard.rows for shard in jpl_shards] == [2, 2, 1]
+
+    @pytest.mark.parametrize('copy_size', [1, 7, 100, 16 * 1024 * 1024])
+    def test_rows_are_split_across_blocks(self, copy_size):
+        with mock.patch('csv2ved.shards.COPY_SIZE', copy_size):
+            jpl_shards, _ = self._split([json_line(number) for number in range(10)], shard_rows=3)
+        assert [shard.rows for shard in jpl_shards] == [3, 3, 3, 1]
+
+    @pytest.mark.parametrize('copy_size', [1, 50, 16 * 1024 * 1024])
+    def test_shards_have_whole_lines_up_to_shard_bytes(self, copy_size):
+        lines = [json_line(number, padding=number % 3) for number in range(20)]
+        with mock.patch('csv2ved.shards.COPY_SIZE', copy_size):
+            jpl_shards, contents = self._split(lines, shard_bytes=150)
+        assert all(len(content) <= 150 for content in contents)
+        assert all(len(content) + len(lines[0]) > 150 for content in contents[:-1])
+
+    def test_lines_longer_than_shard_bytes_get_a_shard_of_their_own(self):
+        lines = [json_line(0), json_line(1, padding=200), json_line(2)]
+        jpl_shards, contents = self._split(lines, shard_bytes=100)
+        assert contents == lines
+
+
+class TestConvertShards(object):
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.jpl_file_name = os.path.join(self.tmp_dir, 'data_20180101000000.jpl')
+        with open(self.jpl_file_name, 'w') as jpl_file:
+            jpl_file.write(''.join(json_line(number) for number in range(5)))
+
+    def teardown_method(self):
+        for name in os.listdir(self.tmp_dir):
+            os.remove(os.path.join(self.tmp_dir, name))
+        os.rmdir(self.tmp_dir)
+
+    @pytest.mark.parametrize('jobs', [1, 3])
+    def test_each_shard_is_encrypted_and_listed_in_the_manifest(self, jobs):
+        jpl_shards = shards.split_jpl(self.jpl_file_name, shard_rows=2)
+        results = shards.convert_shards(MockGPG(), jpl_shards, ['recipient'], jobs=jobs)
+        assert [result.error for result in results] == [None, None, None]
+        assert sorted(os.listdir(self.tmp_dir)) == \
+            ['data_20180101000000_0001.ved', 'data_20180101000000_0002.ved', 'data_20180101000000_0003.ved']
+
+        manifest_file_name = shards.write_manifest(shards.shard_manifest_file_for(self.jpl_file_name),
+                                                   '/partner/data.csv', results)
+        with open(manifest_file_name) as manifest_file:
+            manifest = json.load(manifest_file)
+        assert manifest['data_file'] == 'data.csv'
+        assert manifest['rows'] == 5
+        assert [(shard['file'], shard['rows']) for shard in manifest['shards']] == \
+            [('data_20180101000000_0001.ved', 2), ('data_20180101000000_0002.ved', 2),
+             ('data_20180101000000_0003.ved', 1)]
+        for shard in manifest['shards']:
+            ved_file_name = os.path.join(self.tmp_dir, shard['file'])
+            assert shard['sha256'] == shards.file_sha256(ved_file_name)
+            with zipfile.ZipFile(ved_file_name) as archive:
+                assert hashlib.sha256(archive.read('data.jpl')).hexdigest() == shard['jpl_sha256']
+
+    def test_failed_shards_have_an_error(self):
+        jpl_shards = shards.split_jpl(self.jpl_file_name, shard_rows=3)
+        with mock.patch('csv2ved.vad2ved_converter.encrypt', return_value=(None, 'Error encrypting')):
+            results = shards.convert_shards(MockGPG(), jpl_shards, ['recipient'])
+        assert [(result.ved_file, result.error) for result in results] == [(None, 'Error encrypting')] * 2
+
+    def test_outputs_of_all_shards_are_removed_when_one_fails(self):
+        jpl_shards = shards.split_jpl(self.jpl_file_name, shard_rows=2)
+        encrypt = vad2ved_converter.encrypt
+
+        def fail_second_shard(gpg, vad_file_name, recipients):
+            if vad_file_name.endswith('_0002.vad'):
+                return None, 'Error encrypting'
+            return encrypt(gpg, vad_file_name, recipients)
+
+        with mock.patch('csv2ved.vad2ved_converter.encrypt', side_effect=fail_second_shard):
+            results = shards.convert_shards(MockGPG(), jpl_shards, ['recipient'], jobs=1)
+        assert [result.error for result in results] == [None, 'Error encrypting', None]
+        assert sorted(os.listdir(self.tmp_dir)) == \
+            ['data_20180101000000_0001.ved', 'data_20180101000000_0002.vad', 'data_20180101000000_0003.ved']
+
+        removed = shards.remove_shard_outputs(results)
+        assert sorted(os.path.basename(file_name) for file_name in removed) == \
+            ['data_20180101000000_0001.ved', 'data_20180101000000_0002.vad', 'data_20180101000000_0003.ved']
+        assert os.listdir(self.tmp_dir) == []
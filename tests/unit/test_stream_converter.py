@@ -0,0 +1,92 @@
+import io
+import json
+import os
+import pytest
+import tempfile
+import uuid
+import zipfile
+from csv2ved import jpl2vad_converter
+from csv2ved import stream_converter
+from unittest import mock
+
+
+class MockEncryptFile(object):
+
+    def __init__(self, status):
+        self.status = status
+
+
+class MockGPG(object):
+    """Writes the plaintext as the 'encrypted' output so the archive can be checked"""
+
+    def __init__(self, status='encryption ok'):
+        self.status = status
+
+    def encrypt_file(self, file, recipients, output, always_trust):
+        with open(output, 'wb') as output_file:
+            output_file.write(file.read())
+        return MockEncryptFile(self.status)
+
+
+class TestStreamConvert(object):
+    type_file_content = 'MEMBER_ID,name,balance\nstring,string,integer'
+    recipients = ['rroy@tucowsinc.com']
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_file_path = os.path.join(self.tmp_dir, 'data.csv')
+        self.jpl_file_name = os.path.join(self.tmp_dir, 'data_XYZ.jpl')
+        self.ved_file_name = os.path.join(self.tmp_dir, 'data_XYZ.ved')
+        self.company_id = str(uuid.uuid4())
+
+    def teardown_method(self):
+        for name in os.listdir(self.tmp_dir):
+            os.remove(os.path.join(self.tmp_dir, name))
+        os.rmdir(self.tmp_dir)
+
+    def _convert(self, content, gpg=None):
+        with open(self.data_file_path, 'w') as data_file:
+            data_file.write(content)
+        with mock.patch('csv2ved.csv2jpl_converter.generate_output_file_name', return_value=self.jpl_file_name):
+            return stream_converter.convert(gpg or MockGPG(), open(self.data_file_path),
+                                            io.StringIO(self.type_file_content), self.company_id, self.recipients)
+
+    def test_stream_writes_archived_jpl_without_intermediate_files(self):
+        ved_file_name, lines, errors, status = self._convert('MEMBER_ID,name,balance\n12345,John,100\n')
+        assert (ved_file_name, lines, errors, status.status) == (self.ved_file_name, 1, [], 'encryption ok')
+        assert sorted(os.listdir(self.tmp_dir)) == ['data.csv', 'data_XYZ.ved']
+
+        archive = zipfile.ZipFile(self.ved_file_name)
+        jpl_lines = archive.read(jpl2vad_converter.JPL_FILENAME_IN_ARCHIVE).decode().splitlines()
+        assert [json.loads(line) for line in jpl_lines] == [{
+            "_id": "{}_12345".format(self.company_id),
+            "augmentedData": {"MEMBER_ID": "12345", "name": "John", "balance": 100}
+        }]
+
+    def test_stream_removes_output_on_conversion_errors(self):
+        result = self._convert('MEMBER_ID,name,balance\n12345,John\n')
+        assert result == (None, 0, [{2: 'Data length does not match headers'}], None)
+        assert os.listdir(self.tmp_dir) == ['data.csv']
+
+    def test_stream_returns_header_errors(self):
+        result = self._convert('memberId,name,balance\n12345,John,100\n')
+        assert result == (None, 0, [{1: 'Missing required column MEMBER_ID'}], None)
+        assert os.listdir(self.tmp_dir) == ['data.csv']
+
+    def test_stream_returns_error_for_empty_data_file(self):
+        result = self._convert('')
+        assert result == (None, 0, [{0: '{} is empty'.format(self.data_file_path)}], None)
+
+    def test_stream_removes_output_if_encryption_fails(self):
+        ved_file_name, lines, errors, status = self._convert('MEMBER_ID,name,balance\n12345,John,100\n',
+                                                             MockGPG('key expired'))
+        assert ved_file_name is None
+        assert status == 'Error encrypting {}\nkey expired'.format(self.data_file_path)
+        assert os.listdir(self.tmp_dir) == ['data.csv']
+
+    def test_stream_removes_output_on_other_exceptions(self):
+        for error in [ValueError('worker failed'), KeyboardInterrupt()]:
+            with mock.patch('csv2ved.csv2jpl_converter.write_json_lines', side_effect=error):
+                with pytest.raises(type(error)):
+                    self._convert('MEMBER_ID,name,balance\n12345,John,100\n')
+            assert os.listdir(self.tmp_dir) == ['data.csv']
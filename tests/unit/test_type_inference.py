@@ -0,0 +1,109 @@
+import gzip
+import os
+import tempfile
+import pytest
+from csv2ved import csv2jpl_converter
+from csv2ved import type_inference
+from unittest import mock
+
+HEADER = 'MEMBER_ID,balance,city,joined,last_seen,active,flag,rating,friends\n'
+ROW = '{0},{0}00,City {1},2013-01-{2:02d},2018-09-04T12:13:{2:02d},{3},{4},0.{0},"{{""id"": {0}}}"\n'
+
+
+def data_content(rows=200):
+    return HEADER + ''.join(ROW.format(number, number % 5, number % 28 + 1, 'True' if number % 2 else 'false',
+                                       number % 2) for number in range(rows))
+
+
+EXPECTED_TYPES = ['string', 'integer', 'string', 'date', 'datetime', 'boolean', 'integer', 'float', 'json']
+
+
+class TestInferColumn(object):
+
+    def test_narrowest_type_that_accepts_every_value_is_proposed(self):
+        column = type_inference.infer_column('balance', ['1', '', '20', '-3'])
+        assert column.type == 'integer'
+        assert (column.values, column.empty) == (3, 1)
+        assert column.max_invalid_share == 1.0
+        assert column.ruled_out == [('boolean', '20')]
+
+    def test_one_value_rules_out_a_type(self):
+        column = type_inference.infer_column('rating', ['1', '2', '2.5'] + ['3'] * 300)
+        assert column.type == 'float'
+        assert column.ruled_out == [('boolean', '2'), ('integer', '2.5')]
+        assert column.max_invalid_share == pytest.approx(3.0 / 303)
+
+    def test_dates_with_a_time_are_datetimes(self):
+        assert type_inference.infer_column('day', ['2013-01-01', '2013-01-02 00:00']).type == 'date'
+        assert type_inference.infer_column('day', ['2013-01-01', '2013-01-02 10:00']).type == 'datetime'
+
+    def test_zeros_and_ones_are_integers(self):
+        assert type_inference.infer_column('flag', ['0', '1']).type == 'integer'
+        assert type_inference.infer_column('flag', ['0', 'True']).type == 'boolean'
+
+    def test_member_id_is_a_string(self):
+        column = type_inference.infer_column('MEMBER_ID', ['1', '2'], 'MEMBER_ID')
+        assert column.type == 'string'
+        assert column.max_invalid_share is None
+
+    def test_empty_column_is_a_string(self):
+        column = type_inference.infer_column('notes', ['', ''])
+        assert (column.type, column.values, column.empty) == ('string', 0, 2)
+
+
+class TestInferTypes(object):
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_file_name = os.path.join(self.tmp_dir, 'data.csv')
+        self.type_file_name = os.path.join(self.tmp_dir, 'data.csvt')
+
+    def teardown_method(self):
+        for name in os.listdir(self.tmp_dir):
+            os.remove(os.path.join(self.tmp_dir, name))
+        os.rmdir(self.tmp_dir)
+
+    def _write(self, content):
+        with open(self.data_file_name, 'w') as data_file:
+            data_file.write(content)
+
+    def test_small_files_are_sampled_whole(self):
+        self._write(data_content())
+        inference, error = type_inference.infer_types(self.data_file_name, sample_rows=50, seed=1)
+        assert error == ""
+        assert (inference.rows, inference.method) == (50, type_inference.SCAN_METHOD)
+        assert [column.type for column in inference.columns] == EXPECTED_TYPES
+
+    @mock.patch('csv2ved.type_inference.SCAN_SIZE', 0)
+    @mock.patch('csv2ved.type_inference.SEEK_BLOCK_SIZE', 512)
+    def test_large_files_are_sampled_at_random_offsets(self):
+        self._write(data_content(2000))
+        inference, error = type_inference.infer_types(self.data_file_name, sample_rows=100, seed=1)
+        assert error == ""
+        assert inference.method == type_inference.SEEK_METHOD
+        assert 0 < inference.rows <= 100
+        assert [column.type for column in inference.columns] == EXPECTED_TYPES
+
+    @mock.patch('csv2ved.type_inference.SCAN_SIZE', 0)
+    def test_compressed_files_are_sampled_whole(self):
+        with gzip.open(self.data_file_name + '.gz', 'wt') as data_file:
+            data_file.write(data_content())
+        inference, error = type_inference.infer_types(self.data_file_name + '.gz', seed=1)
+        assert (inference.rows, inference.method) == (200, type_inference.SCAN_METHOD)
+
+    def test_empty_file_is_an_error(self):
+        self._write('')
+        assert type_inference.infer_types(self.data_file_name) == (None, '{} is empty'.format(self.data_file_name))
+
+    def test_written_type_file_converts_the_data_file(self):
+        self._write(data_content())
+        inference, _ = type_inference.infer_types(self.data_file_name)
+        type_inference.write_type_file(self.type_file_name, inference.columns)
+        jpl_file_name, lines, errors = csv2jpl_converter.convert(open(self.data_file_name), open(self.type_file_name),
+                                                                 'company')
+        os.remove(jpl_file_name)
+        assert (lines, errors) == (200, [])
+
+    def test_summary_lists_types_ruled_out_by_the_same_value_together(self):
+        columns = [type_inference.infer_column('city', ['Paris'])]
+        assert type_inference.summary_lines(columns)[1].endswith("  boolean/integer/float/date/datetime/json ('Paris')")
@@ -1,5 +1,7 @@
 import copy
 import io
+import os
+import tempfile
 from tests import GPG_TEST_HOME_DIRECTORY, REQUIRED_TEST_RECIPIENTS, TEST_GPG_KEYS
 from csv2ved import vad2ved_converter
 from unittest import mock
@@ -131,3 +133,111 @@ class TestEncrypt(object):
         mock_gnupg.encrypt_file.return_value = MockEncryptFile('key expired')
         result = vad2ved_converter.encrypt(mock_gnupg, self.filename, REQUIRED_TEST_RECIPIENTS)
         assert (None, 'Error encrypting myfile.vad\nexception message') == result
+
+
+class MockStreamGPG(object):
+
+    def __init__(self, status='encryption ok'):
+        self.status = status
+
+    def encrypt_file(self, file, recipients, output, always_trust):
+        with open(output, 'wb') as output_file:
+            output_file.write(file.read())
+        return MockEncryptFile(self.status)
+
+
+class TestEncryptStream(object):
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.ved_filename = os.path.join(self.tmp_dir, 'myfile.ved')
+
+    def teardown_method(self):
+        os.remove(self.ved_filename)
+        os.rmdir(self.tmp_dir)
+
+    def test_data_written_to_stream_is_encrypted_into_output_file(self):
+        with vad2ved_converter.encrypt_stream(MockStreamGPG(), REQUIRED_TEST_RECIPIENTS,
+                                              self.ved_filename) as (encrypt_input, result):
+            encrypt_input.write(b'some data')
+        assert result['status'].status == 'encryption ok'
+        with open(self.ved_filename, 'rb') as ved_file:
+            assert ved_file.read() == b'some data'
+
+
+class CountingMockGPG(MockGPG):
+    def __init__(self):
+        self.list_keys_calls = 0
+
+    def list_keys(self, **kwargs):
+        self.list_keys_calls += 1
+        return TEST_GPG_KEYS
+
+
+class TestKeyringCache(object):
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.key_file = os.path.join(self.tmp_dir, 'key.asc')
+        with open(self.key_file, 'w') as key_file:
+            key_file.write('key data')
+        with open(os.path.join(self.tmp_dir, 'pubring.kbx'), 'w') as keyring_file:
+            keyring_file.write('keyring')
+
+    def teardown_method(self):
+        for name in os.listdir(self.tmp_dir):
+            os.remove(os.path.join(self.tmp_dir, name))
+        os.rmdir(self.tmp_dir)
+
+    def _init_gpg(self, gpg):
+        with mock.patch('gnupg.GPG', return_value=gpg), \
+                mock.patch('csv2ved.vad2ved_converter.get_gpg_binary', return_value='gpg') as mock_get_gpg_binary, \
+                mock.patch('csv2ved.vad2ved_converter.import_keys', return_value=(True, "")) as mock_import_keys:
+            result = vad2ved_converter.init_gpg(self.tmp_dir, REQUIRED_TEST_RECIPIENTS, [self.key_file])
+        return result, mock_get_gpg_binary.call_count, mock_import_keys.call_count
+
+    def test_second_init_uses_cached_binary_and_key_index(self):
+        gpg = CountingMockGPG()
+        assert self._init_gpg(gpg) == ((gpg, ""), 1, 1)
+        assert self._init_gpg(gpg) == ((gpg, ""), 0, 0)
+        assert gpg.list_keys_calls == 1
+
+    def test_changed_key_file_is_imported_again(self):
+        gpg = CountingMockGPG()
+        self._init_gpg(gpg)
+        with open(self.key_file, 'w') as key_file:
+            key_file.write('new key data')
+        assert self._init_gpg(gpg)[2] == 1
+        assert gpg.list_keys_calls == 2
+
+    def test_changed_keyring_is_listed_again(self):
+        gpg = CountingMockGPG()
+        self._init_gpg(gpg)
+        with open(os.path.join(self.tmp_dir, 'pubring.kbx'), 'a') as keyring_file:
+            keyring_file.write('more keys')
+        assert self._init_gpg(gpg)[2] == 1
+
+    def test_failed_init_is_not_cached(self):
+        with mock.patch('csv2ved.vad2ved_converter.public_keys_exist', return_value=(False, "error")):
+            assert self._init_gpg(CountingMockGPG())[0] == (False, "error")
+        assert not os.path.exists(os.path.join(self.tmp_dir, vad2ved_converter.KEYRING_CACHE_FILE_NAME))
+
+    def test_corrupted_cache_is_ignored(self):
+        with open(os.path.join(self.tmp_dir, vad2ved_converter.KEYRING_CACHE_FILE_NAME), 'w') as cache_file:
+            cache_file.write('{not json')
+        gpg = CountingMockGPG()
+        assert self._init_gpg(gpg) == ((gpg, ""), 1, 1)
+
+
+class TestBuildKeyIndex(object):
+
+    def test_index_maps_uid_addresses_to_fingerprints(self):
+        assert vad2ved_converter.build_key_index(TEST_GPG_KEYS) == {
+            'rroy@tucowsinc.com': TEST_GPG_KEYS[0]['fingerprint']
+        }
+
+    def test_public_keys_exist_checks_the_index(self):
+        key_index = {'rroy@tucowsinc.com': 'A672'}
+        assert vad2ved_converter.public_keys_exist(None, ['rroy@tucowsinc.com'], key_index) == (True, "")
+        assert vad2ved_converter.public_keys_exist(None, ['foo@tucowsinc.com'], key_index) == \
+            (False, "missing required public key ['foo@tucowsinc.com']")
@@ -0,0 +1,177 @@
+import hashlib
+import io
+import json
+import os
+import tempfile
+import pytest
+from csv2ved import csv2jpl_converter
+from csv2ved import jpl2vad_converter
+from csv2ved import shards
+from csv2ved import verifier
+from unittest import mock
+
+COMPANY_ID = '7a6c6c63-5a0e-4a3b-9d2b-0f1c1a2b3c4d'
+
+
+class PipeStream(object):
+    """A binary stream that can't seek and returns short reads, like the output of gpg"""
+
+    def __init__(self, data, read_size=7):
+        self.data = io.BytesIO(data)
+        self.read_size = read_size
+
+    def read(self, size=-1):
+        return self.data.read(min(size, self.read_size) if size > 0 else self.read_size)
+
+
+def jpl_content(rows=100):
+    return ''.join('{{"_id": "{}_{}", "augmentedData": {{"name": "name {}"}}}}\n'.format(COMPANY_ID, number, number)
+                   for number in range(rows)).encode()
+
+
+class TestJplChunks(object):
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.jpl_file_name = os.path.join(self.tmp_dir, 'data.jpl')
+        self.vad_file_name = os.path.join(self.tmp_dir, 'data.vad')
+        with open(self.jpl_file_name, 'wb') as jpl_file:
+            jpl_file.write(jpl_content())
+
+    def teardown_method(self):
+        for name in os.listdir(self.tmp_dir):
+            os.remove(os.path.join(self.tmp_dir, name))
+        os.rmdir(self.tmp_dir)
+
+    def _archive(self, codec):
+        jpl2vad_converter.archive_jpl_data(self.vad_file_name, self.jpl_file_name, codec)
+        with open(self.vad_file_name, 'rb') as vad_file:
+            return vad_file.read()
+
+    @pytest.mark.parametrize('codec', ['deflate', 'bzip2', 'lzma'])
+    def test_archives_are_read_as_a_stream(self, codec):
+        assert b''.join(verifier.jpl_chunks(PipeStream(self._archive(codec)))) == jpl_content()
+
+    @pytest.mark.parametrize('codec', ['deflate', 'lzma'])
+    def test_streamed_archives_are_checked_against_their_data_descriptor(self, codec):
+        vad_stream = io.BytesIO()
+        with jpl2vad_converter.archive_stream(vad_stream, codec) as jpl_stream:
+            jpl_stream.write(jpl_content())
+        assert b''.join(verifier.jpl_chunks(PipeStream(vad_stream.getvalue()))) == jpl_content()
+
+    def test_zstd_frames_are_read_as_a_stream(self):
+        pytest.importorskip('zstandard')
+        assert b''.join(verifier.jpl_chunks(PipeStream(self._archive('zstd'), 1000))) == jpl_content()
+
+    def test_corrupt_archive_is_an_error(self):
+        archive = bytearray(self._archive('deflate'))
+        # the CRC of the local file header
+        archive[14] ^= 0xff
+        with pytest.raises(OSError, match='CRC or size does not match'):
+            b''.join(verifier.jpl_chunks(PipeStream(bytes(archive))))
+
+    def test_truncated_archive_is_an_error(self):
+        with pytest.raises(OSError, match='ends unexpectedly'):
+            b''.join(verifier.jpl_chunks(PipeStream(self._archive('deflate')[:60])))
+
+    def test_other_data_is_an_error(self):
+        with pytest.raises(OSError, match='not a .vad archive'):
+            b''.join(verifier.jpl_chunks(PipeStream(jpl_content())))
+
+
+class TestLineSummary(object):
+
+    @pytest.mark.parametrize('chunk_size', [1, 10, 100000])
+    def test_lines_are_counted_and_checksummed_across_chunks(self, chunk_size):
+        content = jpl_content() + b'{"_id": "company_1", "deleted": true}\n'
+        summary = verifier.LineSummary()
+        for start in range(0, len(content), chunk_size):
+            summary.update(content[start:start + chunk_size])
+        summary.close()
+        assert (summary.rows, summary.deleted, summary.jpl_bytes) == (100, 1, len(content))
+        assert summary.jpl_sha256() == hashlib.sha256(content).hexdigest()
+
+    def test_id_digest_does_not_depend_on_the_order_of_the_lines(self):
+        lines = jpl_content().splitlines(True)
+        digests = []
+        for content in [b''.join(lines), b''.join(reversed(lines))]:
+            summary = verifier.LineSummary()
+            summary.update(content)
+            digests.append(summary.id_digest)
+        assert digests[0] == digests[1]
+
+    def test_other_lines_are_an_error(self):
+        with pytest.raises(ValueError, match='not a JSON line of a record'):
+            verifier.LineSummary().update(b'MEMBER_ID,name\n')
+
+
+class TestDataFileIds(object):
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_file_name = os.path.join(self.tmp_dir, 'data.csv')
+        self.type_file_name = os.path.join(self.tmp_dir, 'data.csvt')
+        with open(self.data_file_name, 'w') as data_file:
+            data_file.write('name,MEMBER_ID\n')
+            data_file.write(''.join('"name, {0}",{0}é\n\n'.format(number) for number in range(50)))
+        with open(self.type_file_name, 'w') as type_file:
+            type_file.write('name,MEMBER_ID\nstring,string\n')
+
+    def teardown_method(self):
+        for name in os.listdir(self.tmp_dir):
+            os.remove(os.path.join(self.tmp_dir, name))
+        os.rmdir(self.tmp_dir)
+
+    def test_ids_match_the_converted_records(self):
+        jpl_file_name, _, _ = csv2jpl_converter.convert(open(self.data_file_name), open(self.type_file_name),
+                                                        COMPANY_ID)
+        summary = verifier.LineSummary()
+        with open(jpl_file_name, 'rb') as jpl_file:
+            summary.update(jpl_file.read())
+        assert verifier.data_file_ids(self.data_file_name, COMPANY_ID) == \
+            (verifier.DataFileIds(50, summary.id_digest), "")
+        assert verifier.data_file_ids(self.data_file_name, 'other')[0].id_digest != summary.id_digest
+
+    def test_data_file_without_member_id_is_an_error(self):
+        with open(self.data_file_name, 'w') as data_file:
+            data_file.write('name\nJohn\n')
+        assert verifier.data_file_ids(self.data_file_name, COMPANY_ID) == (None, 'Missing required column MEMBER_ID')
+
+
+class TestVerifyShards(object):
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.manifest_file_name = os.path.join(self.tmp_dir, 'data.shards.json')
+        self.ved_file_names = [os.path.join(self.tmp_dir, 'data_0001.ved'), os.path.join(self.tmp_dir, 'data_0002.ved')]
+        manifest_shards = []
+        for number, ved_file_name in enumerate(self.ved_file_names):
+            with open(ved_file_name, 'wb') as ved_file:
+                ved_file.write(str(number).encode())
+            manifest_shards.append({'file': os.path.basename(ved_file_name), 'rows': 10,
+                                    'sha256': shards.file_sha256(ved_file_name), 'jpl_sha256': 'jpl sha256'})
+        with open(self.manifest_file_name, 'w') as manifest_file:
+            json.dump({'shards': manifest_shards}, manifest_file)
+
+    def teardown_method(self):
+        for name in os.listdir(self.tmp_dir):
+            os.remove(os.path.join(self.tmp_dir, name))
+        os.rmdir(self.tmp_dir)
+
+    def _verify_ved(self, gpg_binary, gnupg_home_dir, ved_file_name):
+        rows = 10 if ved_file_name == self.ved_file_names[0] else 9
+        return verifier.Verification(ved_file_name, rows, 0, 100, 'jpl sha256', 1, "")
+
+    def test_shards_are_checked_against_the_manifest(self):
+        with mock.patch('csv2ved.verifier.verify_ved', side_effect=self._verify_ved):
+            first, second = verifier.verify_shards('gpg', self.tmp_dir, self.manifest_file_name)
+        assert first.error == ""
+        assert second.error == '9 rows and sha256 jpl sha256 of the JSON lines do not match the manifest'
+
+    def test_changed_shard_file_is_an_error(self):
+        with open(self.ved_file_names[1], 'ab') as ved_file:
+            ved_file.write(b'x')
+        with mock.patch('csv2ved.verifier.verify_ved', side_effect=self._verify_ved) as verify_ved:
+            _, second = verifier.verify_shards('gpg', self.tmp_dir, self.manifest_file_name)
+        assert second.error == 'sha256 of the .ved file does not match the manifest'
+        assert verify_ved.call_count == 1
@@ -0,0 +1,320 @@
+"""
+Benchmarks every stage of the csv to ved pipeline on generated data files.
+
+Each stage runs in a fresh process so its peak RSS is measured on its own. Encryption uses a throwaway
+keyring with a generated key, the production keys are never touched.
+
+"""
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import tempfile
+import time
+import uuid
+
+import click
+import gnupg
+
+from csv2ved import csv2jpl_converter
+from csv2ved import jpl2vad_converter
+from csv2ved import metrics as stage_metrics
+from csv2ved import vad2ved_converter
+from csv2ved.conversion_options import ConversionOptions
+
+USAGE = """
+Usage:   python -m tests.utils.benchmark [--rows N ...] [--dataset NAME ...] [--output FILE] [--baseline FILE]
+Example: python -m tests.utils.benchmark --rows 10000 --rows 100000 --output bench.json --baseline baseline.json
+
+"""
+
+BENCHMARK_RECIPIENT = 'benchmark@example.com'
+STAGES = ['csv2jpl', 'jpl2vad', 'vad2ved']
+
+# a rows/s ratio against the baseline below this is reported as a regression
+REGRESSION_RATIO = 0.9
+
+CITIES = ['Atlantic City', 'Toronto', 'San Francisco', 'Berlin', 'Tokyo', 'Sao Paulo']
+TIERS = ['GOLD', 'SILVER', 'BRONZE']
+DATE_LAYOUTS = ['%Y-%m-%d', '%Y-%m-%dT%H:%M:%S', '%m/%d/%Y', '%b %d, %Y', '%Y-%m-%d %H:%M:%S']
+
+
+def _member_id(rng):
+    return '{:013x}'.format(rng.getrandbits(52))
+
+
+def _date(rng, layout='%Y-%m-%d'):
+    return time.strftime(layout, time.gmtime(rng.randint(0, 1500000000)))
+
+
+def _narrow(rng, number):
+    headers = ['member_id', 'name', 'balance', 'active']
+    types = ['string', 'string', 'integer', 'boolean']
+    rows = ([_member_id(rng), rng.choice(CITIES), str(rng.randint(0, 10 ** 6)), rng.choice(['True', 'False'])]
+            for _ in range(number))
+    return headers, types, rows
+
+
+def _wide(rng, number):
+    types = ['string'] + ['string', 'integer', 'float', 'boolean'] * 15
+    headers = ['member_id'] + ['column_{}'.format(index) for index in range(1, len(types))]
+    values = {
+        'string': lambda: rng.choice(TIERS),
+        'integer': lambda: str(rng.randint(-10 ** 6, 10 ** 6)),
+        'float': lambda: str(round(rng.random() * 1000, 4)),
+        'boolean': lambda: rng.choice(['0', '1', 'true', 'false'])
+    }
+    rows = ([_member_id(rng)] + [values[csv_type]() for csv_type in types[1:]] for _ in range(number))
+    return headers, types, rows
+
+
+def _dates(rng, number):
+    headers = ['member_id', 'membership_date', 'birth_date', 'last_activity', 'last_login', 'renewal', 'first_order']
+    types = ['string', 'date', 'date', 'datetime', 'datetime', 'date', 'datetime']
+    rows = ([_member_id(rng), _date(rng), _date(rng, rng.choice(DATE_LAYOUTS)), _date(rng, '%Y-%m-%dT%H:%M:%S'),
+             _date(rng, rng.choice(DATE_LAYOUTS)), _date(rng, '%Y-%m-01'), _date(rng, '%Y-%m-%d %H:%M:%S')]
+            for _ in range(number))
+    return headers, types, rows
+
+
+def _json(rng, number):
+    headers = ['member_id', 'tier', 'friends', 'preferences', 'history']
+    types = ['string', 'string', 'json', 'json', 'json']
+
+    def _row():
+        friends = [_member_id(rng) for _ in range(rng.randint(0, 5))]
+        preferences = {'newsletter': rng.random() > 0.5, 'language': rng.choice(['en', 'fr', 'de']),
+                       'categories': rng.sample(TIERS, 2)}
+        history = [{'date': _date(rng), 'amount': rng.randint(1, 500), 'city': rng.choice(CITIES)}
+                   for _ in range(rng.randint(1, 4))]
+        return [_member_id(rng), rng.choice(TIERS), json.dumps(friends), json.dumps(preferences), json.dumps(history)]
+
+    return headers, types, (_row() for _ in range(number))
+
+
+def _errors(rng, number):
+    headers, types, rows = _narrow(rng, number)
+
+    def _with_errors(row):
+        # one row in five has an invalid balance
+        if rng.random() < 0.2:
+            row[2] = rng.choice(['1oo', '12.5', 'n/a'])
+        return row
+
+    return headers, types, (_with_errors(row) for row in rows)
+
+
+DATASETS = {
+    'narrow': _narrow,
+    'wide': _wide,
+    'dates': _dates,
+    'json': _json,
+    'errors': _errors
+}
+
+
+def _csv_value(value):
+    if any(character in value for character in ',"\n'):
+        return '"{}"'.format(value.replace('"', '""'))
+    return value
+
+
+def generate_dataset(directory, dataset, number_of_rows, seed=0):
+    """Writes the data and type files of a dataset, returns their paths"""
+    headers, types, rows = DATASETS[dataset](random.Random(seed), number_of_rows)
+    data_file_name = os.path.join(directory, '{}_{}.csv'.format(dataset, number_of_rows))
+    type_file_name = os.path.join(directory, '{}_{}.csvt'.format(dataset, number_of_rows))
+    with open(type_file_name, 'w') as type_file:
+        type_file.write('{}\n{}\n'.format(','.join(headers), ','.join(types)))
+    with open(data_file_name, 'w') as data_file:
+        data_file.write('{}\n'.format(','.join(headers)))
+        for row in rows:
+            data_file.write('{}\n'.format(','.join(_csv_value(value) for value in row)))
+    return data_file_name, type_file_name
+
+
+def create_keyring(gnupg_home_dir):
+    """Creates a throwaway keyring holding a key for BENCHMARK_RECIPIENT"""
+    gpg = gnupg.GPG(gpgbinary=vad2ved_converter.get_gpg_binary(), gnupghome=gnupg_home_dir)
+    key_input = gpg.gen_key_input(key_type='RSA', key_length=1024, name_email=BENCHMARK_RECIPIENT,
+                                  no_protection=True)
+    key = gpg.gen_key(key_input)
+    if not key.fingerprint:
+        raise RuntimeError('Could not generate the benchmark key: {}'.format(key.stderr))
+
+
+def _run_csv2jpl(data_file_name, type_file_name, number_of_rows, workers, batch_size):
+    with open(data_file_name) as data_file, open(type_file_name) as type_file:
+        jpl_file_name, written, errors = csv2jpl_converter.convert(
+            data_file, type_file, str(uuid.uuid4()), number_of_rows + 1,
+            ConversionOptions(workers=workers, batch_size=batch_size))
+    return jpl_file_name if written and not errors else None, {'written_lines': written, 'errors': len(errors)}
+
+
+def _run_jpl2vad(jpl_file_name, compression):
+    vad_file_name, error, compression_info = jpl2vad_converter.convert_with_compression_info(jpl_file_name,
+                                                                                             compression)
+    if error:
+        raise RuntimeError(error)
+    return vad_file_name, {'compressed_bytes': compression_info.compress_size, 'codec': compression_info.codec}
+
+
+def _run_vad2ved(vad_file_name, gnupg_home_dir):
+    gpg, error = vad2ved_converter.init_gpg(gnupg_home_dir, [BENCHMARK_RECIPIENT])
+    if error:
+        raise RuntimeError(error)
+    ved_file_name, status = vad2ved_converter.encrypt(gpg, vad_file_name, [BENCHMARK_RECIPIENT])
+    if ved_file_name is None:
+        raise RuntimeError(status)
+    return ved_file_name, {'encrypted_bytes': os.path.getsize(ved_file_name)}
+
+
+STAGE_RUNNERS = {
+    'csv2jpl': _run_csv2jpl,
+    'jpl2vad': _run_jpl2vad,
+    'vad2ved': _run_vad2ved
+}
+
+
+def _stage_process(connection, stage, args):
+    try:
+        start = time.perf_counter()
+        output_file_name, details = STAGE_RUNNERS[stage](*args)
+        elapsed = time.perf_counter() - start
+        connection.send((output_file_name, elapsed, stage_metrics.peak_rss()['self'], details, None))
+    except Exception as err:
+        connection.send((None, 0, stage_metrics.peak_rss()['self'], {}, str(err)))
+    finally:
+        connection.close()
+
+
+def run_stage(stage, *args):
+    """Runs a stage in a fresh process, returns its output file name, elapsed seconds, peak RSS and details"""
+    context = multiprocessing.get_context('spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_stage_process, args=(sender, stage, args))
+    process.start()
+    sender.close()
+    output_file_name, elapsed, peak_rss, details, error = receiver.recv()
+    process.join()
+    if error:
+        raise RuntimeError('{} failed: {}'.format(stage, error))
+    return output_file_name, elapsed, peak_rss, details
+
+
+def _stage_result(stage, number_of_rows, input_bytes, elapsed, peak_rss, details):
+    result = {
+        'stage': stage,
+        'seconds': round(elapsed, 4),
+        'rows_per_second': round(number_of_rows / elapsed, 1) if elapsed else None,
+        'mb_per_second': round(input_bytes / elapsed / 1024 / 1024, 2) if elapsed else None,
+        'input_bytes': input_bytes,
+        'peak_rss_bytes': peak_rss
+    }
+    result.update(details)
+    return result
+
+
+def benchmark_dataset(directory, gnupg_home_dir, dataset, number_of_rows, workers, batch_size, compression):
+    data_file_name, type_file_name = generate_dataset(directory, dataset, number_of_rows)
+    stages = []
+
+    input_bytes = os.path.getsize(data_file_name)
+    jpl_file_name, elapsed, peak_rss, details = run_stage(
+        'csv2jpl', data_file_name, type_file_name, number_of_rows, workers, batch_size)
+    stages.append(_stage_result('csv2jpl', number_of_rows, input_bytes, elapsed, peak_rss, details))
+
+    # a data file with errors leaves no .jpl file to archive and encrypt
+    if jpl_file_name is not None:
+        input_bytes = os.path.getsize(jpl_file_name)
+        vad_file_name, elapsed, peak_rss, details = run_stage('jpl2vad', jpl_file_name, compression)
+        stages.append(_stage_result('jpl2vad', number_of_rows, input_bytes, elapsed, peak_rss, details))
+
+        input_bytes = os.path.getsize(vad_file_name)
+        ved_file_name, elapsed, peak_rss, details = run_stage('vad2ved', vad_file_name, gnupg_home_dir)
+        stages.append(_stage_result('vad2ved', number_of_rows, input_bytes, elapsed, peak_rss, details))
+        os.remove(ved_file_name)
+
+    os.remove(data_file_name)
+    os.remove(type_file_name)
+    return {'dataset': dataset, 'rows': number_of_rows, 'stages': stages}
+
+
+def compare_with_baseline(results, baseline):
+    """Returns the rows/s ratio of each stage that is also in the baseline, keyed by dataset, rows and stage"""
+    baseline_speeds = {(run['dataset'], run['rows'], stage['stage']): stage['rows_per_second']
+                       for run in baseline['runs'] for stage in run['stages']}
+    comparison = []
+    for run in results['runs']:
+        for stage in run['stages']:
+            baseline_speed = baseline_speeds.get((run['dataset'], run['rows'], stage['stage']))
+            if baseline_speed and stage['rows_per_second']:
+                comparison.append({
+                    'dataset': run['dataset'],
+                    'rows': run['rows'],
+                    'stage': stage['stage'],
+                    'ratio': round(stage['rows_per_second'] / baseline_speed, 3)
+                })
+    return comparison
+
+
+def _print_run(run):
+    for stage in run['stages']:
+        click.echo('{:<8} {:>9} {:<8} {:>12.1f} rows/s {:>9.2f} MB/s {:>8.1f} MB peak RSS'.format(
+            run['dataset'], run['rows'], stage['stage'], stage['rows_per_second'], stage['mb_per_second'],
+            stage['peak_rss_bytes'] / 1024 / 1024))
+
+
+@click.command(help=USAGE)
+@click.option('--rows', 'rows', multiple=True, type=click.IntRange(min=1),
+              help='number of data rows, can be repeated. Default is 10000')
+@click.option('--dataset', 'datasets', multiple=True, type=click.Choice(sorted(DATASETS)),
+              help='dataset shape, can be repeated. Default is all of them')
+@click.option('--workers', default=1, type=click.IntRange(min=1), help='--workers for the csv2jpl stage')
+@click.option('--batch-size', 'batch_size', default=0, type=click.IntRange(min=0),
+              help='--batch-size for the csv2jpl stage')
+@click.option('--compression', default=jpl2vad_converter.DEFAULT_CODEC,
+              type=click.Choice(jpl2vad_converter.COMPRESSION_CHOICES), help='--compression for the jpl2vad stage')
+@click.option('--output', 'output', default='bench_results.json', type=click.Path(dir_okay=False),
+              help='path of the JSON results file. Default is bench_results.json')
+@click.option('--baseline', 'baseline', default=None, type=click.File('r'),
+              help='JSON results file of an earlier run to compare against')
+def benchmark(rows, datasets, workers, batch_size, compression, output, baseline):
+    directory = tempfile.mkdtemp()
+    gnupg_home_dir = os.path.join(directory, 'gpghome')
+    os.mkdir(gnupg_home_dir, 0o700)
+    try:
+        create_keyring(gnupg_home_dir)
+        runs = []
+        for dataset in datasets or sorted(DATASETS):
+            for number_of_rows in rows or [10000]:
+                run = benchmark_dataset(directory, gnupg_home_dir, dataset, number_of_rows, workers, batch_size,
+                                        compression)
+                _print_run(run)
+                runs.append(run)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    results = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'options': {'workers': workers, 'batch_size': batch_size, 'compression': compression},
+        'runs': runs
+    }
+    if baseline:
+        results['baseline'] = compare_with_baseline(results, json.load(baseline))
+        for comparison in results['baseline']:
+            marker = '  <-- regression' if comparison['ratio'] < REGRESSION_RATIO else ''
+            click.echo('{dataset:<8} {rows:>9} {stage:<8} {ratio:>6.3f}x baseline'.format(**comparison) + marker)
+
+    with open(output, 'w') as output_file:
+        json.dump(results, output_file, indent=2)
+    click.echo('Results written to {}'.format(output))
+
+
+if __name__ == '__main__':
+    benchmark()